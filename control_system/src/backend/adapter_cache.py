@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class AdapterCache:
+    """
+    Keeps the LoRA adapters of a loaded base model, so a backend can switch
+    fine-tunes per request without reloading the base model.
+
+    Adapters are registered by name with a path and scale, and loaded on
+    first use. At most max_loaded adapters stay loaded; the least recently
+    used one is unloaded to make room.
+
+    Attributes:
+        max_loaded (int): Number of adapters kept loaded.
+        active (str): Name of the adapter in use, None for the base model or
+            UNKNOWN once the adapter in use is unloaded.
+
+    Methods:
+        register: Register an adapter by name.
+        get: Return a loaded adapter, loading it if needed.
+        names: Return the registered adapter names.
+        clear: Forget the loaded adapters, keeping the registrations.
+    """
+
+    # The adapters applied to the model must be reset before the next use
+    UNKNOWN = object()
+
+    def __init__(
+            self,
+            load: Callable[[str, float], Any],
+            unload: Optional[Callable[[Any], None]] = None,
+            max_loaded: int = 4
+    ):
+        """
+        Args:
+            load (callable): Loads an adapter from a path and scale.
+            unload (callable, optional): Frees a loaded adapter.
+            max_loaded (int, optional): Number of adapters kept loaded.
+        """
+
+        self.max_loaded = max_loaded
+        self.active = None
+        self._load = load
+        self._unload = unload
+        self._registered: Dict[str, Tuple[str, float]] = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(
+            self,
+            name: str,
+            path: str,
+            scale: float = 1.0
+    ) -> None:
+        """
+        Register an adapter by name. Re-registering a name unloads the
+        adapter it named.
+        """
+
+        with self._lock:
+            if self._registered.get(name) != (path, scale):
+                self._discard(name)
+            self._registered[name] = (path, scale)
+
+    def names(
+            self
+    ) -> List[str]:
+        with self._lock:
+            return list(self._registered)
+
+    def _discard(
+            self,
+            name: str
+    ) -> None:
+        adapter = self._loaded.pop(name, None)
+        if adapter is not None and self._unload is not None:
+            self._unload(adapter)
+        if self.active == name:
+            self.active = self.UNKNOWN
+
+    def get(
+            self,
+            name: str
+    ) -> Any:
+        """
+        Return a loaded adapter, loading it if needed.
+
+        Args:
+            name (str): A registered name, or the path of an adapter file.
+                Paths are for trusted callers only, the inference server
+                accepts registered names.
+
+        Returns:
+            The loaded adapter.
+        """
+
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name]
+
+            path, scale = self._registered.get(name, (name, 1.0))
+            logger.log("INFO", f"Loading adapter {name} from {path}.")
+            adapter = self._load(path, scale)
+            self._loaded[name] = adapter
+
+            while len(self._loaded) > self.max_loaded:
+                evicted = next(
+                        (loaded for loaded in self._loaded
+                         if loaded != self.active and loaded != name),
+                        None
+                )
+                if evicted is None:
+                    break
+                self._discard(evicted)
+            return adapter
+
+    def clear(
+            self
+    ) -> None:
+        """
+        Forget the loaded adapters, as when the base model is reloaded. The
+        registrations are kept.
+        """
+
+        with self._lock:
+            self._loaded.clear()
+            self.active = None
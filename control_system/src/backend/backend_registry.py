@@ -0,0 +1,103 @@
+import functools
+import importlib
+from typing import Any, Dict, Type
+
+from .llamacpp.llamacpp_parameters import (
+    LlamaCPPModelParameters,
+    LlamaCPPCompletionParameters
+)
+from .network.network_parameters import (
+    NetworkModelParameters,
+    NetworkCompletionParameters
+)
+from .transformers.mamba_parameters import (
+    MambaModelParameters,
+    MambaGenerationParameters
+)
+
+
+# Backend classes are referenced by import path so that a backend module, and
+# heavy dependencies such as torch, transformers and llama_cpp, are only
+# imported once set_backend selects it. Parameter groups are plain
+# dataclasses and are cheap to import eagerly.
+BACKENDS: Dict[str, Dict[str, Any]] = {
+        "network"     : {
+                "backend"          : ".network.network_backend.NetworkBackend",
+                "model_parameters" : NetworkModelParameters,
+                "generation_method": {
+                        "generate_completion": NetworkCompletionParameters,
+                },
+        },
+        "llamacpp"    : {
+                "backend"          : ".llamacpp.llamacpp_backend.LlamaCPPBackend",
+                "model_parameters" : LlamaCPPModelParameters,
+                "generation_method": {
+                        "generate_chat_completion":
+                            LlamaCPPCompletionParameters,
+                        "generate_completion"     : LlamaCPPCompletionParameters,
+                },
+        },
+        "transformers": {
+                "backend"          :
+                    ".transformers.transformers_backend.TransformerBackend",
+                "model_parameters" : MambaModelParameters,
+                "generation_method": {
+                        "generate": MambaGenerationParameters,
+                }
+        },
+}
+
+# Generation methods that take chat messages and apply the model's own chat
+# template, rather than a prompt string.
+CHAT_GENERATION_METHODS = frozenset({
+        "generate_chat_completion",
+        "generate",
+})
+
+# Backend methods that stream the response of a generation method as text
+# chunks.
+STREAMING_METHODS = {
+        "generate_completion"     : "stream_completion",
+        "generate_chat_completion": "stream_chat_completion",
+}
+
+# Backend methods that run a generation method on a list of prompts at once.
+BATCH_METHODS = {
+        "generate": "generate_batch",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def import_backend(
+        backend_path: str
+        ) -> Type:
+    """
+    Imports a backend class from its path.
+
+    Args:
+        backend_path (str): Module path relative to the backend package,
+            followed by the class name.
+
+    Returns:
+        Type: The backend class.
+    """
+
+    module_path, class_name = backend_path.rsplit(".", 1)
+    module = importlib.import_module(module_path, package=__package__)
+    return getattr(module, class_name)
+
+
+def load_backend_class(
+        selected_type: str
+        ) -> Type:
+    """
+    Returns the backend class for a backend type, importing it on first use.
+
+    Args:
+        selected_type (str): Backend type (a key of BACKENDS).
+
+    Returns:
+        Type: The backend class.
+    """
+
+    return import_backend(BACKENDS[selected_type]["backend"])
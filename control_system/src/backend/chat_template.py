@@ -0,0 +1,85 @@
+import functools
+from dataclasses import dataclass
+from typing import Dict, List
+
+
+def _raise_exception(
+        message: str
+):
+    """
+    Lets a template reject messages it cannot format, as Hugging Face
+    templates do for roles that do not alternate.
+    """
+
+    from jinja2.exceptions import TemplateError
+
+    raise TemplateError(message)
+
+
+@functools.lru_cache(maxsize=16)
+def compile_template(
+        template: str
+):
+    """
+    Compiles a Jinja chat template. Compiled templates are cached, so each
+    template is only compiled once.
+
+    Args:
+        template (str): The Jinja template source.
+
+    Returns:
+        jinja2.Template: The compiled template.
+    """
+
+    from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+    environment = ImmutableSandboxedEnvironment(
+            trim_blocks=True, lstrip_blocks=True
+    )
+    environment.globals["raise_exception"] = _raise_exception
+    return environment.from_string(template)
+
+
+@dataclass(frozen=True)
+class ChatTemplate:
+    """
+    Renders a list of chat messages to a prompt with the model's own Jinja
+    chat template, read from its GGUF metadata or its Hugging Face
+    tokenizer, see ModelHandler.chat_template.
+
+    Attributes:
+        template (str): The Jinja template source.
+        bos_token (str): Beginning-of-sequence token.
+        eos_token (str): End-of-sequence token.
+
+    Methods:
+        render: Renders messages to a prompt.
+    """
+
+    template: str
+    bos_token: str = ""
+    eos_token: str = ""
+
+    def render(
+            self,
+            messages: List[Dict[str, str]],
+            add_generation_prompt: bool = True
+    ) -> str:
+        """
+        Renders messages to a prompt.
+
+        Args:
+            messages (list): Messages with "role" and "content" keys.
+            add_generation_prompt (bool): Whether to end with the cue for the
+                assistant's reply.
+
+        Returns:
+            str: The rendered prompt.
+        """
+
+        return compile_template(self.template).render(
+                messages=messages,
+                add_generation_prompt=add_generation_prompt,
+                bos_token=self.bos_token,
+                eos_token=self.eos_token
+        )
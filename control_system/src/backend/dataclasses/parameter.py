@@ -14,6 +14,8 @@ class Parameter:
         default_value (Any): The default value of the Parameter.
         description (str): A description of the Parameter.
         value (Any): The value of the Parameter.
+        runtime_adjustable (bool): Whether a change can be applied to a
+            loaded model, rather than needing the model to be reloaded.
 
     Methods:
         __hash__ : int
@@ -29,6 +31,7 @@ class Parameter:
     default_value: Any
     description: str
     value: Any = field(default_factory=lambda: None)  # Mutable attribute
+    runtime_adjustable: bool = False
 
     def update_value(
             self,
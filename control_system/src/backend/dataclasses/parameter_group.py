@@ -1,7 +1,8 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, FrozenSet, List
 
 from dataclasses import dataclass
 from .parameter import Parameter
+from .parameter_snapshot import ParameterSnapshot
 
 
 @dataclass
@@ -11,13 +12,24 @@ class ParameterGroup:
 
     Methods:
         update_parameter: Updates the value of a parameter.
+        get_parameter_fields: Returns a list of parameter properties.
         get_parameters: Returns a dictionary of parameters.
+        snapshot: Returns an immutable snapshot of the parameter values.
+        invalidate_snapshot: Discards the cached snapshot.
+        runtime_adjustable_keys: Returns the keys of the parameters that can
+            be changed on a loaded model.
     """
 
     group_name = str
     group_type: str
     description: str
 
+    def __post_init__(
+            self
+            ):
+        # Snapshot of the parameter values, built on first use
+        self._snapshot = None
+
     def update_parameter(
             self,
             parameter_name: str,
@@ -35,6 +47,7 @@ class ParameterGroup:
             parameter = getattr(self, parameter_name)
             if isinstance(parameter, Parameter):
                 parameter.update_value(parameter_value)
+                self.invalidate_snapshot()
             else:
                 raise ValueError(
                         f'{parameter_name} is not a Parameter object.'
@@ -75,3 +88,69 @@ class ParameterGroup:
                     )
 
         return result_list
+
+    def get_parameters(
+            self
+            ) -> Dict[str, Any]:
+        """
+        Returns a dictionary of parameter keys and values, falling back to
+        the default value for parameters that have not been set.
+
+        Returns:
+            A dictionary of parameter keys and values.
+        """
+
+        return self.snapshot().to_dict()
+
+    def snapshot(
+            self
+            ) -> ParameterSnapshot:
+        """
+        Returns an immutable snapshot of the parameter values. The snapshot
+        is built once and reused until a parameter is updated.
+
+        Returns:
+            The parameter snapshot.
+        """
+
+        snapshot = self._snapshot
+        if snapshot is None:
+            parameter_dict = {}
+            for parameter in self.get_parameter_fields(
+                    "key", "value", "default_value"
+            ):
+                parameter_dict[parameter["key"]] = \
+                    parameter["value"] if parameter["value"] is not None else \
+                        parameter["default_value"]
+
+            snapshot = ParameterSnapshot(
+                    self.group_name, self.group_type, parameter_dict
+            )
+            self._snapshot = snapshot
+
+        return snapshot
+
+    def invalidate_snapshot(
+            self
+            ) -> None:
+        """
+        Discards the cached snapshot, for parameter values changed without
+        update_parameter.
+        """
+
+        self._snapshot = None
+
+    def runtime_adjustable_keys(
+            self
+            ) -> FrozenSet[str]:
+        """
+        Returns the keys of the parameters whose changes can be applied to a
+        loaded model. Changes to any other parameter need a reload.
+        """
+
+        return frozenset(
+                parameter["key"] for parameter in self.get_parameter_fields(
+                        "key", "runtime_adjustable"
+                )
+                if parameter["runtime_adjustable"]
+        )
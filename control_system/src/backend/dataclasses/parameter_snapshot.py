@@ -0,0 +1,117 @@
+from types import MappingProxyType
+from typing import Any, Dict, Mapping
+
+
+def _freeze(
+        value: Any
+        ) -> Any:
+    """
+    Returns a hashable equivalent of a parameter value.
+    """
+
+    if isinstance(value, dict):
+        return frozenset((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+class ParameterSnapshot:
+    """
+    An immutable, hashable snapshot of the values of a ParameterGroup.
+
+    A snapshot is built once per parameter change, so requests can reuse
+    its precomputed keyword arguments, and its hash can be used as a cache
+    key for models and responses.
+
+    Attributes:
+        group_name (str): The name of the parameter group.
+        group_type (str): The type of the parameter group.
+        kwargs (Mapping[str, Any]): Read-only parameter keys and values.
+
+    Methods:
+        to_dict: Returns a mutable copy of the keyword arguments.
+        with_overrides: Returns a snapshot with some values replaced.
+    """
+
+    __slots__ = ("group_name", "group_type", "kwargs", "_key", "_hash")
+
+    def __init__(
+            self,
+            group_name: str,
+            group_type: str,
+            parameters: Mapping[str, Any]
+            ):
+        key = (group_name, group_type,
+               tuple((name, _freeze(value))
+                     for name, value in parameters.items()))
+
+        object.__setattr__(self, "group_name", group_name)
+        object.__setattr__(self, "group_type", group_type)
+        object.__setattr__(self, "kwargs", MappingProxyType(dict(parameters)))
+        object.__setattr__(self, "_key", key)
+        object.__setattr__(self, "_hash", hash(key))
+
+    def __setattr__(
+            self,
+            name: str,
+            value: Any
+            ):
+        raise AttributeError("ParameterSnapshot is immutable.")
+
+    def __delattr__(
+            self,
+            name: str
+            ):
+        raise AttributeError("ParameterSnapshot is immutable.")
+
+    def __hash__(
+            self
+            ) -> int:
+        return self._hash
+
+    def __eq__(
+            self,
+            other: Any
+            ) -> bool:
+        if not isinstance(other, ParameterSnapshot):
+            return NotImplemented
+        return self._hash == other._hash and self._key == other._key
+
+    def __repr__(
+            self
+            ) -> str:
+        return (f"ParameterSnapshot({self.group_name!r}, "
+                f"{self.group_type!r}, {dict(self.kwargs)!r})")
+
+    def to_dict(
+            self
+            ) -> Dict[str, Any]:
+        """Returns a mutable copy of the keyword arguments."""
+
+        return dict(self.kwargs)
+
+    def with_overrides(
+            self,
+            overrides: Mapping[str, Any]
+            ) -> 'ParameterSnapshot':
+        """
+        Returns a snapshot with some values replaced.
+
+        Args:
+            overrides: The parameter keys and values to replace.
+        """
+
+        if not overrides:
+            return self
+        return ParameterSnapshot(
+                self.group_name,
+                self.group_type,
+                {**self.kwargs, **overrides}
+        )
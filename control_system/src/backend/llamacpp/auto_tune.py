@@ -0,0 +1,290 @@
+import gc
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+from utils.host_topology import HostTopology, host_topology
+from utils.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+def gpu_offload_supported() -> bool:
+    """
+    Returns whether llama_cpp was built with GPU offload.
+    """
+
+    import llama_cpp
+
+    supported = getattr(llama_cpp, "llama_supports_gpu_offload", None)
+    return bool(supported and supported())
+
+
+@dataclass
+class TuningResult:
+    """
+    The speed of a model with one configuration.
+
+    Attributes:
+        parameters (dict): The tuned model parameters.
+        prefill_tokens_per_second (float): Prompt processing speed.
+        decode_tokens_per_second (float): Generation speed.
+        seconds (float): Time of the reference prompt and generation.
+    """
+
+    parameters: Dict[str, Any]
+    prefill_tokens_per_second: float
+    decode_tokens_per_second: float
+    seconds: float
+
+    def to_dict(
+            self
+            ) -> Dict[str, Any]:
+        return {
+                "parameters"               : dict(self.parameters),
+                "prefill_tokens_per_second": self.prefill_tokens_per_second,
+                "decode_tokens_per_second" : self.decode_tokens_per_second,
+                "seconds"                  : self.seconds,
+        }
+
+
+class AutoTuner:
+    """
+    Finds the fastest n_threads, n_threads_batch, n_batch and n_gpu_layers
+    for a model on this host, with short prefill and decode benchmarks.
+
+    The model is loaded once per n_batch and n_gpu_layers setting. Thread
+    counts are runtime-adjustable, so they are varied on the loaded model:
+    prompt processing runs on n_threads_batch threads and generation on
+    n_threads, so each is measured on its own. Thread counts are taken from
+    the host topology: the physical cores, the physical cores of one NUMA
+    node, half of them, and the logical CPUs when cores have hyper-threads.
+
+    Attributes:
+        backend: The llama.cpp backend to load the model with.
+        model_parameters (dict): The model parameters to tune from.
+        topology (HostTopology): The CPUs of the host.
+        prompt_tokens (int): Tokens of the benchmark prompt.
+        decode_tokens (int): Tokens generated after the prompt.
+        repeat (int): Runs of each measurement, the fastest is kept.
+
+    Methods:
+        thread_counts: Returns the generation thread counts to try.
+        batch_thread_counts: Returns the prompt thread counts to try.
+        load_configurations: Returns the load-time settings to try.
+        run: Benchmarks every setting, fastest first.
+        report: Formats results as a table.
+    """
+
+    PROMPT = "The quick brown fox jumps over the lazy dog. "
+
+    def __init__(
+            self,
+            backend,
+            model_parameters: Mapping[str, Any],
+            topology: Optional[HostTopology] = None,
+            prompt_tokens: int = 256,
+            decode_tokens: int = 32,
+            repeat: int = 2,
+            batch_sizes: Sequence[int] = (256, 512, 1024),
+            gpu_layers: Optional[Sequence[int]] = None,
+            clock: Callable[[], float] = time.perf_counter
+            ):
+        """
+        Args:
+            backend: The llama.cpp backend to load the model with.
+            model_parameters (Mapping): The model parameters to tune from.
+            topology (HostTopology, optional): Defaults to this host.
+            prompt_tokens (int, optional): Tokens of the benchmark prompt.
+            decode_tokens (int, optional): Tokens generated after it.
+            repeat (int, optional): Runs of each measurement.
+            batch_sizes (Sequence[int], optional): n_batch values to try.
+            gpu_layers (Sequence[int], optional): n_gpu_layers values to
+                try, defaults to none and all when llama_cpp can offload.
+            clock (callable, optional): Clock for the measurements.
+        """
+
+        self.backend = backend
+        self.model_parameters = dict(model_parameters)
+        self.topology = topology or host_topology()
+        self.prompt_tokens = prompt_tokens
+        self.decode_tokens = decode_tokens
+        self.repeat = repeat
+        self.batch_sizes = tuple(batch_sizes)
+        self.gpu_layers = tuple(gpu_layers) if gpu_layers is not None else \
+            None
+        self._clock = clock
+
+    def thread_counts(
+            self
+            ) -> List[int]:
+        physical = len(self.topology.physical_cores())
+        counts = {physical, max(physical // 2, 1)}
+        counts.update(
+                len(self.topology.physical_cores(node))
+                for node in range(len(self.topology.nodes))
+        )
+        logical = len(self.topology.logical_cpus())
+        if logical > physical:
+            counts.add(logical)
+        return sorted(counts)
+
+    def batch_thread_counts(
+            self
+            ) -> List[int]:
+        return sorted({
+                len(self.topology.physical_cores()),
+                len(self.topology.logical_cpus()),
+        })
+
+    def load_configurations(
+            self
+            ) -> List[Dict[str, int]]:
+        gpu_layers = self.gpu_layers
+        if gpu_layers is None:
+            gpu_layers = (0, -1) if gpu_offload_supported() else (0,)
+        return [
+                {"n_batch": n_batch, "n_gpu_layers": n_gpu_layers}
+                for n_gpu_layers in gpu_layers
+                for n_batch in self.batch_sizes
+        ]
+
+    def _prompt(
+            self
+            ) -> List[int]:
+        model = self.backend.model
+        text = self.PROMPT * self.prompt_tokens
+        return model.tokenize(text.encode("utf-8"))[:self.prompt_tokens]
+
+    def _prefill(
+            self,
+            tokens: List[int]
+            ) -> float:
+        model = self.backend.model
+        model.reset()
+        start = self._clock()
+        model.eval(tokens)
+        return self._clock() - start
+
+    def _decode(
+            self,
+            tokens: List[int]
+            ) -> float:
+        model = self.backend.model
+        start = self._clock()
+        for i in range(self.decode_tokens):
+            model.eval([tokens[i % len(tokens)]])
+        return self._clock() - start
+
+    def _fastest(
+            self,
+            counts: List[int],
+            measure: Callable[[int], float]
+            ):
+        timings = {
+                count: min(measure(count) for _ in range(self.repeat))
+                for count in counts
+        }
+        best = min(timings, key=timings.get)
+        return best, timings[best]
+
+    def _tune_threads(
+            self,
+            load_configuration: Dict[str, int]
+            ) -> TuningResult:
+        tokens = self._prompt()
+        physical = len(self.topology.physical_cores())
+
+        def measure_prefill(n_threads_batch):
+            self.backend.apply_runtime_parameters({
+                    "n_threads": physical, "n_threads_batch": n_threads_batch
+            })
+            return self._prefill(tokens)
+
+        n_threads_batch, prefill_seconds = self._fastest(
+                self.batch_thread_counts(), measure_prefill
+        )
+
+        def measure_decode(n_threads):
+            self.backend.apply_runtime_parameters({
+                    "n_threads": n_threads, "n_threads_batch": n_threads_batch
+            })
+            self._prefill(tokens)
+            return self._decode(tokens)
+
+        n_threads, decode_seconds = self._fastest(
+                self.thread_counts(), measure_decode
+        )
+
+        return TuningResult(
+                parameters={
+                        "n_threads"      : n_threads,
+                        "n_threads_batch": n_threads_batch,
+                        **load_configuration
+                },
+                prefill_tokens_per_second=len(tokens) / prefill_seconds,
+                decode_tokens_per_second=self.decode_tokens / decode_seconds,
+                seconds=prefill_seconds + decode_seconds
+        )
+
+    def run(
+            self
+            ) -> List[TuningResult]:
+        """
+        Benchmarks every load configuration with its fastest thread counts.
+        Configurations that fail to load, such as offloading more layers
+        than fit in GPU memory, are skipped.
+
+        Returns:
+            list[TuningResult]: The results, fastest first.
+        """
+
+        n_ctx = max(
+                self.model_parameters.get("n_ctx") or 0,
+                self.prompt_tokens + self.decode_tokens + 8
+        )
+        results = []
+        for load_configuration in self.load_configurations():
+            parameters = {
+                    **self.model_parameters, **load_configuration,
+                    "n_ctx": n_ctx
+            }
+            try:
+                self.backend.load_model(parameters)
+                results.append(self._tune_threads(load_configuration))
+                logger.log(
+                        "INFO", f"Tuned {load_configuration}: {results[-1]}"
+                )
+            except (RuntimeError, ValueError, OSError) as e:
+                logger.log(
+                        "WARNING",
+                        f"Skipping {load_configuration}, it failed: {e}"
+                )
+            finally:
+                self.backend.model = None
+                gc.collect()
+
+        return sorted(results, key=lambda result: result.seconds)
+
+    @staticmethod
+    def report(
+            results: List[TuningResult]
+            ) -> str:
+        lines = [
+                f"{'n_threads':>9} {'batch_thr':>9} {'n_batch':>7} "
+                f"{'gpu_lyrs':>8} {'prefill/s':>10} {'decode/s':>9} "
+                f"{'seconds':>8}"
+        ]
+        for result in results:
+            parameters = result.parameters
+            lines.append(
+                    f"{parameters['n_threads']:>9} "
+                    f"{parameters['n_threads_batch']:>9} "
+                    f"{parameters['n_batch']:>7} "
+                    f"{parameters['n_gpu_layers']:>8} "
+                    f"{result.prefill_tokens_per_second:>10.1f} "
+                    f"{result.decode_tokens_per_second:>9.1f} "
+                    f"{result.seconds:>8.3f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple, Union
+
+from utils.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+Grammar = Union[str, dict]
+
+
+def grammar_source(
+        grammar: Grammar
+        ) -> Tuple[str, str]:
+    """
+    Returns the kind of a grammar, "gbnf" or "json_schema", and its text.
+
+    A dict, or a string holding a JSON object, is a JSON Schema. Any other
+    string is GBNF.
+    """
+
+    if isinstance(grammar, dict):
+        return "json_schema", json.dumps(grammar, sort_keys=True)
+
+    stripped = grammar.strip()
+    if stripped.startswith("{"):
+        try:
+            schema = json.loads(stripped)
+        except ValueError:
+            pass
+        else:
+            if isinstance(schema, dict):
+                return "json_schema", json.dumps(schema, sort_keys=True)
+    return "gbnf", grammar
+
+
+def compile_grammar(
+        kind: str,
+        text: str
+        ) -> Any:
+    """
+    Compiles GBNF or a JSON Schema to a llama_cpp LlamaGrammar.
+    """
+
+    from llama_cpp import LlamaGrammar
+
+    if kind == "json_schema":
+        return LlamaGrammar.from_json_schema(text, verbose=False)
+    return LlamaGrammar.from_string(text, verbose=False)
+
+
+class GrammarCache:
+    """
+    An LRU cache of compiled grammars for constrained generation, keyed by
+    a hash of the grammar text.
+
+    Compiling a grammar, and converting a JSON Schema to GBNF before that,
+    takes time that grows with its size, so each distinct grammar is
+    compiled once. JSON Schemas are keyed by their canonical JSON, so
+    schemas that differ only in key order share an entry.
+
+    Attributes:
+        maxsize (int): Number of compiled grammars kept.
+        hits (int): Lookups served from the cache.
+        misses (int): Lookups that compiled a grammar.
+
+    Methods:
+        get: Return the compiled grammar, compiling it on a miss.
+        clear: Drop every compiled grammar.
+    """
+
+    def __init__(
+            self,
+            maxsize: int = 16,
+            compiler: Optional[Callable[[str, str], Any]] = None
+            ):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._compiler = compiler or compile_grammar
+        self._grammars = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(
+            self
+            ) -> int:
+        return len(self._grammars)
+
+    def get(
+            self,
+            grammar: Grammar
+            ) -> Any:
+        """
+        Return the compiled grammar, compiling it on a miss.
+
+        Args:
+            grammar (str | dict): GBNF text, or a JSON Schema as a dict or
+                JSON text.
+
+        Returns:
+            LlamaGrammar: The compiled grammar.
+        """
+
+        kind, text = grammar_source(grammar)
+        key = hashlib.sha256(f"{kind}\0{text}".encode()).digest()
+
+        with self._lock:
+            compiled = self._grammars.get(key)
+            if compiled is not None:
+                self._grammars.move_to_end(key)
+                self.hits += 1
+                return compiled
+
+        # Compiled outside the lock, so other grammars are not held up. Two
+        # threads missing on the same grammar both compile it.
+        compiled = self._compiler(kind, text)
+        logger.log("INFO", f"Compiled {kind} grammar ({len(text)} chars).")
+
+        with self._lock:
+            self.misses += 1
+            self._grammars[key] = compiled
+            self._grammars.move_to_end(key)
+            while len(self._grammars) > self.maxsize:
+                self._grammars.popitem(last=False)
+        return compiled
+
+    def clear(
+            self
+            ) -> None:
+        with self._lock:
+            self._grammars.clear()
+
+
+# Shared by all llama.cpp backends
+grammar_cache = GrammarCache()
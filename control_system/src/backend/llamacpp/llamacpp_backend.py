@@ -1,7 +1,54 @@
 import functools
+import inspect
+import os
+from types import MappingProxyType
+from typing import Any, Mapping
 
 import llama_cpp
 
+from utils.logger import Logger
+
+from ..adapter_cache import AdapterCache
+from ..dataclasses.parameter_snapshot import ParameterSnapshot
+from .grammar_cache import grammar_cache
+
+
+logger = Logger(__name__)
+
+
+@functools.lru_cache(maxsize=1)
+def llama_enums() -> Mapping[str, int]:
+    """
+    Returns a frozen table of the LLAMA_* integer constants of llama_cpp,
+    built on first use.
+    """
+
+    return MappingProxyType({
+            name: value for name, value in vars(llama_cpp).items()
+            if name.startswith("LLAMA_") and isinstance(value, int)
+    })
+
+
+def _llama_function(
+        *names: str
+        ) -> Any:
+    """
+    Returns the first llama_cpp function of the given names, as the LoRA
+    adapter functions were renamed between llama_cpp releases.
+
+    Raises:
+        RuntimeError: If the installed llama_cpp has none of them.
+    """
+
+    for name in names:
+        function = getattr(llama_cpp, name, None)
+        if function is not None:
+            return function
+    raise RuntimeError(
+            f"The installed llama_cpp has no LoRA adapter API: none of "
+            f"{', '.join(names)}."
+    )
+
 
 class LlamaCPPBackend():
 
@@ -12,90 +59,261 @@ class LlamaCPPBackend():
            Initializes the backend.
         """
         self.model = None
+        # LoRA adapters are loaded onto the base model and switched per
+        # request, see register_adapter
+        self.adapters = AdapterCache(self._load_adapter, self._free_adapter)
 
     @staticmethod
-    def replace_enums(
-            func
-            ):
+    @functools.lru_cache(maxsize=32)
+    def prepare_parameters(
+            snapshot: ParameterSnapshot
+            ) -> Mapping[str, Any]:
         """
-        Decorator to replace enum names with values in function arguments.
+        Resolves enum names, such as "LLAMA_SPLIT_LAYER", to their llama_cpp
+        values, and compiles a GBNF or JSON Schema grammar through the
+        grammar cache. The result is cached per snapshot, so parameters are
+        resolved once per change rather than on every call.
 
         Args:
-            func: The function to decorate.
+            snapshot: The parameter snapshot.
 
         Returns:
-            The decorated function.
+            Read-only parameters, ready to pass to llama_cpp.
         """
 
-        @functools.wraps(func)
-        def wrapper(
-                *args,
-                **kwargs
-                ):
-            """
-            A decorator that replaces enum names with values in function
-            arguments.
+        enums = llama_enums()
+        parameters = {}
+        for key, value in snapshot.kwargs.items():
+            if isinstance(value, str) and value.startswith("LLAMA_"):
+                if value in enums:
+                    value = enums[value]
+                else:
+                    logger.log("WARNING", f"Invalid enum name: {value}")
+            elif key == "grammar" and isinstance(value, (str, dict)):
+                value = grammar_cache.get(value)
+            parameters[key] = value
 
-            Args:
-                func: The function to decorate.
+        return MappingProxyType(parameters)
 
-            Returns:
-                The decorated function.
-            """
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def threads_inherit_affinity() -> bool:
+        """
+           Whether llama.cpp starts its compute threads from the calling
+           thread, so they inherit its CPU affinity. Builds with OpenMP
+           share one thread pool across the process instead.
+        """
+        info = llama_cpp.llama_print_system_info()
+        if isinstance(info, bytes):
+            info = info.decode("utf-8", "replace")
+        return "OPENMP = 1" not in info
+
+    def load_model(
+            self,
+            model_parameters
+            ):
+        """
+           Loads the model.
 
-            # Replace enums in kwargs
-            LlamaCPPBackend._replace_enums_in_dict(kwargs)
+           Args:
+               model_parameters: The parameters for the model.
+        """
+        model_parameters = dict(model_parameters)
 
-            # Replace enums in args if they are dict
-            args = list(args)
-            for i, arg in enumerate(args):
-                if isinstance(arg, dict):
-                    LlamaCPPBackend._replace_enums_in_dict(arg)
-                    args[i] = arg
+        # An empty chat_format uses the chat template embedded in the model
+        if not model_parameters.get("chat_format"):
+            model_parameters.pop("chat_format", None)
 
-            return func(*tuple(args), **kwargs)
+        # A NUMA mode name, such as "distribute", to its ggml strategy.
+        # "auto" leaves ggml NUMA disabled, as the ModelHandler places
+        # models with CPU affinity instead
+        numa = model_parameters.get("numa")
+        if isinstance(numa, str):
+            model_parameters["numa"] = getattr(
+                    llama_cpp, f"GGML_NUMA_STRATEGY_{numa.upper()}",
+                    llama_cpp.GGML_NUMA_STRATEGY_DISABLED
+            )
 
-        return wrapper
+        self.model = llama_cpp.Llama(**model_parameters)
+        # Adapters belong to the model they were loaded onto
+        self.adapters.clear()
 
-    @classmethod
-    def _replace_enums_in_dict(
-            cls,
-            dictionary
+    def apply_runtime_parameters(
+            self,
+            model_parameters
             ):
         """
-        Replaces enum names with values in a dictionary.
+           Applies runtime-adjustable model parameters to the loaded model,
+           without reloading it.
 
-        Args:
-            dictionary: The dictionary to replace enums in.
+           Args:
+               model_parameters: The changed parameters, see the
+                   runtime_adjustable parameters of LlamaCPPModelParameters.
+        """
+        if "n_threads" in model_parameters or \
+                "n_threads_batch" in model_parameters:
+            # 0 falls back to the llama_cpp.Llama defaults, counted over
+            # the CPUs this thread may run on, which are those of the NUMA
+            # node of a placed model
+            if hasattr(os, "sched_getaffinity"):
+                cpu_count = len(os.sched_getaffinity(0))
+            else:
+                cpu_count = os.cpu_count() or 1
+            n_threads = model_parameters.get(
+                    "n_threads", self.model.n_threads
+            ) or max(cpu_count // 2, 1)
+            n_threads_batch = model_parameters.get(
+                    "n_threads_batch", self.model.n_threads_batch
+            ) or cpu_count
 
-        Returns:
-            The dictionary with replaced enums.
+            llama_cpp.llama_set_n_threads(
+                    self.model.ctx, n_threads, n_threads_batch
+            )
+            self.model.n_threads = n_threads
+            self.model.n_threads_batch = n_threads_batch
+            self.model.context_params.n_threads = n_threads
+            self.model.context_params.n_threads_batch = n_threads_batch
+
+        if "verbose" in model_parameters:
+            self.model.verbose = model_parameters["verbose"]
+
+    def register_adapter(
+            self,
+            name: str,
+            path: str,
+            scale: float = 1.0
+            ):
         """
+           Registers a LoRA adapter of the base model, selected per request
+           with the adapter generation parameter. It is loaded on first use.
 
-        for key, value in dictionary.items():
-            if isinstance(value, str) and value.startswith("LLAMA_"):
-                try:
-                    dictionary[key] = getattr(llama_cpp, value)
-                except AttributeError:
-                    print(f"Invalid enum name: {value}")
+           Args:
+               name: The adapter name.
+               path: Path of the GGUF adapter file.
+               scale: Strength of the adapter.
+        """
+        self.adapters.register(name, path, scale)
 
-    def load_model(
+    def _load_adapter(
             self,
-            model_parameters
+            path: str,
+            scale: float
             ):
+        init = _llama_function(
+                "llama_adapter_lora_init", "llama_lora_adapter_init"
+        )
+        adapter = init(self.model.model, path.encode("utf-8"))
+        if not adapter:
+            raise ValueError(f"Failed to load LoRA adapter {path}.")
+        return adapter, scale
+
+    @staticmethod
+    def _free_adapter(
+            loaded
+            ):
+        # Newer llama_cpp releases free adapters with the model
+        free = getattr(llama_cpp, "llama_adapter_lora_free", None) or \
+            getattr(llama_cpp, "llama_lora_adapter_free", None)
+        if free is not None:
+            free(loaded[0])
+
+    def _use_adapter(
+            self,
+            generation_parameters: Mapping[str, Any]
+            ) -> dict:
         """
-           Loads the model.
+           Applies the adapter named by the generation parameters to the
+           context, if it is not applied already.
+
+           Returns:
+               dict: The generation parameters without the adapter.
+        """
+        parameters = dict(generation_parameters)
+        name = parameters.pop("adapter", None) or None
+        if name == self.adapters.active:
+            return parameters
+
+        context = self.model.ctx
+        _llama_function(
+                "llama_clear_adapter_lora", "llama_lora_adapter_clear"
+        )(context)
+        if name is not None:
+            adapter, scale = self.adapters.get(name)
+            _llama_function(
+                    "llama_set_adapter_lora", "llama_lora_adapter_set"
+            )(context, adapter, scale)
+        # The cached prompt was evaluated with the previous adapter
+        self.model.reset()
+        self.adapters.active = name
+        return parameters
+
+    def count_tokens(
+            self,
+            text: str
+            ) -> int:
+        """
+           Counts the tokens of a text with the model's tokenizer.
 
            Args:
-               model_parameters: The parameters for the model.
+               text: The text to count.
         """
-        self.model = llama_cpp.Llama(**model_parameters)
+        return len(self.model.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def embed(
+            self,
+            texts: list[str]
+            ) -> list[list[float]]:
+        """
+           Embeds texts with a model loaded with embedding=True.
+
+           Args:
+               texts: The texts to embed.
+
+           Returns:
+               list[list[float]]: One pooled embedding per text.
+        """
+        return self.model.embed(texts)
+
+    def chat_template(
+            self
+            ):
+        """
+           Returns the chat template embedded in the GGUF file of the loaded
+           model, with its BOS and EOS tokens.
+
+           Returns:
+               tuple: (template, bos_token, eos_token), or None if the model
+               has no template.
+        """
+        template = self.model.metadata.get("tokenizer.chat_template")
+        if not template:
+            return None
+
+        def token_text(token):
+            if token < 0:
+                return ""
+            return self.model.detokenize([token], special=True).decode(
+                    "utf-8", "replace"
+            )
+
+        return (
+                template,
+                token_text(self.model.token_bos()),
+                token_text(self.model.token_eos())
+        )
+
+    def context_length(
+            self
+            ) -> int:
+        """
+           Returns the context length of the loaded model.
+        """
+        return self.model.n_ctx()
 
-    @replace_enums
     def generate_completion(
             self,
             messages: list[str],
-            generation_parameters: dict
+            generation_parameters: Mapping[str, Any]
     ):
         """
            Generates a response from the model.
@@ -108,5 +326,98 @@ class LlamaCPPBackend():
                str: The response from the model.
         """
 
-        data = self.model.create_completion(messages, **generation_parameters)
+        data = self.model.create_completion(
+                messages, **self._use_adapter(generation_parameters)
+        )
         return data["choices"][0]["text"]
+
+    def stream_completion(
+            self,
+            prompt: str,
+            generation_parameters: Mapping[str, Any]
+    ):
+        """
+           Generates a response from the model, yielding text as it is
+           produced.
+
+           Args:
+               prompt: The prompt.
+               generation_parameters: The parameters for the generation.
+
+           Yields:
+               str: The next piece of the response.
+        """
+
+        parameters = self._use_adapter(generation_parameters)
+        parameters["stream"] = True
+
+        for chunk in self.model.create_completion(prompt, **parameters):
+            yield chunk["choices"][0]["text"]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _chat_completion_arguments() -> frozenset:
+        """
+           Returns the keyword arguments accepted by create_chat_completion.
+        """
+        return frozenset(
+                inspect.signature(
+                        llama_cpp.Llama.create_chat_completion
+                ).parameters
+        )
+
+    def generate_chat_completion(
+            self,
+            messages: list[dict],
+            generation_parameters: Mapping[str, Any]
+    ):
+        """
+           Generates a response with the model's native chat template.
+
+           Args:
+               messages: The list of messages, with "role" and "content".
+               generation_parameters: The parameters for the generation.
+                   Completion-only parameters are left out.
+
+           Returns:
+               str: The response from the model.
+        """
+
+        accepted = self._chat_completion_arguments()
+        generation_parameters = self._use_adapter(generation_parameters)
+        data = self.model.create_chat_completion(
+                messages=messages,
+                **{key: value for key, value in generation_parameters.items()
+                   if key in accepted}
+        )
+        return data["choices"][0]["message"]["content"]
+
+    def stream_chat_completion(
+            self,
+            messages: list[dict],
+            generation_parameters: Mapping[str, Any]
+    ):
+        """
+           Generates a response with the model's native chat template,
+           yielding text as it is produced.
+
+           Args:
+               messages: The list of messages, with "role" and "content".
+               generation_parameters: The parameters for the generation.
+
+           Yields:
+               str: The next piece of the response.
+        """
+
+        accepted = self._chat_completion_arguments()
+        generation_parameters = self._use_adapter(generation_parameters)
+        parameters = {key: value for key, value in generation_parameters.items()
+                      if key in accepted}
+        parameters["stream"] = True
+
+        for chunk in self.model.create_chat_completion(
+                messages=messages, **parameters
+        ):
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                yield content
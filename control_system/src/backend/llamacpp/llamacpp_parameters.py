@@ -39,7 +39,7 @@ class LlamaCPPModelParameters(ParameterGroup):
         lora_base (Parameter): Optional path to base model for LoRA
         lora_path (Parameter): Optional Path to LoRA file to apply to model
         numa (Parameter):  Enable NUMA support. (NOTE: Initial value is used for the remainder of the program)
-        chat_format (Parameter):  Chat format for create_chat_completion
+        chat_format (Parameter):  Chat format for create_chat_completion (empty = the model's own template)
         chat_handler (Parameter): Optional chat handler for create_chat_completion
         verbose (Parameter):  Print verbose output to stderr
     """
@@ -151,16 +151,20 @@ class LlamaCPPModelParameters(ParameterGroup):
     n_threads: Parameter = field(
             default_factory=lambda: Parameter(
                     key="n_threads",
-                    default_value=None,
-                    description="Number of threads for generation"
+                    default_value=0,
+                    description="Number of threads for generation, 0 for "
+                                "automatic",
+                    runtime_adjustable=True
             )
     )
 
     n_threads_batch: Parameter = field(
             default_factory=lambda: Parameter(
                     key="n_threads_batch",
-                    default_value=None,
-                    description="Number of threads for batch processing"
+                    default_value=0,
+                    description="Number of threads for batch processing, 0 "
+                                "for automatic",
+                    runtime_adjustable=True
             )
     )
 
@@ -283,17 +287,23 @@ class LlamaCPPModelParameters(ParameterGroup):
     numa: Parameter = field(
             default_factory=lambda: Parameter(
                     key="numa",
-                    default_value=False,
-                    description="Enable NUMA support. (NOTE: Initial value is used "
-                                "for the remainder of the program)"
+                    default_value="auto",
+                    description="NUMA mode: auto places each model on its own "
+                                "node on multi-socket hosts and pins its "
+                                "threads there; or a ggml mode for the "
+                                "whole process: disabled, distribute, "
+                                "isolate, numactl or mirror. (NOTE: Initial "
+                                "ggml mode is used for the remainder of the "
+                                "program)"
             )
     )
 
     chat_format: Parameter = field(
             default_factory=lambda: Parameter(
                     key="chat_format",
-                    default_value='llama-2',
-                    description="Chat format for create_chat_completion"
+                    default_value='',
+                    description="Chat format for create_chat_completion "
+                                "(empty = the model's own template)"
             )
     )
 
@@ -309,7 +319,8 @@ class LlamaCPPModelParameters(ParameterGroup):
             default_factory=lambda: Parameter(
                     key="verbose",
                     default_value=True,
-                    description="Print verbose output to stderr"
+                    description="Print verbose output to stderr",
+                    runtime_adjustable=True
             )
     )
 
@@ -344,6 +355,7 @@ class LlamaCPPCompletionParameters(ParameterGroup):
         logits_processor (Parameter): Optional List of logits processors
         grammar (Parameter): Optional Grammar for constrained sampling
         logit_bias (Parameter): Optional A Logit bias to use
+        adapter (Parameter): Optional Name or path of the LoRA adapter to use
     """
 
     group_name: str = "Llama.CPP"
@@ -533,7 +545,8 @@ class LlamaCPPCompletionParameters(ParameterGroup):
             default_factory=lambda: Parameter(
                     key="grammar",
                     default_value=None,
-                    description="Grammar for constrained sampling"
+                    description="Grammar for constrained sampling, as GBNF "
+                                "or a JSON Schema"
             )
     )
 
@@ -544,3 +557,12 @@ class LlamaCPPCompletionParameters(ParameterGroup):
                     description="A Logit bias to use"
             )
     )
+
+    adapter: Parameter = field(
+            default_factory=lambda: Parameter(
+                    key="adapter",
+                    default_value=None,
+                    description="Name or path of the LoRA adapter to apply, "
+                                "none for the base model"
+            )
+    )
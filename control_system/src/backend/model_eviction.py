@@ -0,0 +1,256 @@
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class MemoryMonitor:
+    """
+    Reads process, system and CUDA memory usage.
+
+    Methods:
+        process_rss: Resident set size of this process.
+        system_memory: Total and available system memory.
+        cuda_memory: Free and total memory of the current CUDA device.
+        snapshot: All of the above in one dictionary.
+        under_pressure: Whether memory is running low.
+    """
+
+    def __init__(
+            self,
+            min_available_fraction: float = 0.1,
+            min_cuda_free_fraction: float = 0.1
+    ):
+        self.min_available_fraction = min_available_fraction
+        self.min_cuda_free_fraction = min_cuda_free_fraction
+
+    @staticmethod
+    def _read_kb_fields(
+            path: str,
+            *fields: str
+    ) -> Dict[str, int]:
+        values = {}
+        try:
+            with open(path, "r") as file:
+                for line in file:
+                    name, _, value = line.partition(":")
+                    if name in fields:
+                        values[name] = int(value.split()[0]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return values
+
+    def process_rss(
+            self
+    ) -> Optional[int]:
+        """
+        Returns the resident set size of this process in bytes.
+        """
+
+        return self._read_kb_fields("/proc/self/status", "VmRSS").get("VmRSS")
+
+    def system_memory(
+            self
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Returns (total, available) system memory in bytes.
+        """
+
+        values = self._read_kb_fields(
+                "/proc/meminfo", "MemTotal", "MemAvailable"
+        )
+        if len(values) != 2:
+            return None
+        return values["MemTotal"], values["MemAvailable"]
+
+    @staticmethod
+    def cuda_memory() -> Optional[Tuple[int, int]]:
+        """
+        Returns (free, total) memory of the current CUDA device in bytes.
+
+        torch is only consulted if a backend has already imported it.
+        """
+
+        torch = sys.modules.get("torch")
+        if torch is None or not torch.cuda.is_available():
+            return None
+        return torch.cuda.mem_get_info()
+
+    def snapshot(
+            self
+    ) -> Dict[str, Optional[int]]:
+        system_memory = self.system_memory() or (None, None)
+        cuda_memory = self.cuda_memory() or (None, None)
+        return {
+                "process_rss"     : self.process_rss(),
+                "system_total"    : system_memory[0],
+                "system_available": system_memory[1],
+                "cuda_free"       : cuda_memory[0],
+                "cuda_total"      : cuda_memory[1],
+        }
+
+    def under_pressure(
+            self
+    ) -> bool:
+        """
+        Returns True if available system memory or free CUDA memory is below
+        its configured fraction.
+        """
+
+        system_memory = self.system_memory()
+        if system_memory and system_memory[1] < \
+                system_memory[0] * self.min_available_fraction:
+            return True
+
+        cuda_memory = self.cuda_memory()
+        if cuda_memory and cuda_memory[0] < \
+                cuda_memory[1] * self.min_cuda_free_fraction:
+            return True
+
+        return False
+
+
+class EvictionController:
+    """
+    Ejects idle models from registered ModelHandlers.
+
+    A model is ejected once it has been idle for idle_time, or for its
+    handler's eject_time when the handler sets use_timer. Under memory
+    pressure, a model idle for at least pressure_idle_time is ejected
+    earlier, least recently used first. The controller keeps watching after
+    an ejection, so a reloaded model is tracked again.
+
+    Methods:
+        register: Start watching a model handler.
+        unregister: Stop watching a model handler.
+        check: Run one eviction pass.
+        start: Run eviction passes in a background thread.
+        stop: Stop the background thread.
+    """
+
+    def __init__(
+            self,
+            monitor: Optional[MemoryMonitor] = None,
+            idle_time: Optional[float] = 600.0,
+            pressure_idle_time: float = 30.0,
+            poll_interval: float = 5.0
+    ):
+        self.monitor = monitor or MemoryMonitor()
+        self.idle_time = idle_time
+        self.pressure_idle_time = pressure_idle_time
+        self.poll_interval = poll_interval
+
+        self.model_handlers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(
+            self,
+            model_handler
+    ) -> None:
+        with self._lock:
+            if model_handler not in self.model_handlers:
+                self.model_handlers.append(model_handler)
+
+    def unregister(
+            self,
+            model_handler
+    ) -> None:
+        with self._lock:
+            if model_handler in self.model_handlers:
+                self.model_handlers.remove(model_handler)
+
+    def _idle_handlers(
+            self,
+            now: float
+    ) -> List:
+        with self._lock:
+            model_handlers = list(self.model_handlers)
+        return [
+                handler for handler in model_handlers
+                if handler.model is not None and not handler.in_use()
+                and handler.idle_seconds(now) is not None
+        ]
+
+    def _idle_time(
+            self,
+            model_handler
+    ) -> Optional[float]:
+        if model_handler.use_timer and model_handler.eject_time is not None:
+            return model_handler.eject_time
+        return self.idle_time
+
+    def check(
+            self
+    ) -> List:
+        """
+        Runs one eviction pass.
+
+        Returns:
+            list: The model handlers whose model was ejected.
+        """
+
+        now = time.monotonic()
+        ejected = []
+        idle_handlers = self._idle_handlers(now)
+
+        for handler in idle_handlers:
+            idle_time = self._idle_time(handler)
+            if idle_time is not None and \
+                    handler.idle_seconds(now) >= idle_time:
+                if handler.eject_model():
+                    ejected.append(handler)
+
+        # Least recently used first
+        candidates = sorted(
+                (handler for handler in idle_handlers
+                 if handler not in ejected
+                 and handler.idle_seconds(now) >= self.pressure_idle_time),
+                key=lambda handler: handler.last_used
+        )
+        for handler in candidates:
+            if not self.monitor.under_pressure():
+                break
+            if handler.eject_model():
+                ejected.append(handler)
+                logger.log(
+                        "INFO",
+                        f"Ejected idle model under memory pressure: "
+                        f"{self.monitor.snapshot()}"
+                )
+
+        return ejected
+
+    def _run(
+            self
+    ) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.log("ERROR", f"Model eviction check failed: {e}")
+
+    def start(
+            self
+    ) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+                target=self._run, name="model-eviction", daemon=True
+        )
+        self._thread.start()
+
+    def stop(
+            self
+    ) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
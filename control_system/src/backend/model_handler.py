@@ -1,4 +1,31 @@
 import asyncio
+import contextlib
+import gc
+import inspect
+import sys
+import threading
+import time
+
+from utils.logger import Logger
+
+from .backend_registry import (
+    BATCH_METHODS,
+    CHAT_GENERATION_METHODS,
+    STREAMING_METHODS
+)
+from .chat_template import ChatTemplate
+from .dataclasses.parameter import Parameter
+from .model_warmup import ModelWarmup
+from .numa_placement import numa_placer
+
+
+logger = Logger(__name__)
+
+# Outcomes of ModelHandler.apply_model_parameters
+PARAMETERS_UNCHANGED = "unchanged"
+PARAMETERS_APPLIED = "applied"
+MODEL_RELOAD = "reload"
+RELOAD_DEFERRED = "deferred"
 
 
 class ModelHandler:
@@ -13,64 +40,696 @@ class ModelHandler:
         self.generation_parameters = None
         self.generation_method = None
 
+        # Idle ejection is driven by an EvictionController
         self.use_timer = False
         self.eject_time = None
         self.last_used = None
-        self.eject_task = None
+        self.active_requests = 0
 
-    async def generate(
+        # Snapshot of the model parameters the loaded model was built with
+        self.loaded_parameters = None
+        # The model's own chat template, read on load and kept after an
+        # ejection, for prompts formatted as strings
+        self.chat_template = None
+        # Auto-tuned parameters, applied on load, see tuned_parameters
+        self.tuning_store = None
+        # NUMA node of the loaded model, see _place_model
+        self.numa_placer = numa_placer
+        self.placement = None
+
+        self.warmup = None
+        self._load_lock = threading.RLock()
+        # Guards active_requests. Held briefly, so requests are counted
+        # without waiting for a model load
+        self._request_lock = threading.Lock()
+        # Local models run one generation at a time
+        self._generation_lock = threading.Lock()
+
+    def is_network_backend(
+            self
+    ) -> bool:
+        return bool(getattr(self.backend, "host_ip", None))
+
+    def uses_chat_messages(
+            self
+    ) -> bool:
+        """
+        Whether the generation method takes chat messages rather than a
+        prompt string.
+        """
+
+        return self.generation_method in CHAT_GENERATION_METHODS
+
+    def backend_parameters(
             self,
-            prompt: str
+            group,
+            overrides: dict = None
     ):
-        """Generates a response using the appropriate method."""
+        """
+        Returns the parameters of a group ready to pass to the backend.
+        Backends with a prepare_parameters method convert the snapshot of the
+        group once, and cache the result per snapshot.
 
-        model_parameters = self.model_parameters.get_parameters()
-        generation_parameters = self.generation_parameters.get_parameters()
+        Args:
+            group (ParameterGroup): The model or generation parameter group.
+            overrides (dict, optional): Per-request values. Keys that are not
+                parameters of the group are ignored.
 
-        if self.backend.host_ip:  # Network backend
-            return await getattr(self.backend, self.generation_method)(
-                    prompt, model_parameters, generation_parameters
+        Returns:
+            Mapping: Read-only parameter keys and values.
+        """
+
+        snapshot = group.snapshot()
+        if overrides:
+            snapshot = snapshot.with_overrides({
+                    key: value for key, value in overrides.items()
+                    if key in snapshot.kwargs
+            })
+        prepare_parameters = getattr(self.backend, "prepare_parameters", None)
+        if prepare_parameters is None:
+            return snapshot.kwargs
+        return prepare_parameters(snapshot)
+
+    def tuned_parameters(
+            self
+    ) -> dict:
+        """
+        Returns the auto-tuned parameters of the model on this host, for
+        the parameters that have not been set explicitly.
+        """
+
+        if self.tuning_store is None:
+            return {}
+
+        model_path = self.model_parameters.snapshot().kwargs.get("model_path")
+        if not model_path:
+            return {}
+        tuned = {}
+        for key, value in self.tuning_store.get(model_path).items():
+            parameter = getattr(self.model_parameters, key, None)
+            # Parameters set explicitly take precedence
+            if isinstance(parameter, Parameter) and parameter.value is None:
+                tuned[key] = value
+        return tuned
+
+    def _place_model(
+            self,
+            overrides: dict
+    ) -> dict:
+        """
+        Assigns the model to a NUMA node when its numa parameter is "auto"
+        and the host has several nodes, so models resident at the same time
+        run on different sockets.
+
+        Placement relies on CPU affinity: loads and generations run on a
+        thread pinned to the node, and the backend must start its compute
+        threads from that thread so they inherit the affinity. ggml NUMA
+        is left disabled, as its state is process-wide and would move the
+        threads of every model to the node of the first.
+
+        Args:
+            overrides (dict): Parameters the model is loaded with in place
+                of the model parameters.
+
+        Returns:
+            dict: Parameters that disable ggml NUMA and limit the model
+                threads to the CPUs of the node.
+        """
+
+        parameters = {**self.model_parameters.get_parameters(), **overrides}
+        if parameters.get("numa") != "auto" or self.is_network_backend():
+            return {}
+
+        inherit_affinity = getattr(
+                self.backend, "threads_inherit_affinity", None
+        )
+        if inherit_affinity is None or not inherit_affinity():
+            logger.log(
+                    "WARNING",
+                    f"{type(self.backend).__name__} shares its threads "
+                    f"across models, the model is not placed on a node."
             )
-        else:  # Local backend
+            return {}
+
+        self.placement = self.numa_placer.assign(self)
+        if self.placement is None:
+            return {}
+
+        placed = {"numa": "disabled"}
+        for key, limit in (
+                ("n_threads", self.placement.physical_cores),
+                ("n_threads_batch", len(self.placement.cpus))
+        ):
+            if key in parameters:
+                placed[key] = min(parameters[key] or limit, limit)
+        return placed
+
+    def _model_overrides(
+            self
+    ) -> dict:
+        """
+        Returns the parameters the model runs with in place of the model
+        parameters: the tuned parameters of this host, and the thread
+        counts of its NUMA node once it is placed.
+        """
+
+        overrides = self.tuned_parameters()
+        overrides.update(self._place_model(overrides))
+        return overrides
+
+    def _pinned(
+            self
+    ):
+        """
+        Returns a context that pins the calling thread, and the inference
+        threads it starts, to the NUMA node of the model.
+        """
+
+        if self.placement is None:
+            return contextlib.nullcontext()
+        return self.placement.pinned()
+
+    def load_model(
+            self
+    ):
+        """
+        Loads the model with the current model parameters, and the tuned
+        parameters for this host, unless it is already loaded. The model is
+        placed on a NUMA node if its numa parameter asks for it.
+        """
+
+        with self._load_lock:
             if self.model is None:
-                self.backend.load_model(model_parameters)
+                overrides = self._model_overrides()
+                # Loaded on the node, so its memory is allocated there
+                with self._pinned():
+                    self.backend.load_model(
+                            self.backend_parameters(
+                                    self.model_parameters, overrides
+                            )
+                    )
+                self.model = self.backend.model
+                self.loaded_parameters = self.model_parameters.snapshot()
+                self.chat_template = self._read_chat_template()
+                self.last_used = time.monotonic()
 
-            # Start/reset timer if using it
-            if self.use_timer:
-                # Get eject time from parameters
-                self.eject_time = self.model.get_eject_time()
-                self.last_used = asyncio.get_event_loop().time()
+    def _read_chat_template(
+            self
+    ):
+        """
+        Returns the chat template of the loaded model, or None if the
+        backend or the model has none.
+        """
 
-            response = await getattr(self.backend, self.generation_method)(
-                    prompt, generation_parameters
-            )
+        if not hasattr(self.backend, "chat_template"):
+            return None
+        source = self.backend.chat_template()
+        return ChatTemplate(*source) if source else None
+
+    def model_parameter_changes(
+            self
+    ):
+        """
+        Compares the model parameters with those the loaded model was built
+        with. Changes are runtime-adjustable when the parameter is marked so
+        and the backend can apply parameters to a loaded model.
+
+        Returns:
+            tuple: The runtime-adjustable and the load-time changes, as dicts
+                of parameter keys and new values.
+        """
+
+        runtime, load_time = {}, {}
+        snapshot = self.model_parameters.snapshot()
+        if self.loaded_parameters is None or \
+                snapshot == self.loaded_parameters:
+            return runtime, load_time
+
+        adjustable = frozenset()
+        if hasattr(self.backend, "apply_runtime_parameters"):
+            adjustable = self.model_parameters.runtime_adjustable_keys()
+
+        loaded = self.loaded_parameters.kwargs
+        for key, value in snapshot.kwargs.items():
+            if key in loaded and loaded[key] == value:
+                continue
+            if key in adjustable:
+                runtime[key] = value
+            else:
+                load_time[key] = value
+        return runtime, load_time
 
-            # Schedule model ejection if timer is active
-            if self.use_timer and self.eject_task is None:
-                self.eject_task = asyncio.create_task(
-                        self.eject_model_after_delay(self.eject_time)
+    def apply_model_parameters(
+            self
+    ):
+        """
+        Brings the loaded model in line with the model parameters. Changes
+        to runtime-adjustable parameters, such as the thread counts, are
+        applied to the live model. A change to any other parameter ejects
+        the model, so it is reloaded by the next preload or generation.
+
+        Returns:
+            tuple: The decision, one of PARAMETERS_UNCHANGED,
+                PARAMETERS_APPLIED, MODEL_RELOAD or RELOAD_DEFERRED, and the
+                keys of the changed parameters.
+        """
+
+        with self._load_lock:
+            runtime, load_time = self.model_parameter_changes()
+
+            if load_time:
+                if not self.eject_model():
+                    # Retried on the next change, once the model is idle
+                    return RELOAD_DEFERRED, sorted(load_time)
+                self.warmup = None
+                logger.log(
+                        "INFO",
+                        f"Reloading the model for {', '.join(load_time)}."
                 )
+                return MODEL_RELOAD, sorted(load_time)
 
-            return response
+            if not runtime:
+                return PARAMETERS_UNCHANGED, []
 
-    def eject_model(
+            # Resolved as on load, so the tuned thread counts and the
+            # limits of the node still apply
+            parameters = self.backend_parameters(
+                    self.model_parameters, self._model_overrides()
+            )
+            self._call_locked(
+                    self.backend.apply_runtime_parameters,
+                    {key: parameters[key] for key in runtime}
+            )
+            self.loaded_parameters = self.model_parameters.snapshot()
+            logger.log(
+                    "INFO",
+                    f"Applied {', '.join(runtime)} to the loaded model."
+            )
+            return PARAMETERS_APPLIED, sorted(runtime)
+
+    def in_use(
             self
+    ) -> bool:
+        return self.active_requests > 0
+
+    def idle_seconds(
+            self,
+            now: float = None
     ):
         """
-           Ejects the model.
+        Returns the seconds since the model was last used, or None if it has
+        not been used.
         """
 
-        self.model = None
+        if self.last_used is None:
+            return None
+        return (now if now is not None else time.monotonic()) - self.last_used
+
+    def register_adapter(
+            self,
+            name: str,
+            path: str,
+            scale: float = 1.0
+    ):
+        """
+        Registers a LoRA adapter of the model, selected per request with the
+        adapter generation parameter. The base model stays loaded when the
+        adapter changes.
+
+        Raises:
+            ValueError: If the backend does not support adapters.
+        """
+
+        if not hasattr(self.backend, "register_adapter"):
+            raise ValueError(
+                    f"The {type(self.backend).__name__} backend does not "
+                    f"support adapters."
+            )
+        self.backend.register_adapter(name, path, scale)
+
+    def adapter_names(
+            self
+    ) -> list:
+        """
+        Returns the names of the registered adapters.
+        """
+
+        adapters = getattr(self.backend, "adapters", None)
+        return adapters.names() if adapters is not None else []
+
+    def count_tokens(
+            self,
+            text: str
+    ):
+        """
+        Counts tokens with the backend's tokenizer.
+
+        Returns:
+            int: The token count, or None if the model is not loaded or the
+            backend has no tokenizer.
+        """
+
+        if self.model is None or not hasattr(self.backend, "count_tokens"):
+            return None
+        return self.backend.count_tokens(text)
 
-    async def eject_model_after_delay(
+    def token_budget(
+            self
+    ):
+        """
+        Returns the context length and the tokens reserved for the response.
+
+        Returns:
+            tuple: (n_ctx, max_tokens), either of which may be None.
+        """
+
+        model_parameters = self.model_parameters.snapshot().kwargs
+        generation_parameters = self.generation_parameters.snapshot().kwargs
+
+        n_ctx = model_parameters.get("n_ctx") or None  # 0 = from model
+        if n_ctx is None and self.model is not None and \
+                hasattr(self.backend, "context_length"):
+            n_ctx = self.backend.context_length()
+        if n_ctx is None:
+            # max_length bounds the prompt and the response together
+            n_ctx = generation_parameters.get("max_length")
+
+        max_tokens = generation_parameters.get("max_tokens")
+        if max_tokens is not None and max_tokens <= 0:  # unlimited
+            max_tokens = None
+        return n_ctx, max_tokens
+
+    async def call_generation_method(
             self,
-            delay: int
+            *args
     ):
-        """Ejects the model after the specified delay.
+        """
+        Calls the backend generation method. Blocking backends are run in a
+        worker thread so they do not stall the event loop.
+        """
+
+        method = getattr(self.backend, self.generation_method)
+        if inspect.iscoroutinefunction(method):
+            return await method(*args)
+        return await asyncio.to_thread(self._call_locked, method, *args)
+
+    def _call_locked(
+            self,
+            method,
+            *args
+    ):
+        with self._generation_lock, self._pinned():
+            return method(*args)
+
+    def embed(
+            self,
+            texts: list
+    ) -> list:
+        """
+        Embeds texts with the backend, loading the model if needed. The
+        model must be loaded in embedding mode.
 
         Args:
-            delay: The delay in seconds.
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            list: One vector per text.
+
+        Raises:
+            ValueError: If the backend does not support embeddings.
+        """
+
+        if not hasattr(self.backend, "embed"):
+            raise ValueError(
+                    f"The {type(self.backend).__name__} backend does not "
+                    f"support embeddings."
+            )
+
+        with self._request():
+            return self._call_locked(self.backend.embed, texts)
+
+    def preload(
+            self,
+            prompt: str = "Hello"
+    ) -> ModelWarmup:
+        """
+        Loads and warms up the model in the background.
+
+        Args:
+            prompt: Prompt used for the warm-up generation.
+
+        Returns:
+            ModelWarmup: The warm-up, which reports the model readiness.
+        """
+
+        # Preloads once per backend: an ejected model is reloaded by the next
+        # generate() call and a failed warm-up is not retried.
+        if self.warmup is None:
+            self.warmup = ModelWarmup(self, prompt)
+            if self.is_network_backend():
+                self.warmup.state = ModelWarmup.READY
+            else:
+                self.warmup.start()
+        return self.warmup
+
+    def warmup_status(
+            self
+    ) -> dict:
+        """
+        Returns the readiness of the model for the UI to poll.
+        """
+
+        if self.warmup is not None and (
+                self.warmup.is_running()
+                or self.warmup.state == ModelWarmup.FAILED
+        ):
+            return self.warmup.status()
+
+        ready = self.model is not None or self.is_network_backend()
+        state = ModelWarmup.READY if ready else ModelWarmup.IDLE
+        return {"state": state, "ready": ready}
+
+    def _begin_request(
+            self
+    ) -> None:
+        """
+        Marks the model in use. eject_model checks the count and drops the
+        model under the same lock, so a model is not ejected after a request
+        has been counted.
+        """
+
+        with self._request_lock:
+            self.active_requests += 1
+
+    def _end_request(
+            self
+    ) -> None:
+        with self._request_lock:
+            self.last_used = time.monotonic()
+            self.active_requests -= 1
+
+    def _prepare_model(
+            self
+    ) -> None:
+        """
+        Waits for a background warm-up instead of loading twice, then loads
+        the model if needed. The model is checked under the load lock, so
+        an ejection that started before the request was counted has
+        finished.
+        """
+
+        if self.warmup is not None and self.warmup.is_running():
+            self.warmup.wait()
+        self.load_model()
+
+    @contextlib.contextmanager
+    def _request(
+            self
+    ):
         """
-        await asyncio.sleep(delay)
-        if asyncio.get_event_loop().time() - self.last_used >= delay:
-            self.eject_model()
+        Marks the model in use for a blocking request, waiting for a
+        background warm-up and loading the model if needed.
+        """
+
+        self._begin_request()
+        try:
+            self._prepare_model()
+            yield
+        finally:
+            self._end_request()
+
+    @contextlib.asynccontextmanager
+    async def _local_request(
+            self
+    ):
+        """
+        Marks the model in use for a request, waiting for a background
+        warm-up and loading the model if needed.
+        """
+
+        self._begin_request()
+        try:
+            await asyncio.to_thread(self._prepare_model)
+            yield
+        finally:
+            self._end_request()
+
+    async def generate(
+            self,
+            prompt,
+            overrides: dict = None
+    ):
+        """Generates a response using the appropriate method.
+
+        Args:
+            prompt: The prompt string, or a list of chat messages if
+                uses_chat_messages() is True.
+            overrides (dict, optional): Generation parameters for this
+                request only.
+        """
+
+        # Snapshots are rebuilt only when a parameter changes
+        model_parameters = self.backend_parameters(self.model_parameters)
+        generation_parameters = self.backend_parameters(
+                self.generation_parameters, overrides
+        )
+
+        if self.is_network_backend():  # Network backend
+            return await self.call_generation_method(
+                    prompt, model_parameters, generation_parameters
+            )
+        else:  # Local backend
+            async with self._local_request():
+                return await self.call_generation_method(
+                        prompt, generation_parameters
+                )
+
+    async def generate_batch(
+            self,
+            prompts: list,
+            overrides: dict = None,
+            return_exceptions: bool = False
+    ) -> list:
+        """Generates responses for several prompts.
+
+        Backends with a batch method for the generation method run the
+        prompts as one batch; others run them one at a time.
+
+        Args:
+            prompts (list): Prompt strings, or lists of chat messages if
+                uses_chat_messages() is True.
+            overrides (dict, optional): Generation parameters for these
+                requests only.
+            return_exceptions (bool): Return the exception of a prompt that
+                failed in place of its response, when prompts run one at a
+                time. A failed batch always raises.
+
+        Returns:
+            list: The responses, in order.
+        """
+
+        method = getattr(
+                self.backend,
+                BATCH_METHODS.get(self.generation_method, ""),
+                None
+        )
+        if method is None or self.is_network_backend():
+            return await asyncio.gather(
+                    *(self.generate(prompt, overrides) for prompt in prompts),
+                    return_exceptions=return_exceptions
+            )
+
+        generation_parameters = self.backend_parameters(
+                self.generation_parameters, overrides
+        )
+        async with self._local_request():
+            return await asyncio.to_thread(
+                    self._call_locked, method, prompts, generation_parameters
+            )
+
+    async def stream(
+            self,
+            prompt,
+            overrides: dict = None
+    ):
+        """Generates a response, yielding text as it is produced.
+
+        Backends without a streaming method for the generation method yield
+        the whole response at once.
+
+        Args:
+            prompt: The prompt string, or a list of chat messages if
+                uses_chat_messages() is True.
+            overrides (dict, optional): Generation parameters for this
+                request only.
+        """
+
+        method = getattr(
+                self.backend,
+                STREAMING_METHODS.get(self.generation_method, ""),
+                None
+        )
+        if method is None or self.is_network_backend():
+            yield await self.generate(prompt, overrides)
+            return
+
+        generation_parameters = self.backend_parameters(
+                self.generation_parameters, overrides
+        )
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        stopped = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                with self._generation_lock, self._pinned():
+                    for chunk in method(prompt, generation_parameters):
+                        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+                        if stopped.is_set():  # The consumer went away
+                            break
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, done)
+
+        async with self._local_request():
+            producer = asyncio.ensure_future(asyncio.to_thread(produce))
+            try:
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is done:
+                        break
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    yield chunk
+            finally:
+                stopped.set()
+                await producer
+
+    def eject_model(
+            self
+    ) -> bool:
+        """
+        Ejects the model and releases its memory.
+
+        Returns:
+            bool: False if the model is in use and was not ejected.
+        """
+
+        with self._load_lock, self._request_lock:
+            if self.in_use():
+                return False
+
+            if self.backend is not None:
+                self.backend.model = None
+            self.model = None
+            self.loaded_parameters = None
+            self.numa_placer.release(self)
+            self.placement = None
+
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return True
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class ModelWarmup:
+    """
+    Loads a model in a background thread and runs a short warm-up
+    generation, so the first user request does not pay for model loading,
+    mmap page faults or kernel compilation.
+
+    Attributes:
+        model_handler (ModelHandler): The handler whose model is warmed up.
+        prompt (str): Prompt used for the warm-up generation.
+        state (str): One of IDLE, LOADING, WARMING, READY or FAILED.
+        error (str): The error message if the warm-up failed.
+
+    Methods:
+        start: Start loading and warming up the model in the background.
+        wait: Block until the warm-up has finished.
+        is_running: Whether the warm-up is still in progress.
+        status: The readiness of the model, for the UI to poll.
+    """
+
+    IDLE = "idle"
+    LOADING = "loading"
+    WARMING = "warming"
+    READY = "ready"
+    FAILED = "failed"
+
+    # Generation parameters capped during the warm-up generation.
+    WARMUP_LIMITS = {
+            "max_tokens": 4,
+            "max_length": 32,
+    }
+
+    def __init__(
+            self,
+            model_handler,
+            prompt: str = "Hello"
+    ):
+        self.model_handler = model_handler
+        self.prompt = prompt
+
+        self.state = self.IDLE
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+        self._thread = None
+        self._done = threading.Event()
+
+    def start(
+            self
+    ) -> None:
+        """
+        Start loading and warming up the model in a daemon thread.
+        """
+
+        if self._thread is not None:
+            return
+
+        self.state = self.LOADING
+        self._thread = threading.Thread(
+                target=self._run, name="model-warmup", daemon=True
+        )
+        self._thread.start()
+
+    def _warmup_parameters(
+            self
+    ) -> Dict[str, Any]:
+        generation_parameters = dict(
+                self.model_handler.backend_parameters(
+                        self.model_handler.generation_parameters
+                )
+        )
+        for key, limit in self.WARMUP_LIMITS.items():
+            if key in generation_parameters:
+                generation_parameters[key] = limit
+        if "stream" in generation_parameters:
+            generation_parameters["stream"] = False
+        return generation_parameters
+
+    def _run(
+            self
+    ) -> None:
+        try:
+            start = time.perf_counter()
+            self.model_handler.load_model()
+            self.load_seconds = time.perf_counter() - start
+
+            self.state = self.WARMING
+            start = time.perf_counter()
+            prompt = self.prompt
+            if self.model_handler.uses_chat_messages():
+                prompt = [{"role": "user", "content": self.prompt}]
+            asyncio.run(
+                    self.model_handler.call_generation_method(
+                            prompt, self._warmup_parameters()
+                    )
+            )
+            self.warmup_seconds = time.perf_counter() - start
+
+            self.state = self.READY
+            logger.log(
+                    "INFO",
+                    f"Model ready (load {self.load_seconds:.2f}s, "
+                    f"warm-up {self.warmup_seconds:.2f}s)."
+            )
+        except Exception as e:
+            self.state = self.FAILED
+            self.error = str(e)
+            logger.log("ERROR", f"Model warm-up failed: {e}")
+        finally:
+            self._done.set()
+
+    def wait(
+            self,
+            timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Block until the warm-up has finished.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds.
+
+        Returns:
+            bool: True if the warm-up has finished.
+        """
+
+        return self._done.wait(timeout)
+
+    def is_running(
+            self
+    ) -> bool:
+        return self._thread is not None and not self._done.is_set()
+
+    def status(
+            self
+    ) -> Dict[str, Any]:
+        """
+        Returns the readiness of the model.
+
+        Returns:
+            dict: The state, error, and load and warm-up timings.
+        """
+
+        return {
+                "state"         : self.state,
+                "ready"         : self.state == self.READY,
+                "error"         : self.error,
+                "load_seconds"  : self.load_seconds,
+                "warmup_seconds": self.warmup_seconds,
+        }
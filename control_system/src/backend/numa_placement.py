@@ -0,0 +1,145 @@
+import contextlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from utils.host_topology import HostTopology, host_topology
+from utils.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+@dataclass(frozen=True)
+class NumaPlacement:
+    """
+    The NUMA node a model runs on.
+
+    Attributes:
+        node (int): The node index.
+        cpus (tuple): The logical CPUs of the node.
+        physical_cores (int): The physical cores of the node.
+
+    Methods:
+        pinned: Pins the calling thread to the node while in the context.
+    """
+
+    node: int
+    cpus: Tuple[int, ...]
+    physical_cores: int
+
+    @contextlib.contextmanager
+    def pinned(
+            self
+            ) -> Iterator[None]:
+        """
+        Pins the calling thread to the CPUs of the node, and restores its
+        affinity on exit. Threads started meanwhile, such as the llama.cpp
+        workers, inherit the affinity.
+        """
+
+        if not hasattr(os, "sched_setaffinity"):
+            yield
+            return
+
+        previous = os.sched_getaffinity(0)
+        try:
+            os.sched_setaffinity(0, self.cpus)
+        except OSError as e:
+            # The CPUs of the node are not available to the process
+            logger.log("WARNING", f"Not pinned to NUMA node {self.node}: {e}")
+            yield
+            return
+        try:
+            yield
+        finally:
+            os.sched_setaffinity(0, previous)
+
+
+class NumaPlacer:
+    """
+    Assigns the models resident in the process to NUMA nodes, so models
+    loaded at the same time run on different sockets instead of competing
+    for the same cores and reading weights from remote memory.
+
+    Each model goes to the node with the fewest models. On a host with a
+    single node no placement is made.
+
+    Attributes:
+        topology (HostTopology): The CPUs of the host, read on first use.
+
+    Methods:
+        assign: Assigns a model to a node.
+        release: Releases the node of a model.
+        placement: Returns the placement of a model.
+    """
+
+    def __init__(
+            self,
+            topology: Optional[HostTopology] = None
+            ):
+        self._topology = topology
+        self._placements: Dict[Any, NumaPlacement] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def topology(
+            self
+            ) -> HostTopology:
+        if self._topology is None:
+            self._topology = host_topology()
+        return self._topology
+
+    def placement(
+            self,
+            owner
+            ) -> Optional[NumaPlacement]:
+        with self._lock:
+            return self._placements.get(owner)
+
+    def assign(
+            self,
+            owner
+            ) -> Optional[NumaPlacement]:
+        """
+        Assigns a model to the node with the fewest models, keeping its
+        node if it has one.
+
+        Args:
+            owner: The owner of the model, such as its ModelHandler.
+
+        Returns:
+            NumaPlacement: The placement, or None on a single node host.
+        """
+
+        topology = self.topology
+        if len(topology.nodes) < 2:
+            return None
+
+        with self._lock:
+            placement = self._placements.get(owner)
+            if placement is None:
+                load = [0] * len(topology.nodes)
+                for assigned in self._placements.values():
+                    load[assigned.node] += 1
+                node = load.index(min(load))
+                placement = NumaPlacement(
+                        node=node,
+                        cpus=tuple(topology.logical_cpus(node)),
+                        physical_cores=len(topology.physical_cores(node))
+                )
+                self._placements[owner] = placement
+                logger.log("INFO", f"Placed a model on NUMA node {node}.")
+            return placement
+
+    def release(
+            self,
+            owner
+            ) -> None:
+        with self._lock:
+            self._placements.pop(owner, None)
+
+
+# Shared by the model handlers of the process
+numa_placer = NumaPlacer()
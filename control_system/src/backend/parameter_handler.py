@@ -1,19 +1,61 @@
-import pickle
-from typing import Any
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict
 
+from utils.file_manager import FileManager
+from utils.io_executor import io_executor
+from utils.logger import Logger
+
+from .dataclasses.parameter import Parameter
 from .dataclasses.parameter_group import ParameterGroup
 
 
+logger = Logger(__name__)
+
+
 class ParameterHandler:
+    """
+    Loads, updates and saves the model and generation parameter groups.
+
+    Parameter groups are saved as JSON holding only the values that differ
+    from their defaults, with a schema version. Saves are debounced: a burst
+    of updates, such as dragging a slider, is coalesced into a single atomic
+    write once the updates stop for save_delay seconds.
+
+    Attributes:
+        model_parameters (ParameterGroup): The model parameter group.
+        generation_parameters (ParameterGroup): The generation parameter group.
+        save_directory (str): Directory the parameter groups are saved to.
+        save_delay (float): Seconds without updates before a save is written.
+
+    Methods:
+        save_parameter_group: Schedules a debounced save of a group.
+        asave_parameter_group: Saves a group on the I/O threads.
+        load_parameter_group: Loads saved values into a group.
+        update_parameter: Updates a parameter and schedules a save.
+        flush: Writes all pending saves immediately.
+    """
+
+    SCHEMA_VERSION = 1
+
+    # Pending saves are shared by all handlers, since the pages create a new
+    # handler on every rerun while a save may still be pending.
+    _pending: Dict[str, ParameterGroup] = {}
+    _pending_lock = threading.Lock()
+    _timer = None
 
     def __init__(
             self,
-            save_directory: str
+            save_directory: str,
+            save_delay: float = 0.5
             ):
         self.model_parameters = None
         self.generation_parameters = None
 
         self.save_directory = save_directory
+        self.save_delay = save_delay
 
     @staticmethod
     def format_filename(
@@ -23,35 +65,192 @@ class ParameterHandler:
         Formats the filename of the parameter group
         """
         filename = (f'{group.group_name.replace(".", "_")}-'
-                    f'{group.group_type}.pickle')
+                    f'{group.group_type}.json')
         return filename
 
+    @staticmethod
+    def _parameters(
+            group: ParameterGroup
+            ) -> Dict[str, Parameter]:
+        return {
+                name: getattr(group, name)
+                for name in group.__dataclass_fields__
+                if isinstance(getattr(group, name), Parameter)
+        }
+
+    @classmethod
+    def serialize_group(
+            cls,
+            group: ParameterGroup
+            ) -> Dict[str, Any]:
+        """
+        Returns the saved state of a group: the values that differ from their
+        defaults, keyed by parameter name.
+        """
+
+        overrides = {
+                name: parameter.value
+                for name, parameter in cls._parameters(group).items()
+                if parameter.value is not None
+                and parameter.value != parameter.default_value
+        }
+        return {
+                "schema_version": cls.SCHEMA_VERSION,
+                "group_name"    : group.group_name,
+                "group_type"    : group.group_type,
+                "values"        : overrides,
+        }
+
+    @classmethod
+    def apply_state(
+            cls,
+            group: ParameterGroup,
+            state: Dict[str, Any]
+            ) -> None:
+        """
+        Applies a saved state to a group in place. Parameters without a saved
+        value are reset to their defaults; unknown parameters and values of
+        the wrong type are skipped.
+        """
+
+        if state.get("schema_version") != cls.SCHEMA_VERSION:
+            logger.log(
+                    "WARNING",
+                    f"Ignoring {group.group_name} {group.group_type} "
+                    f"parameters with schema version "
+                    f"{state.get('schema_version')}."
+            )
+            return
+
+        values = state.get("values", {})
+        for name, parameter in cls._parameters(group).items():
+            parameter.value = None
+            if name in values:
+                try:
+                    parameter.update_value(values[name])
+                except TypeError as e:
+                    logger.log("WARNING", f"Skipping saved {name}: {e}")
+
+        group.invalidate_snapshot()
+
     def save_parameter_group(
             self,
             group: ParameterGroup
             ) -> None:
-        filename = self.format_filename(group)
+        """
+        Schedules a save of the group. Saves of the same group within
+        save_delay seconds are coalesced into one write.
+        """
+
+        path = str(Path(self.save_directory) / self.format_filename(group))
+
+        with self._pending_lock:
+            ParameterHandler._pending[path] = group
+
+            if ParameterHandler._timer is not None:
+                ParameterHandler._timer.cancel()
+            # Not a daemon thread, so a pending save is written before exit
+            ParameterHandler._timer = threading.Timer(
+                    self.save_delay, ParameterHandler.flush
+            )
+            ParameterHandler._timer.start()
+
+    async def asave_parameter_group(
+            self,
+            group: ParameterGroup
+            ) -> None:
+        """
+        Saves the group now on the I/O threads, replacing a pending debounced
+        save of it.
+        """
+
+        path = str(Path(self.save_directory) / self.format_filename(group))
+        state = self.serialize_group(group)
+
+        with self._pending_lock:
+            if self._pending.get(path) is group:
+                del ParameterHandler._pending[path]
+
+        await io_executor.run(path, self._write_state, path, state)
+
+    @staticmethod
+    def _write_state(
+            path: str,
+            state: Dict[str, Any]
+            ) -> None:
+        FileManager.create_directory(os.path.dirname(path))
+        FileManager.save_json(
+                os.path.dirname(path), os.path.basename(path), state
+        )
+
+    @classmethod
+    def flush(
+            cls
+            ) -> None:
+        """
+        Writes all pending saves.
+        """
+
+        with cls._pending_lock:
+            if cls._timer is not None:
+                cls._timer.cancel()
+                cls._timer = None
+            pending = dict(cls._pending)
 
-        with open(f"{self.save_directory}/{filename}", "wb") as f:
-            pickle.dump(group, f)
+        for path, group in pending.items():
+            state = cls.serialize_group(group)
+            try:
+                try:
+                    # In order with saves queued by asave_parameter_group
+                    io_executor.submit(
+                            path, cls._write_state, path, state
+                    ).result()
+                except RuntimeError:
+                    # The I/O threads are stopped at interpreter exit
+                    cls._write_state(path, state)
+            except OSError as e:
+                logger.log("ERROR", f"Error saving parameters to {path}: {e}")
+                continue
+
+            with cls._pending_lock:
+                # Keep saves scheduled while this one was written
+                if cls._pending.get(path) is group and \
+                        cls.serialize_group(group) == state:
+                    del cls._pending[path]
 
     def load_parameter_group(
             self,
             group: ParameterGroup
             ) -> None:
-        try:
-            filename = self.format_filename(group)
+        """
+        Loads the saved values into the group, which becomes the handler's
+        model or generation parameter group.
+        """
 
-            with open(f"{self.save_directory}/{filename}", "rb") as f:
-                data = pickle.load(f)
+        path = str(Path(self.save_directory) / self.format_filename(group))
 
-            if data.group_type == "Model":
-                self.model_parameters = data
+        with self._pending_lock:
+            pending = self._pending.get(path)
+
+        try:
+            if pending is not None:
+                # A save is still pending, its values are the latest
+                state = self.serialize_group(pending)
             else:
-                self.generation_parameters = data
+                with open(path, "r") as f:
+                    state = json.load(f)
+
+            self.apply_state(group, state)
 
         except FileNotFoundError:
             pass
+        except (OSError, ValueError) as e:
+            logger.log("ERROR", f"Error loading parameters from {path}: {e}")
+
+        if group.group_type == "Model":
+            self.model_parameters = group
+        else:
+            self.generation_parameters = group
 
     def update_parameter(
             self,
@@ -81,17 +280,11 @@ class ParameterHandler:
             group: ParameterGroup
             ):
         """
-        Updates the group.parameters dictionary with Parameter keys and values.
+        Returns a dictionary of Parameter keys and values, falling back to
+        the default value for parameters that have not been set.
         """
 
-        parameter_dict = {}
-        parameters = self.get_parameter_fields(
-                group, "key", "value", "default_value"
-        )
-
-        for parameter in parameters:
-            parameter_dict[parameter["key"]] = \
-                parameter["value"] if parameter["value"] is not None else \
-                    parameter["default_value"]
-
-        return parameter_dict
+        if group.group_type == "Model":
+            return self.model_parameters.get_parameters()
+        else:
+            return self.generation_parameters.get_parameters()
@@ -36,8 +36,10 @@ class MambaModelParameters(ParameterGroup):
     chat_format: Parameter = field(
             default_factory=lambda: Parameter(
                     key="chat_format",
-                    default_value='chatml',
-                    description="Chat format."
+                    default_value='',
+                    description="Model whose chat template is used if the "
+                                "tokenizer has none.",
+                    runtime_adjustable=True
             )
     )
 
@@ -228,3 +230,12 @@ class MambaGenerationParameters(ParameterGroup):
                     description="Additional keyword arguments passed to the model."
             )
     )
+
+    adapter: Parameter = field(
+            default_factory=lambda: Parameter(
+                    key="adapter",
+                    default_value=None,
+                    description="Name or path of the PEFT adapter to apply, "
+                                "none for the base model."
+            )
+    )
@@ -1,7 +1,13 @@
 import torch
-from transformers import AutoTokenizer, AutoConfig, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer,
+    AutoConfig,
+    AutoModelForCausalLM,
+    PretrainedConfig
+)
 
-from ...utils.logger import Logger
+from utils.logger import Logger
+from ..adapter_cache import AdapterCache
 
 
 logger = Logger(__name__)
@@ -23,6 +29,13 @@ class TransformerBackend:
         self.tokenizer = None
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
         self.model_name_or_path = None
+        self._own_chat_template = None
+        # Mamba models generate without an attention mask, so padded batches
+        # are not supported
+        self.supports_padding = False
+        # PEFT adapters are loaded onto the base model and switched per
+        # request, see register_adapter
+        self.adapters = AdapterCache(self._load_adapter, self._unload_adapter)
 
     def load_model(
             self,
@@ -35,67 +48,180 @@ class TransformerBackend:
 
         """
 
-        try:
-            model_name = model_parameters["name_or_path"]
-            self.model_name_or_path = model_name
-            logger.log(
-                    "INFO",
-                    f"Loading model {model_name}."
-            )
-        except KeyError as e:
+        model_name = model_parameters.get("name_or_path") or \
+            model_parameters.get("model_path")
+        if not model_name:
             self.model_not_loaded()
 
+        self.model_name_or_path = model_name
+        logger.log(
+                "INFO",
+                f"Loading model {model_name}."
+        )
+
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Kept so another chat format can be applied to the loaded model
+        self._own_chat_template = self.tokenizer.chat_template
+        self.chat_format_apply_template(model_parameters.get("chat_format"))
 
         # Handle transformers architecture with this workaround until it is added
         # to the transformers library
-        if "ssm_cfg" in self.model.generation_parameters:
+        config_dict, _ = PretrainedConfig.get_config_dict(model_name)
+        if "ssm_cfg" in config_dict:
             from mamba_ssm.models.mixer_seq_simple import MambaLMHeadModel
 
             self.model = MambaLMHeadModel.from_pretrained(
                     model_name, device=self.device, dtype=torch.float16
             )
+            self.supports_padding = False
         # Load the model as usual.
         else:
             self.model = AutoModelForCausalLM.from_pretrained(model_name).to(
                     self.device
             )
+            self.supports_padding = True
+        self.adapters.clear()
+
+    def register_adapter(
+            self,
+            name: str,
+            path: str,
+            scale: float = 1.0
+    ):
+        """
+        Registers a PEFT adapter of the base model, selected per request with
+        the adapter generation parameter. It is loaded on first use.
+
+        Args:
+            name (str): The adapter name.
+            path (str): Path or hub ID of the adapter.
+            scale (float): Unused, PEFT adapters apply their own scaling.
+        """
+
+        self.adapters.register(name, path, scale)
+
+    def _load_adapter(
+            self,
+            path: str,
+            scale: float
+    ):
+        if not hasattr(self.model, "load_adapter"):
+            raise ValueError(
+                    f"{type(self.model).__name__} does not support PEFT "
+                    f"adapters."
+            )
+
+        # The adapter name in PEFT is its path, unique per registration
+        if hasattr(self.model, "peft_config") and \
+                path in self.model.peft_config:
+            return path
+        self.model.load_adapter(path, adapter_name=path)
+        return path
+
+    def _unload_adapter(
+            self,
+            adapter_name: str
+    ):
+        self.model.delete_adapter(adapter_name)
+
+    def _use_adapter(
+            self,
+            generation_parameters: dict
+    ) -> dict:
+        """
+        Activates the adapter named by the generation parameters, or the base
+        model without one.
+
+        Returns:
+            dict: The generation parameters without the adapter.
+        """
+
+        parameters = dict(generation_parameters)
+        name = parameters.pop("adapter", None) or None
+        if name == self.adapters.active:
+            return parameters
+
+        if name is None:
+            self.model.disable_adapters()
+        else:
+            self.model.set_adapter(self.adapters.get(name))
+            self.model.enable_adapters()
+        self.adapters.active = name
+        return parameters
+
+    def apply_runtime_parameters(
+            self,
+            model_parameters: dict
+    ):
+        """
+        Applies runtime-adjustable model parameters to the loaded model,
+        without reloading it.
+
+        Args:
+            model_parameters: The changed parameters, see the
+                runtime_adjustable parameters of MambaModelParameters.
+        """
+
+        if "chat_format" in model_parameters:
+            self.tokenizer.chat_template = self._own_chat_template
+            self.chat_format_apply_template(model_parameters["chat_format"])
 
     def chat_format_apply_template(
             self,
             override_chat_format=None
     ):
         """
-        Applies a chat format to the tokenizer.
+        Applies a chat format to the tokenizer, at load time or when the
+        chat_format parameter changes.
+        apply_chat_template compiles the template once and reuses it.
 
         Args:
-            override_chat_format (optional=None): chat format to apply
+            override_chat_format (optional=None): a model whose tokenizer
+                template is used. The tokenizer's own template is kept if it
+                has one.
 
         """
 
-        if override_chat_format is not None:
-            self.tokenizer.chat_template = AutoTokenizer.from_pretrained(
-                    override_chat_format
-            ).chat_template
-        else:
-            self.tokenizer.chat_template = AutoTokenizer.from_pretrained(
-                    self.model_name_or_path
-            ).chat_template
+        if self.tokenizer.chat_template or not override_chat_format:
+            return
+
+        self.tokenizer.chat_template = AutoTokenizer.from_pretrained(
+                override_chat_format
+        ).chat_template
 
-    @chat_format_apply_template
-    async def generate(
+    def chat_template(
+            self
+    ):
+        """
+        Returns the chat template of the tokenizer, with its BOS and EOS
+        tokens.
+
+        Returns:
+            tuple: (template, bos_token, eos_token), or None if the tokenizer
+            has no template.
+        """
+
+        if not self.tokenizer or not self.tokenizer.chat_template:
+            return None
+        return (
+                self.tokenizer.chat_template,
+                self.tokenizer.bos_token or "",
+                self.tokenizer.eos_token or ""
+        )
+
+    def generate(
             self,
-            prompt: str,
+            messages: list,
             generation_parameters: dict,
             add_generation_prompt: bool = True
     ):
         """
-        Generates a response using the loaded model.
+        Generates a response using the loaded model and its chat template.
 
         Args:
             add_generation_prompt (bool): Whether to add the generation prompt
                 to the input.
-            prompt (str): The user prompt for generation.
+            messages (list): The chat messages, with "role" and "content".
             generation_parameters (dict): Dict of generation parameters.
 
         Returns:
@@ -106,14 +232,101 @@ class TransformerBackend:
             self.model_not_loaded()
 
         input_ids = self.tokenizer.apply_chat_template(
-                prompt,
+                messages,
                 return_tensors="pt",
                 add_generation_prompt=add_generation_prompt
-        ).to(self.model.device)
+        ).to(self.device)
+
+        output = self.model.generate(
+                input_ids, **self._use_adapter(generation_parameters)
+        )
+        return self.tokenizer.decode(
+                output[0][input_ids.shape[1]:], skip_special_tokens=True
+        )
+
+    def generate_batch(
+            self,
+            conversations: list,
+            generation_parameters: dict,
+            add_generation_prompt: bool = True
+    ):
+        """
+        Generates responses for several conversations in one padded batch.
+
+        Args:
+            conversations (list): Lists of chat messages.
+            generation_parameters (dict): Dict of generation parameters.
+            add_generation_prompt (bool): Whether to add the generation prompt
+                to the inputs.
+
+        Returns:
+            list[str]: The generated responses, in order.
+        """
+
+        if not self.model:
+            self.model_not_loaded()
+
+        if not self.supports_padding:
+            return [
+                    self.generate(
+                            messages, generation_parameters,
+                            add_generation_prompt
+                    )
+                    for messages in conversations
+            ]
+
+        prompts = [
+                self.tokenizer.apply_chat_template(
+                        messages,
+                        tokenize=False,
+                        add_generation_prompt=add_generation_prompt
+                )
+                for messages in conversations
+        ]
+
+        # Decoder-only models continue from the right, so pad on the left
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        padding_side = self.tokenizer.padding_side
+        self.tokenizer.padding_side = "left"
+        try:
+            inputs = self.tokenizer(
+                    prompts,
+                    return_tensors="pt",
+                    padding=True,
+                    add_special_tokens=False
+            ).to(self.device)
+        finally:
+            self.tokenizer.padding_side = padding_side
+
+        output = self.model.generate(
+                **inputs, **self._use_adapter(generation_parameters)
+        )
+        return self.tokenizer.batch_decode(
+                output[:, inputs["input_ids"].shape[1]:],
+                skip_special_tokens=True
+        )
+
+    def count_tokens(
+            self,
+            text: str
+    ) -> int:
+        """Counts the tokens of a text with the model's tokenizer."""
+
+        if not self.tokenizer:
+            self.model_not_loaded()
+
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def context_length(
+            self
+    ):
+        """Returns the context length of the loaded model, if known."""
+
+        if not self.model:
+            self.model_not_loaded()
 
-        output = self.model.generate(input_ids, **generation_parameters)
-        decoded = self.tokenizer.batch_decode(output)
-        return decoded
+        return getattr(self.model.config, "max_position_embeddings", None)
 
     def get_model_config(
             self
@@ -0,0 +1,120 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.file_manager import FileManager
+from utils.host_topology import host_topology
+from utils.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class TuningStore:
+    """
+    Saves the model parameters found best by auto-tuning, per model file and
+    host, so they can be applied whenever the model is loaded on that host.
+
+    A model is identified by its path and size, so a replaced model file is
+    tuned again. The host is identified by its name and CPU layout.
+
+    Attributes:
+        directory (str): Directory of the saved configurations.
+        host_id (str): ID of this host.
+
+    Methods:
+        get: Returns the tuned parameters of a model.
+        save: Saves the tuned parameters of a model.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            host_id: Optional[str] = None
+    ):
+        self.directory = directory
+        self.host_id = host_id or host_topology().host_id()
+
+    @staticmethod
+    def model_id(
+            model_path: str
+    ) -> Optional[str]:
+        """
+        Returns an ID of a model file, or None if it does not exist.
+        """
+
+        try:
+            size = os.path.getsize(model_path)
+        except OSError:
+            return None
+        return f"{Path(model_path).resolve()}:{size}"
+
+    def _filename(
+            self,
+            model_id: str
+    ) -> str:
+        key = hashlib.sha256(f"{model_id}\0{self.host_id}".encode())
+        return f"{key.hexdigest()[:16]}.json"
+
+    def get(
+            self,
+            model_path: str
+    ) -> Dict[str, Any]:
+        """
+        Returns the tuned parameters of a model on this host.
+
+        Args:
+            model_path (str): The model file.
+
+        Returns:
+            dict: Parameter keys and values, empty if the model is not tuned.
+        """
+
+        model_id = self.model_id(model_path)
+        if model_id is None:
+            return {}
+
+        try:
+            entry = FileManager.load_json(
+                    self.directory, self._filename(model_id)
+            )
+        except (OSError, ValueError) as e:
+            logger.log("ERROR", f"Error loading tuning of {model_path}: {e}")
+            return {}
+
+        if not isinstance(entry, dict) or entry.get("model_id") != model_id \
+                or entry.get("host_id") != self.host_id:
+            return {}
+        return dict(entry.get("parameters", {}))
+
+    def save(
+            self,
+            model_path: str,
+            parameters: Dict[str, Any],
+            results: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """
+        Saves the tuned parameters of a model on this host.
+
+        Args:
+            model_path (str): The model file.
+            parameters (dict): The parameter keys and values to apply.
+            results (list, optional): The measurements, kept for reference.
+        """
+
+        model_id = self.model_id(model_path)
+        if model_id is None:
+            raise FileNotFoundError(model_path)
+
+        FileManager.create_directory(self.directory)
+        FileManager.save_json(
+                self.directory,
+                self._filename(model_id),
+                {
+                        "model_id"  : model_id,
+                        "host_id"   : self.host_id,
+                        "parameters": parameters,
+                        "results"   : results or [],
+                }
+        )
@@ -0,0 +1,327 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from backend.model_handler import ModelHandler
+from prompt_handler import PromptHandler
+from utils.file_manager import FileManager
+from utils.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+@dataclass
+class BatchSummary:
+    """
+    Throughput of a batch run.
+
+    Attributes:
+        completed (int): Prompts answered in this run.
+        failed (int): Prompts that failed in this run.
+        resumed_from (int): Input lines already done by an earlier run.
+        seconds (float): Duration of this run.
+        output_tokens (int): Tokens generated, if the backend counts tokens.
+    """
+
+    completed: int = 0
+    failed: int = 0
+    resumed_from: int = 0
+    seconds: float = 0.0
+    output_tokens: Optional[int] = None
+
+    @property
+    def prompts_per_second(
+            self
+    ) -> float:
+        return (self.completed + self.failed) / self.seconds \
+            if self.seconds else 0.0
+
+    @property
+    def tokens_per_second(
+            self
+    ) -> Optional[float]:
+        if self.output_tokens is None or not self.seconds:
+            return None
+        return self.output_tokens / self.seconds
+
+    def report(
+            self
+    ) -> str:
+        lines = [
+                f"Completed:  {self.completed}",
+                f"Failed:     {self.failed}",
+                f"Resumed at: line {self.resumed_from}",
+                f"Duration:   {self.seconds:.2f}s",
+                f"Throughput: {self.prompts_per_second:.2f} prompts/s",
+        ]
+        if self.tokens_per_second is not None:
+            lines.append(
+                    f"            {self.tokens_per_second:.2f} tokens/s "
+                    f"({self.output_tokens} tokens)"
+            )
+        return "\n".join(lines)
+
+
+class BatchRunner:
+    """
+    Runs the prompts of a JSONL file through a model and writes the responses
+    to a JSONL file.
+
+    Each input line is a JSON object with a "prompt" string or a "messages"
+    list, and an optional "id". Each output line holds the "id", the input
+    "line" number and the "response", or an "error". Output lines are in
+    input order.
+
+    The input is read one window of concurrency * batch_size lines at a time,
+    so memory use does not grow with the input. After each window the output
+    is flushed to disk and a checkpoint records the next input line and the
+    output size, so an interrupted run resumes where it stopped.
+
+    Attributes:
+        model_handler (ModelHandler): Handler of the model to run.
+        input_path (str): JSONL file of prompts.
+        output_path (str): JSONL file of responses.
+        checkpoint_path (str): Checkpoint file, next to the output by default.
+        concurrency (int): Batches in flight at the same time.
+        batch_size (int): Prompts per batch, for backends that batch.
+        overwrite (bool): Start over an output file that has no checkpoint,
+            such as the output of a finished run.
+
+    Methods:
+        run: Run the prompts and return a BatchSummary.
+    """
+
+    def __init__(
+            self,
+            model_handler: ModelHandler,
+            input_path: str,
+            output_path: str,
+            checkpoint_path: Optional[str] = None,
+            concurrency: int = 1,
+            batch_size: int = 8,
+            overwrite: bool = False
+    ):
+        self.model_handler = model_handler
+        self.input_path = input_path
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.overwrite = overwrite
+
+    def _load_checkpoint(
+            self
+    ) -> Dict[str, Any]:
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return {"next_line": 0, "output_bytes": 0}
+
+        if checkpoint.get("input_path") != os.path.abspath(self.input_path):
+            raise ValueError(
+                    f"Checkpoint {self.checkpoint_path} belongs to "
+                    f"{checkpoint.get('input_path')}."
+            )
+        return checkpoint
+
+    def _save_checkpoint(
+            self,
+            next_line: int,
+            output_bytes: int
+    ) -> None:
+        FileManager.save_json(
+                os.path.dirname(os.path.abspath(self.checkpoint_path)),
+                os.path.basename(self.checkpoint_path),
+                {
+                        "input_path"  : os.path.abspath(self.input_path),
+                        "next_line"   : next_line,
+                        "output_bytes": output_bytes,
+                },
+                sync_directory=True
+        )
+
+    def _prepare_prompt(
+            self,
+            request: Dict[str, Any]
+    ):
+        """
+        Returns the prompt of an input line in the form the generation method
+        takes.
+        """
+
+        if isinstance(request.get("messages"), list):
+            messages = request["messages"]
+            if not messages or not all(
+                    isinstance(message, dict)
+                    and isinstance(message.get("role"), str)
+                    and isinstance(message.get("content"), str)
+                    for message in messages
+            ):
+                raise ValueError(
+                        "Line messages must be a non-empty list of messages "
+                        "with role and content strings."
+                )
+            if self.model_handler.uses_chat_messages():
+                return messages
+
+            # Fitted to the model context, rather than cut to the last few
+            # messages
+            prompt_handler = PromptHandler(
+                    conversation_history=messages[:-1],
+                    token_counter=self.model_handler.count_tokens,
+                    chat_template=self.model_handler.chat_template
+            )
+            prompt_handler.set_token_budget(*self.model_handler.token_budget())
+            return prompt_handler.format_prompt(messages[-1]["content"])
+
+        if isinstance(request.get("prompt"), str):
+            if self.model_handler.uses_chat_messages():
+                return [{"role": "user", "content": request["prompt"]}]
+            return request["prompt"]
+
+        raise ValueError("Line has no prompt string or messages list.")
+
+    async def _run_batch(
+            self,
+            prompts: List[Any]
+    ) -> List[Any]:
+        """
+        Returns the responses of a batch, or the exception of each prompt
+        that failed.
+        """
+
+        try:
+            return await self.model_handler.generate_batch(
+                    prompts, return_exceptions=True
+            )
+        except Exception as e:
+            if len(prompts) == 1:
+                return [e]
+
+        # Run one at a time so one bad prompt does not fail the batch
+        results = []
+        for prompt in prompts:
+            try:
+                results.append(await self.model_handler.generate(prompt))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def _run_window(
+            self,
+            lines: List[str],
+            first_line: int
+    ) -> List[Dict[str, Any]]:
+        records = []
+        prompts = []
+        for number, line in enumerate(lines, first_line):
+            record = {"id": None, "line": number}
+            try:
+                request = json.loads(line)
+                record["id"] = request.get("id")
+                prompts.append((record, self._prepare_prompt(request)))
+            except (ValueError, AttributeError, KeyError, TypeError) as e:
+                record["error"] = f"Invalid input line: {e}"
+            records.append(record)
+
+        batches = [
+                prompts[i:i + self.batch_size]
+                for i in range(0, len(prompts), self.batch_size)
+        ]
+        results = await asyncio.gather(*(
+                self._run_batch([prompt for _, prompt in batch])
+                for batch in batches
+        ))
+
+        for batch, responses in zip(batches, results):
+            for (record, _), response in zip(batch, responses):
+                if isinstance(response, Exception):
+                    record["error"] = str(response)
+                else:
+                    record["response"] = response
+        return records
+
+    async def run(
+            self,
+            resume: bool = True
+    ) -> BatchSummary:
+        """
+        Runs the prompts of the input file.
+
+        Args:
+            resume (bool): Continue from the checkpoint of an interrupted
+                run. Otherwise the output is started over.
+
+        Returns:
+            BatchSummary: The throughput of the run.
+
+        Raises:
+            FileExistsError: If the output file is not empty and has no
+                checkpoint to resume from, unless overwrite is set.
+        """
+
+        if resume and not self.overwrite and \
+                not os.path.exists(self.checkpoint_path) and \
+                os.path.exists(self.output_path) and \
+                os.path.getsize(self.output_path) > 0:
+            raise FileExistsError(
+                    f"{self.output_path} exists and has no checkpoint to "
+                    f"resume from. Overwrite it to start over."
+            )
+
+        checkpoint = self._load_checkpoint() if resume else \
+            {"next_line": 0, "output_bytes": 0}
+        next_line = checkpoint["next_line"]
+        summary = BatchSummary(resumed_from=next_line)
+        window_size = self.concurrency * self.batch_size
+        count_tokens = self.model_handler.count_tokens
+        start = time.perf_counter()
+
+        with open(self.input_path, "r") as input_file, \
+                open(self.output_path, "a+b") as output_file:
+            # Drop output written after the last checkpoint
+            output_file.truncate(checkpoint["output_bytes"])
+            lines = itertools.islice(input_file, next_line, None)
+
+            while True:
+                window = list(itertools.islice(lines, window_size))
+                if not window:
+                    break
+
+                records = await self._run_window(window, next_line)
+                for record in records:
+                    if "error" in record:
+                        summary.failed += 1
+                    else:
+                        summary.completed += 1
+                        tokens = count_tokens(record["response"])
+                        if tokens is not None:
+                            summary.output_tokens = \
+                                (summary.output_tokens or 0) + tokens
+                    output_file.write(
+                            json.dumps(record, ensure_ascii=False)
+                            .encode("utf-8") + b"\n"
+                    )
+
+                output_file.flush()
+                os.fsync(output_file.fileno())
+                next_line += len(window)
+                self._save_checkpoint(next_line, output_file.tell())
+
+                logger.log(
+                        "INFO",
+                        f"Batch progress: {next_line} lines, "
+                        f"{summary.failed} failed."
+                )
+
+        summary.seconds = time.perf_counter() - start
+        # The run is complete, a new run starts over
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        return summary
@@ -0,0 +1,320 @@
+"""
+Chat-store benchmark and load generator.
+
+Generates N chats of M messages with ChatHandler and measures the storage
+operations the chat page relies on. Run from the ``src`` directory:
+
+    python -m benchmarks.chat_store_benchmark --chats 500 --messages 40
+"""
+
+import argparse
+import random
+import shutil
+import string
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Sequence
+
+from chat_handler import ChatHandler
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    The outcome of a single benchmarked operation.
+
+    Attributes:
+        operation (str): Name of the benchmarked operation.
+        operations (int): Number of operations performed.
+        seconds (float): Total wall-clock time spent.
+        bytes_written (int): Bytes written to disk by the operations.
+    """
+
+    operation: str
+    operations: int
+    seconds: float
+    bytes_written: int = 0
+
+    @property
+    def ops_per_second(
+            self
+            ) -> float:
+        return self.operations / self.seconds if self.seconds else 0.0
+
+
+class ChatStoreBenchmark:
+    """
+    Benchmarks ChatHandler and FileManager I/O against a generated store.
+
+    Methods:
+        generate_chats: Generate the chat store.
+        bench_list_chats: Measure list_chats.
+        bench_sidebar_snippets: Measure get_chat_snippet for the sidebar.
+        bench_append: Measure append_and_save_message per history length.
+        bench_load_chat: Measure load_chat.
+        bench_search: Measure search over the search index.
+        bench_delete_chat: Measure delete_chat.
+        run: Run every benchmark in order.
+    """
+
+    def __init__(
+            self,
+            save_directory: str,
+            num_chats: int,
+            num_messages: int,
+            message_length: int = 400,
+            sidebar_size: int = 25,
+            history_lengths: Sequence[int] = (10, 100, 1000),
+            appends: int = 20,
+            seed: int = 0
+            ) -> None:
+        self.save_directory = Path(save_directory)
+        self.num_chats = num_chats
+        self.num_messages = num_messages
+        self.message_length = message_length
+        self.sidebar_size = sidebar_size
+        self.history_lengths = history_lengths
+        self.appends = appends
+        self.random = random.Random(seed)
+
+        self.chat_handler = ChatHandler(str(self.save_directory))
+        self.chat_ids: List[str] = []
+
+    def _message(
+            self,
+            role: str
+            ) -> dict:
+        content = "".join(
+                self.random.choices(
+                        string.ascii_letters + " ", k=self.message_length
+                )
+        )
+        return {"role": role, "content": content}
+
+    def _messages(
+            self,
+            count: int
+            ) -> List[dict]:
+        return [
+                self._message("user" if i % 2 == 0 else "assistant")
+                for i in range(count)
+        ]
+
+    def _chat_size(
+            self,
+            chat_id: str
+            ) -> int:
+        path = self.save_directory / f"{chat_id}.json"
+        return path.stat().st_size if path.exists() else 0
+
+    def generate_chats(
+            self
+            ) -> BenchmarkResult:
+        """
+        Generate the chat store (the load generator).
+
+        Returns:
+            BenchmarkResult: Timing of save_chat over every generated chat.
+        """
+
+        seconds = 0.0
+        bytes_written = 0
+        for _ in range(self.num_chats):
+            chat_id = self.chat_handler.create_chat_id()
+            messages = self._messages(self.num_messages)
+
+            start = time.perf_counter()
+            self.chat_handler.save_chat(chat_id, messages)
+            seconds += time.perf_counter() - start
+
+            bytes_written += self._chat_size(chat_id)
+            self.chat_ids.append(chat_id)
+
+        return BenchmarkResult(
+                "save_chat", self.num_chats, seconds, bytes_written
+        )
+
+    def bench_list_chats(
+            self,
+            repeat: int = 20
+            ) -> BenchmarkResult:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            self.chat_handler.list_chats()
+        return BenchmarkResult(
+                "list_chats", repeat, time.perf_counter() - start
+        )
+
+    def bench_sidebar_snippets(
+            self
+            ) -> BenchmarkResult:
+        """
+        Render the sidebar the way chat_history_component does: list the
+        chats, then fetch a snippet for each displayed chat.
+        """
+
+        start = time.perf_counter()
+        chat_ids = self.chat_handler.list_chats()[:self.sidebar_size]
+        for chat_id in chat_ids:
+            self.chat_handler.get_chat_snippet(chat_id)
+        return BenchmarkResult(
+                "sidebar (list_chats + get_chat_snippet)",
+                len(chat_ids),
+                time.perf_counter() - start
+        )
+
+    def bench_append(
+            self
+            ) -> List[BenchmarkResult]:
+        results = []
+        for history_length in self.history_lengths:
+            chat_id = self.chat_handler.create_chat_id()
+            self.chat_handler.save_chat(chat_id, self._messages(history_length))
+
+            seconds = 0.0
+            bytes_written = 0
+            for i in range(self.appends):
+                message = self._message("user" if i % 2 == 0 else "assistant")
+
+                start = time.perf_counter()
+                self.chat_handler.append_and_save_message(chat_id, message)
+                seconds += time.perf_counter() - start
+
+                # Every append rewrites the whole chat file.
+                bytes_written += self._chat_size(chat_id)
+
+            self.chat_handler.delete_chat(chat_id)
+            results.append(
+                    BenchmarkResult(
+                            f"append_and_save_message (history={history_length})",
+                            self.appends,
+                            seconds,
+                            bytes_written
+                    )
+            )
+        return results
+
+    def bench_load_chat(
+            self
+            ) -> BenchmarkResult:
+        start = time.perf_counter()
+        for chat_id in self.chat_ids:
+            self.chat_handler.load_chat(chat_id)
+        return BenchmarkResult(
+                "load_chat", len(self.chat_ids), time.perf_counter() - start
+        )
+
+    def bench_search(
+            self,
+            queries: int = 50
+            ) -> BenchmarkResult:
+        """
+        Search for words taken from random generated chats.
+        """
+
+        terms = []
+        for _ in range(queries):
+            messages = self.chat_handler.load_chat(
+                    self.random.choice(self.chat_ids)
+            )
+            words = self.random.choice(messages)["content"].split()
+            terms.append(self.random.choice(words) if words else "a")
+
+        start = time.perf_counter()
+        for term in terms:
+            self.chat_handler.search(term, limit=self.sidebar_size)
+        return BenchmarkResult(
+                "search", len(terms), time.perf_counter() - start
+        )
+
+    def bench_delete_chat(
+            self
+            ) -> BenchmarkResult:
+        start = time.perf_counter()
+        for chat_id in self.chat_ids:
+            self.chat_handler.delete_chat(chat_id)
+        result = BenchmarkResult(
+                "delete_chat", len(self.chat_ids), time.perf_counter() - start
+        )
+        self.chat_ids = []
+        return result
+
+    def run(
+            self
+            ) -> List[BenchmarkResult]:
+        """
+        Run every benchmark. delete_chat runs last as it empties the store.
+        """
+
+        results = [self.generate_chats(), self.bench_list_chats()]
+        results.append(self.bench_sidebar_snippets())
+        results.extend(self.bench_append())
+        results.append(self.bench_load_chat())
+        if self.chat_ids:
+            results.append(self.bench_search())
+        results.append(self.bench_delete_chat())
+        return results
+
+    @staticmethod
+    def report(
+            results: List[BenchmarkResult]
+            ) -> str:
+        """
+        Format results as a plain-text table.
+        """
+
+        width = max(len(result.operation) for result in results)
+        lines = [
+                f"{'operation':<{width}}  {'ops':>7}  {'seconds':>9}  "
+                f"{'ops/sec':>10}  {'bytes written':>14}"
+        ]
+        for result in results:
+            lines.append(
+                    f"{result.operation:<{width}}  {result.operations:>7}  "
+                    f"{result.seconds:>9.4f}  {result.ops_per_second:>10.1f}  "
+                    f"{result.bytes_written:>14}"
+            )
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--message-length", type=int, default=400)
+    parser.add_argument("--sidebar-size", type=int, default=25)
+    parser.add_argument(
+            "--history-lengths", type=int, nargs="+", default=[10, 100, 1000]
+    )
+    parser.add_argument("--appends", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+            "--directory",
+            default=None,
+            help="Directory for the generated chats. Defaults to a temporary "
+                 "directory that is removed afterwards."
+    )
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp(prefix="chat_store_")
+    try:
+        benchmark = ChatStoreBenchmark(
+                directory,
+                num_chats=args.chats,
+                num_messages=args.messages,
+                message_length=args.message_length,
+                sidebar_size=args.sidebar_size,
+                history_lengths=args.history_lengths,
+                appends=args.appends,
+                seed=args.seed
+        )
+        print(ChatStoreBenchmark.report(benchmark.run()))
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
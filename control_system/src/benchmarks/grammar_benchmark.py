@@ -0,0 +1,137 @@
+"""
+Grammar cache benchmark for constrained generation with llama.cpp.
+
+Generates a JSON Schema with the given number of properties and measures
+constrained generation with a cold grammar cache, cleared before every
+request, against a warm one. Without --model-path only grammar compilation
+is measured. Run from the ``src`` directory:
+
+    python -m benchmarks.grammar_benchmark --properties 40 \\
+        --model-path model.gguf --requests 10
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List, Optional
+
+from backend.llamacpp.grammar_cache import GrammarCache, grammar_cache
+from backend.llamacpp.llamacpp_backend import LlamaCPPBackend
+from backend.llamacpp.llamacpp_parameters import (
+    LlamaCPPCompletionParameters
+)
+from benchmarks.chat_store_benchmark import BenchmarkResult, \
+    ChatStoreBenchmark
+
+
+def generate_schema(
+        properties: int
+) -> Dict[str, Any]:
+    """
+    Generate an object schema with properties of mixed types.
+    """
+
+    types = [
+            {"type": "string"},
+            {"type": "integer"},
+            {"type": "boolean"},
+            {"type": "array", "items": {"type": "number"}},
+            {"enum": ["low", "medium", "high"]},
+    ]
+    names = [f"field_{i}" for i in range(properties)]
+    return {
+            "type"      : "object",
+            "properties": {
+                    name: types[i % len(types)] for i, name in enumerate(names)
+            },
+            "required"  : names,
+    }
+
+
+def bench_compile(
+        schema: Dict[str, Any],
+        repeat: int
+) -> List[BenchmarkResult]:
+    """
+    Measure compiling the schema with a cold cache and a warm one.
+    """
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        GrammarCache().get(schema)
+    cold = BenchmarkResult(
+            "compile cold", repeat, time.perf_counter() - start
+    )
+
+    cache = GrammarCache()
+    cache.get(schema)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        cache.get(schema)
+    warm = BenchmarkResult(
+            "compile warm", repeat, time.perf_counter() - start
+    )
+    return [cold, warm]
+
+
+def bench_generation(
+        model_path: str,
+        schema: Dict[str, Any],
+        requests: int,
+        max_tokens: int,
+        n_ctx: int
+) -> List[BenchmarkResult]:
+    """
+    Measure constrained completions with a cold cache and a warm one. The
+    bytes column holds the generated tokens.
+    """
+
+    backend = LlamaCPPBackend()
+    backend.load_model({
+            "model_path": model_path, "n_ctx": n_ctx, "verbose": False
+    })
+    snapshot = LlamaCPPCompletionParameters().snapshot().with_overrides({
+            "grammar": schema, "max_tokens": max_tokens, "temperature": 0.0,
+    })
+    prompt = "Fill in the JSON object for a sample record:\n"
+
+    results = []
+    for name, cold in (("generate cold", True), ("generate warm", False)):
+        tokens = 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            if cold:
+                grammar_cache.clear()
+                LlamaCPPBackend.prepare_parameters.cache_clear()
+            parameters = LlamaCPPBackend.prepare_parameters(snapshot)
+            text = backend.generate_completion(prompt, parameters)
+            tokens += backend.count_tokens(text)
+        results.append(BenchmarkResult(
+                name, requests, time.perf_counter() - start, tokens
+        ))
+    return results
+
+
+def main(
+        argv: Optional[List[str]] = None
+):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--properties", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--model-path", default=None)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--n-ctx", type=int, default=2048)
+    args = parser.parse_args(argv)
+
+    schema = generate_schema(args.properties)
+    results = bench_compile(schema, args.repeat)
+    if args.model_path:
+        results.extend(bench_generation(
+                args.model_path, schema, args.requests, args.max_tokens,
+                args.n_ctx
+        ))
+    print(ChatStoreBenchmark.report(results))
+
+
+if __name__ == "__main__":
+    main()
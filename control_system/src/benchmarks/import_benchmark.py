@@ -0,0 +1,112 @@
+"""
+Import-time benchmark for the backend registry.
+
+Compares a cold start that imports every backend module up front (the old
+ChatInterface behaviour) against the lazy registry, which imports only the
+selected backend. Each sample runs in a fresh interpreter. Run from the
+``src`` directory:
+
+    python -m benchmarks.import_benchmark --repeat 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+from backend.backend_registry import BACKENDS
+
+
+SRC_DIRECTORY = Path(__file__).resolve().parent.parent
+
+EAGER_MODULES = [
+        "backend.network.network_backend",
+        "backend.llamacpp.llamacpp_backend",
+        "backend.transformers.transformers_backend",
+]
+
+# The child reports wall time and peak RSS for its imports as JSON. Modules
+# whose dependencies are not installed are reported instead of failing.
+CHILD_TEMPLATE = """
+import importlib, json, resource, time
+start = time.perf_counter()
+missing = []
+{body}
+seconds = time.perf_counter() - start
+max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"seconds": seconds, "max_rss_kb": max_rss_kb,
+                  "missing": missing}}))
+"""
+
+EAGER_BODY = """
+import backend.backend_registry
+for module in {modules!r}:
+    try:
+        importlib.import_module(module)
+    except ImportError as e:
+        missing.append(str(e))
+"""
+
+LAZY_BODY = """
+from backend.backend_registry import load_backend_class
+try:
+    load_backend_class({backend!r})
+except ImportError as e:
+    missing.append(str(e))
+"""
+
+
+def run_child(
+        body: str
+        ) -> Dict:
+    code = CHILD_TEMPLATE.format(body=body)
+    output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=SRC_DIRECTORY,
+            capture_output=True,
+            text=True,
+            check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(
+        body: str,
+        repeat: int
+        ) -> Dict:
+    samples: List[Dict] = [run_child(body) for _ in range(repeat)]
+    return {
+            "seconds"   : statistics.median(s["seconds"] for s in samples),
+            "max_rss_kb": statistics.median(s["max_rss_kb"] for s in samples),
+            "missing"   : samples[-1]["missing"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = [("eager (all backends)",
+             measure(EAGER_BODY.format(modules=EAGER_MODULES), args.repeat))]
+    for backend in BACKENDS:
+        rows.append(
+                (f"lazy ({backend})",
+                 measure(LAZY_BODY.format(backend=backend), args.repeat))
+        )
+
+    print(f"{'cold start':<22}  {'seconds':>9}  {'peak RSS (MB)':>14}")
+    for name, result in rows:
+        print(
+                f"{name:<22}  {result['seconds']:>9.3f}  "
+                f"{result['max_rss_kb'] / 1024:>14.1f}"
+        )
+        for error in result["missing"]:
+            print(f"{'':<24}not installed: {error}")
+
+
+if __name__ == "__main__":
+    main()
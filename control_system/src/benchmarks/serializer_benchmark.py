@@ -0,0 +1,171 @@
+"""
+JSON serializer benchmark.
+
+Measures loading and saving a generated chat with FileManager using each
+installed JSON serializer, with the text-mode json module FileManager used
+before as the baseline. Run from the ``src`` directory:
+
+    python -m benchmarks.serializer_benchmark --messages 1000 --repeat 20
+"""
+
+import argparse
+import json
+import random
+import shutil
+import string
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from benchmarks.chat_store_benchmark import BenchmarkResult, \
+    ChatStoreBenchmark
+from utils.file_manager import FileManager
+from utils.json_serializer import SERIALIZERS
+
+
+class SerializerBenchmark:
+    """
+    Benchmarks FileManager.load_json and save_json per serializer.
+
+    Methods:
+        generate_chat: Generate the messages of a chat.
+        bench_baseline: Measure text-mode json load and save.
+        bench_serializer: Measure load and save with a serializer.
+        run: Run every benchmark.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            num_messages: int,
+            message_length: int = 400,
+            repeat: int = 20,
+            seed: int = 0
+            ) -> None:
+        self.directory = Path(directory)
+        self.num_messages = num_messages
+        self.message_length = message_length
+        self.repeat = repeat
+        self.random = random.Random(seed)
+        self.messages = self.generate_chat()
+
+    def generate_chat(
+            self
+            ) -> List[dict]:
+        """
+        Generate chat messages of random words, alternating user and
+        assistant.
+        """
+
+        alphabet = string.ascii_lowercase + " " * 6 + "é"
+        return [
+                {
+                        "role"   : "user" if i % 2 == 0 else "assistant",
+                        "content": "".join(self.random.choices(
+                                alphabet, k=self.message_length
+                        ))
+                }
+                for i in range(self.num_messages)
+        ]
+
+    def _time(
+            self,
+            operation: str,
+            function: Callable[[], None],
+            path: Path = None
+            ) -> BenchmarkResult:
+        start = time.perf_counter()
+        for _ in range(self.repeat):
+            function()
+        seconds = time.perf_counter() - start
+        size = path.stat().st_size * self.repeat if path else 0
+        return BenchmarkResult(operation, self.repeat, seconds, size)
+
+    def bench_baseline(
+            self
+            ) -> List[BenchmarkResult]:
+        """
+        Measure writing and reading the chat with json in text mode.
+        """
+
+        path = self.directory / "baseline.json"
+
+        def save():
+            with open(path, "w") as file:
+                json.dump(self.messages, file)
+
+        def load():
+            with open(path, "r") as file:
+                json.load(file)
+
+        return [
+                self._time("save text json", save, path),
+                self._time("load text json", load),
+        ]
+
+    def bench_serializer(
+            self,
+            name: str
+            ) -> List[BenchmarkResult]:
+        """
+        Measure FileManager.save_json and load_json with a serializer.
+        """
+
+        filename = f"{name}.json"
+        FileManager.set_serializer(name)
+
+        def save():
+            FileManager.save_json(self.directory, filename, self.messages)
+
+        def load():
+            FileManager.load_json(self.directory, filename)
+
+        return [
+                self._time(
+                        f"save {name}", save, self.directory / filename
+                ),
+                self._time(f"load {name}", load),
+        ]
+
+    def run(
+            self
+            ) -> List[BenchmarkResult]:
+        """
+        Run the baseline and every installed serializer.
+        """
+
+        serializer = FileManager.serializer
+        try:
+            results = self.bench_baseline()
+            for name in SERIALIZERS:
+                results.extend(self.bench_serializer(name))
+        finally:
+            FileManager.serializer = serializer
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--message-length", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="serializer_")
+    try:
+        benchmark = SerializerBenchmark(
+                directory,
+                num_messages=args.messages,
+                message_length=args.message_length,
+                repeat=args.repeat,
+                seed=args.seed
+        )
+        print(ChatStoreBenchmark.report(benchmark.run()))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import gzip
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ChatArchive:
+    """
+    Compressed storage for chats that are no longer used.
+
+    Each chat is compressed on its own, as a zstd frame when zstandard is
+    installed and a gzip member otherwise, and appended to a segment file.
+    An SQLite index holds the segment, offset and length of every chat, so
+    loading a chat reads and decompresses only that chat. Segments are
+    closed once they reach segment_size bytes.
+
+    Attributes:
+        directory (Path): Directory of the segments and index.
+        segment_size (int): Size in bytes at which a new segment is started.
+        codec (str): Codec of newly archived chats, "zstd" or "gzip".
+
+    Methods:
+        add: Archive the JSON bytes of a chat.
+        read: Return the JSON bytes of an archived chat.
+        remove: Remove a chat from the archive.
+        chat_ids: Return the IDs of the archived chats.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id TEXT PRIMARY KEY,
+            segment TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            codec TEXT NOT NULL
+        );
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            segment_size: int = 64 * 1024 * 1024
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.codec = "zstd" if zstandard is not None else "gzip"
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+                str(self.directory / "index.sqlite3"), check_same_thread=False
+        )
+        with self._connection:
+            self._connection.executescript(self.SCHEMA)
+
+    def close(
+            self
+    ) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _compress(
+            self,
+            data: bytes
+    ) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    @staticmethod
+    def _decompress(
+            data: bytes,
+            codec: str
+    ) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError(
+                        "zstandard is needed to read chats archived with zstd."
+                )
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def _current_segment(
+            self
+    ) -> Path:
+        """
+        Returns the segment to append to: the newest segment of the codec,
+        or a new one once it is full.
+        """
+
+        extension = "zst" if self.codec == "zstd" else "gz"
+        segments = sorted(self.directory.glob(f"segment-*.{extension}"))
+        if segments and segments[-1].stat().st_size < self.segment_size:
+            return segments[-1]
+
+        number = len(list(self.directory.glob("segment-*"))) + 1
+        return self.directory / f"segment-{number:05d}.{extension}"
+
+    def add(
+            self,
+            chat_id: str,
+            data: bytes
+    ) -> None:
+        """
+        Archive the JSON bytes of a chat, replacing an archived copy.
+
+        Args:
+            chat_id (str): The ID of the chat.
+            data (bytes): The chat file contents.
+        """
+
+        compressed = self._compress(data)
+
+        with self._lock:
+            segment = self._current_segment()
+            with open(segment, "ab") as f:
+                offset = f.tell()
+                f.write(compressed)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # Only indexed once the chat is on disk
+            with self._connection:
+                self._connection.execute(
+                        "INSERT OR REPLACE INTO chats VALUES (?, ?, ?, ?, ?)",
+                        (chat_id, segment.name, offset, len(compressed),
+                         self.codec)
+                )
+
+    def read(
+            self,
+            chat_id: str
+    ) -> Optional[bytes]:
+        """
+        Return the JSON bytes of an archived chat.
+
+        Args:
+            chat_id (str): The ID of the chat.
+
+        Returns:
+            bytes: The chat file contents, or None if it is not archived.
+        """
+
+        with self._lock:
+            row = self._connection.execute(
+                    "SELECT segment, offset, length, codec FROM chats "
+                    "WHERE chat_id = ?",
+                    (chat_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        segment, offset, length, codec = row
+        with open(self.directory / segment, "rb") as f:
+            f.seek(offset)
+            return self._decompress(f.read(length), codec)
+
+    def remove(
+            self,
+            chat_id: str
+    ) -> bool:
+        """
+        Remove a chat from the archive. Its bytes stay in the segment.
+
+        Args:
+            chat_id (str): The ID of the chat.
+
+        Returns:
+            bool: Whether the chat was archived.
+        """
+
+        with self._lock, self._connection:
+            return self._connection.execute(
+                    "DELETE FROM chats WHERE chat_id = ?", (chat_id,)
+            ).rowcount > 0
+
+    def chat_ids(
+            self
+    ) -> List[str]:
+        with self._lock:
+            return [
+                    chat_id for (chat_id,) in self._connection.execute(
+                            "SELECT chat_id FROM chats"
+                    )
+            ]
@@ -1,7 +1,27 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
 import uuid
-from typing import Any, List
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, List
 
+from chat_archive import ChatArchive
+from chat_search_index import ChatSearchIndex, SearchResult
+from chat_view import (
+    LazyChatView,
+    encode_messages,
+    file_signature,
+    write_index
+)
 from utils.file_manager import FileManager
+from utils.io_executor import io_executor
+from utils.logger import Logger
+
+
+logger = Logger(__name__)
 
 
 class ChatHandler:
@@ -11,36 +31,140 @@ class ChatHandler:
 
     def __init__(
             self,
-            save_directory: str
+            save_directory: str,
+            index_path: str = None,
+            embedder: Callable[[List[str]], List[List[float]]] = None,
+            vector_directory: str = None,
+            archive_directory: str = None
             ) -> None:
         """
         Initialize the chatManager with a directory for chats.
 
+        Args:
+            save_directory (str): Directory of the chat files.
+            index_path (str, optional): Path of the search index database.
+                Defaults to search_index.sqlite3 in the save directory.
+            embedder (callable, optional): Embeds a list of texts, such as
+                ModelHandler.embed of an embedding-mode model. Messages are
+                only embedded if it is set.
+            vector_directory (str, optional): Directory of the vector index.
+                Defaults to vectors in the save directory.
+            archive_directory (str, optional): Directory of the archived
+                chats. Defaults to archive in the save directory.
+
         Methods:
             load_chat: Load a chat.
             save_chat: Save a chat.
             delete_chat: Delete a chat.
             append_and_save_message: Append a message to a chat and save it.
+            append_and_save_messages: Append messages to a chat and save it.
+            queue_messages: Append messages to a chat in the background.
+            aload_chat: Load a chat on the I/O threads.
+            aappend_message: Append a message in the background.
+            archive_chats: Archive the chats untouched for some days.
+            chat_view: Open a lazy view of the messages of a chat.
             create_chat_id: Create a new chat ID.
             list_chats: List all chats.
             get_chat_snippet: Get a snippet of a chat.
+            search: Search the messages of all chats.
+            rebuild_search_index: Index every saved chat.
+            semantic_search: Find messages similar to a text.
+            find_related_chats: Find chats similar to a chat.
+            rebuild_vector_index: Embed every saved chat.
         """
 
         self.save_directory = save_directory
         self._create_save_directory()
 
+        self.archive = ChatArchive(
+                archive_directory or str(Path(save_directory) / "archive")
+        )
+
+        self.search_index = ChatSearchIndex(
+                index_path
+                or str(Path(save_directory) / "search_index.sqlite3")
+        )
+        # Index chats saved before the index existed
+        if self.search_index.is_empty():
+            self.rebuild_search_index()
+
+        self.embedder = embedder
+        self.vector_index = None
+        if embedder is not None:
+            # numpy is only needed for semantic search
+            from chat_vector_index import ChatVectorIndex
+
+            self.vector_index = ChatVectorIndex(
+                    vector_directory or str(Path(save_directory) / "vectors")
+            )
+
+        # Messages waiting for a background append, by chat
+        self._append_buffer = {}
+        self._append_futures = {}
+        self._append_lock = threading.Lock()
+
     def _create_save_directory(
             self
             ):
         with FileManager() as fm:
             fm.create_directory(self.save_directory)
 
+    @staticmethod
+    def check_chat_id(
+            chat_id: str
+            ) -> str:
+        """
+        Returns the chat ID, rejecting IDs that could name a file outside
+        the save directory.
+
+        Raises:
+            ValueError: If the ID is empty or holds a path separator or "..".
+        """
+        if not isinstance(chat_id, str) or not chat_id or ".." in chat_id \
+                or any(separator in chat_id for separator in "/\\\0"):
+            raise ValueError(f"Invalid chat ID: {chat_id!r}")
+        return chat_id
+
+    def _chat_filename(
+            self,
+            chat_id: str
+            ) -> str:
+        return f"{self.check_chat_id(chat_id)}.json"
+
+    def _index_filename(
+            self,
+            chat_id: str
+            ) -> str:
+        return f".{self.check_chat_id(chat_id)}.idx"
+
+    def _io_key(
+            self,
+            chat_id: str
+            ) -> str:
+        return str(Path(self.save_directory) / self._chat_filename(chat_id))
+
     def load_chat(
             self,
             chat_id: str
             ) -> Any:
         """
-        Load a chat.
+        Load a chat, after its queued background writes.
+
+        Args:
+            chat_id (str): The ID of the chat to load.
+
+        Returns:
+            Any: The data from the chat.
+        """
+        io_executor.wait(self._io_key(chat_id))
+        return self._read_chat(chat_id)
+
+    async def aload_chat(
+            self,
+            chat_id: str
+            ) -> Any:
+        """
+        Load a chat on the I/O threads, after its queued background writes.
 
         Args:
             chat_id (str): The ID of the chat to load.
@@ -48,11 +172,68 @@ class ChatHandler:
         Returns:
             Any: The data from the chat.
         """
+        return await io_executor.run(
+                self._io_key(chat_id), self._read_chat, chat_id
+        )
+
+    def _read_chat(
+            self,
+            chat_id: str
+            ) -> Any:
         with FileManager() as file_manager:
-            return file_manager.load_json(
+            messages = file_manager.load_json(
                     self.save_directory,
-                    f"{chat_id}.json"
+                    self._chat_filename(chat_id)
             )
+            if not messages:
+                archived = self.archive.read(chat_id)
+                if archived is not None:
+                    return file_manager.serializer.loads(archived)
+            return messages
+
+    def _index_path(
+            self,
+            chat_id: str
+            ) -> str:
+        return str(Path(self.save_directory) / self._index_filename(chat_id))
+
+    def _write_chat(
+            self,
+            chat_id: str,
+            messages: List[Any]
+            ) -> None:
+        """
+        Saves a chat with the index used by chat_view.
+        """
+        data, spans = encode_messages(messages)
+        FileManager.save_bytes(
+                self.save_directory, self._chat_filename(chat_id), data
+        )
+        write_index(
+                self._index_path(chat_id),
+                file_signature(os.stat(self._io_key(chat_id))),
+                spans
+        )
+
+    def chat_view(
+            self,
+            chat_id: str
+            ) -> LazyChatView:
+        """
+        Open a lazy view of the messages of a chat, after its queued
+        background writes. Only the messages read from the view are decoded.
+
+        Args:
+            chat_id (str): The ID of the chat.
+
+        Returns:
+            LazyChatView: The view, to be closed after use.
+        """
+        io_executor.wait(self._io_key(chat_id))
+        path = self._io_key(chat_id)
+        if os.path.exists(path):
+            return LazyChatView(path, self._index_path(chat_id))
+        return LazyChatView(data=self.archive.read(chat_id))
 
     def save_chat(
             self,
@@ -66,12 +247,13 @@ class ChatHandler:
             chat_id (str): The ID of the chat to save.
             messages (Any): The messages to save.
         """
-        with FileManager() as file_manager:
-            file_manager.save_json(
-                    self.save_directory,
-                    f"{chat_id}.json",
-                    messages
-            )
+        io_executor.wait(self._io_key(chat_id))
+        filename = self._chat_filename(chat_id)
+        with FileManager.lock(self.save_directory, filename):
+            self._write_chat(chat_id, messages)
+            self.archive.remove(chat_id)
+        self._update_index(self.search_index.index_chat, chat_id, messages)
+        self._update_vectors(chat_id, messages, replace=True)
 
     def delete_chat(
             self,
@@ -83,8 +265,18 @@ class ChatHandler:
         Args:
             chat_id (str): The ID of the chat to delete.
         """
-        with FileManager() as file_manager:
-            file_manager.delete_file(self.save_directory, f"{chat_id}.json")
+        io_executor.wait(self._io_key(chat_id))
+        filename = self._chat_filename(chat_id)
+        # Under the lock, so a concurrent append cannot bring the chat back
+        with FileManager.lock(self.save_directory, filename):
+            FileManager.delete_file(self.save_directory, filename)
+            FileManager.delete_file(
+                    self.save_directory, self._index_filename(chat_id)
+            )
+            self.archive.remove(chat_id)
+        self._update_index(self.search_index.delete_chat, chat_id)
+        if self.vector_index is not None:
+            self.vector_index.delete_chat(chat_id)
 
     def append_and_save_message(
             self,
@@ -98,9 +290,94 @@ class ChatHandler:
             chat_id (str): The ID of the chat to append to.
             message (Any): The message to append.
         """
-        messages = self.load_chat(chat_id)
-        messages.append(message)
-        self.save_chat(chat_id, messages)
+        self.append_and_save_messages(chat_id, [message])
+
+    def append_and_save_messages(
+            self,
+            chat_id: str,
+            new_messages: List[Any]
+            ) -> None:
+        """
+        Append messages to a chat and save it in one write.
+
+        Args:
+            chat_id (str): The ID of the chat to append to.
+            new_messages (List[Any]): The messages to append.
+        """
+        # Locked so concurrent appends to the chat are not lost
+        filename = self._chat_filename(chat_id)
+        with FileManager.lock(self.save_directory, filename):
+            messages = self._read_chat(chat_id)
+            first_position = len(messages)
+            messages.extend(new_messages)
+            self._write_chat(chat_id, messages)
+            # A touched chat leaves the archive
+            self.archive.remove(chat_id)
+        # Only the new messages are indexed
+        for position, message in enumerate(new_messages, first_position):
+            self._update_index(
+                    self.search_index.add_message, chat_id, position, message
+            )
+        self._update_vectors(
+                chat_id, new_messages, first_position=first_position
+        )
+
+    def queue_messages(
+            self,
+            chat_id: str,
+            messages: List[Any]
+            ) -> Future:
+        """
+        Append messages to a chat on the I/O threads, without waiting.
+        Messages queued while a write is waiting are saved by that write.
+
+        Args:
+            chat_id (str): The ID of the chat to append to.
+            messages (List[Any]): The messages to append.
+
+        Returns:
+            Future: Done once the messages are saved.
+        """
+        with self._append_lock:
+            if chat_id in self._append_buffer:
+                self._append_buffer[chat_id].extend(messages)
+                return self._append_futures[chat_id]
+
+            self._append_buffer[chat_id] = list(messages)
+            future = io_executor.submit(
+                    self._io_key(chat_id), self._save_buffered, chat_id
+            )
+            self._append_futures[chat_id] = future
+            return future
+
+    def _save_buffered(
+            self,
+            chat_id: str
+            ) -> None:
+        with self._append_lock:
+            messages = self._append_buffer.pop(chat_id)
+            del self._append_futures[chat_id]
+        self.append_and_save_messages(chat_id, messages)
+
+    async def aappend_message(
+            self,
+            chat_id: str,
+            message: Any,
+            wait: bool = False
+            ) -> None:
+        """
+        Append a message to a chat on the I/O threads. The message is saved
+        in the background unless wait is set, and is seen by later loads.
+
+        Args:
+            chat_id (str): The ID of the chat to append to.
+            message (Any): The message to append.
+            wait (bool, optional): Wait until the message is saved.
+                Defaults to False.
+        """
+        future = self.queue_messages(chat_id, [message])
+        if wait:
+            await asyncio.wrap_future(future)
 
     @staticmethod
     def create_chat_id() -> str:
@@ -124,7 +401,54 @@ class ChatHandler:
 
         with FileManager() as file_manager:
             files = file_manager.list_files(self.save_directory)
-        return [file.stem for file in files if file.suffix == ".json"]
+        paths = [Path(file) for file in files]
+        chat_ids = [path.stem for path in paths if path.suffix == ".json"]
+
+        live = set(chat_ids)
+        chat_ids.extend(
+                chat_id for chat_id in self.archive.chat_ids()
+                if chat_id not in live
+        )
+        return chat_ids
+
+    def archive_chats(
+            self,
+            max_age_days: float = 30
+            ) -> int:
+        """
+        Move the chats not modified for max_age_days into the compressed
+        archive. Archived chats still load, and return to a plain file when
+        they are saved or appended to.
+
+        Args:
+            max_age_days (float, optional): Days since the last change.
+                Defaults to 30.
+
+        Returns:
+            int: The number of chats archived.
+        """
+
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        archived = 0
+        for path in Path(self.save_directory).glob("*.json"):
+            chat_id = path.stem
+            io_executor.wait(self._io_key(chat_id))
+            with FileManager.lock(self.save_directory, path.name):
+                try:
+                    if path.stat().st_mtime > cutoff:
+                        continue
+                    data = path.read_bytes()
+                except FileNotFoundError:
+                    continue
+                self.archive.add(chat_id, data)
+                FileManager.delete_file(self.save_directory, path.name)
+                FileManager.delete_file(
+                        self.save_directory, self._index_filename(chat_id)
+                )
+            archived += 1
+
+        logger.log("INFO", f"Archived {archived} chats.")
+        return archived
 
     def get_chat_snippet(
             self,
@@ -154,3 +478,176 @@ class ChatHandler:
                 return first_assistant_message['content'][:character_length]
 
         return ""
+
+    @staticmethod
+    def _update_index(
+            update,
+            *args
+    ) -> None:
+        """
+        Applies an update to the search index. A failed update is logged
+        rather than failing the chat operation.
+        """
+
+        try:
+            update(*args)
+        except sqlite3.Error as e:
+            logger.log("ERROR", f"Error updating chat search index: {e}")
+
+    def rebuild_search_index(
+            self
+    ) -> None:
+        """
+        Index every saved chat.
+        """
+
+        for chat_id in self.list_chats():
+            self._update_index(
+                    self.search_index.index_chat,
+                    chat_id,
+                    self.load_chat(chat_id)
+            )
+
+    def search(
+            self,
+            query: str,
+            limit: int = 20
+    ) -> List[SearchResult]:
+        """
+        Search the messages of all chats.
+
+        Args:
+            query (str): Words to search for.
+            limit (int, optional): Maximum number of chats. Defaults to 20.
+
+        Returns:
+            List[SearchResult]: Matching chats, best match first.
+        """
+
+        return self.search_index.search(query, limit)
+
+    def _update_vectors(
+            self,
+            chat_id: str,
+            messages: List[dict],
+            first_position: int = 0,
+            replace: bool = False
+    ) -> None:
+        """
+        Embeds messages into the vector index, if an embedder is set. A
+        failed embedding is logged rather than failing the chat operation.
+        """
+
+        if self.vector_index is None:
+            return
+
+        try:
+            if replace:
+                self.vector_index.delete_chat(chat_id)
+
+            positions, texts = [], []
+            for position, message in enumerate(messages, first_position):
+                if message.get("content"):
+                    positions.append(position)
+                    texts.append(message["content"])
+            if texts:
+                self.vector_index.add(chat_id, positions, self.embedder(texts))
+        except Exception as e:
+            logger.log("ERROR", f"Error updating chat vector index: {e}")
+
+    def rebuild_vector_index(
+            self
+    ) -> None:
+        """
+        Embed every saved chat.
+        """
+
+        for chat_id in self.list_chats():
+            self._update_vectors(
+                    chat_id, self.load_chat(chat_id), replace=True
+            )
+
+    def semantic_search(
+            self,
+            text: str,
+            k: int = 10
+    ) -> list:
+        """
+        Find messages similar in meaning to a text.
+
+        Args:
+            text (str): The text to search for.
+            k (int, optional): Maximum number of messages. Defaults to 10.
+
+        Returns:
+            List[VectorMatch]: Matching messages, most similar first, or an
+            empty list without an embedder.
+        """
+
+        if self.vector_index is None:
+            return []
+        return self.vector_index.search(self.embedder([text])[0], k)
+
+    def find_related_chats(
+            self,
+            chat_id: str,
+            k: int = 5
+    ) -> list:
+        """
+        Find chats similar in meaning to a chat.
+
+        Args:
+            chat_id (str): The ID of the chat.
+            k (int, optional): Maximum number of chats. Defaults to 5.
+
+        Returns:
+            List[VectorMatch]: Related chats, most similar first, or an empty
+            list without an embedder.
+        """
+
+        if self.vector_index is None:
+            return []
+        return self.vector_index.related_chats(chat_id, k)
+
+    def retrieve(
+            self,
+            query: str,
+            k: int = 4,
+            exclude_chat: str = None
+    ) -> List[str]:
+        """
+        Retrieve the past messages most relevant to a query, for use as
+        prompt context. Uses the vector index if an embedder is set, and the
+        full-text index otherwise.
+
+        Args:
+            query (str): The text to find context for.
+            k (int, optional): Maximum number of messages. Defaults to 4.
+            exclude_chat (str, optional): Chat whose messages are skipped,
+                usually the current chat.
+
+        Returns:
+            List[str]: The messages as "role: content", most relevant first.
+        """
+
+        if self.vector_index is None:
+            messages = self.search_index.search_messages(
+                    query, k, exclude_chat
+            )
+        else:
+            matches = self.vector_index.search(
+                    self.embedder([query])[0], k, exclude_chat
+            )
+            chats = {}
+            messages = []
+            for match in matches:
+                if match.chat_id not in chats:
+                    chats[match.chat_id] = self.load_chat(match.chat_id)
+                chat = chats[match.chat_id]
+                if match.position < len(chat):
+                    messages.append(chat[match.position])
+
+        return [
+                f"{message.get('role')}: {message.get('content')}"
+                for message in messages
+        ]
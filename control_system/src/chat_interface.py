@@ -1,30 +1,52 @@
-from pathlib import PurePath
+from functools import partial
+from pathlib import Path, PurePath
 
 import streamlit as st
 
-from backend.llamacpp.llamacpp_backend import LlamaCPPBackend
-from backend.llamacpp.llamacpp_parameters import (
-    LlamaCPPModelParameters,
-    LlamaCPPCompletionParameters
-)
-from backend.transformers.transformers_backend import TransformerBackend
-from backend.transformers.mamba_parameters import (
-    MambaModelParameters,
-    MambaGenerationParameters
-)
-from backend.model_handler import ModelHandler
-from backend.network.network_backend import NetworkBackend
-from backend.network.network_parameters import (
-    NetworkModelParameters,
-    NetworkCompletionParameters
+from backend.backend_registry import BACKENDS, load_backend_class
+from backend.model_eviction import EvictionController
+from backend.model_handler import (
+    MODEL_RELOAD,
+    PARAMETERS_APPLIED,
+    RELOAD_DEFERRED,
+    ModelHandler
 )
 from backend.parameter_handler import ParameterHandler
+from backend.tuning_store import TuningStore
 from chat_handler import ChatHandler
 from prompt_handler import PromptHandler
 from utils.file_explorer_dialog import FileExplorer as fe
 from utils.file_manager import FileManager
 
 
+@st.cache_resource
+def get_model_handler() -> ModelHandler:
+    """
+    Returns the model handler shared across script reruns, so a loaded (or
+    warming up) model outlives a single run of the page. Its model is ejected
+    by an EvictionController when idle or under memory pressure.
+    """
+
+    model_handler = ModelHandler()
+    eviction_controller = EvictionController()
+    eviction_controller.register(model_handler)
+    eviction_controller.start()
+    return model_handler
+
+
+@st.cache_resource
+def get_chat_handler(
+        save_directory: str
+) -> ChatHandler:
+    """
+    Returns the chat handler of a chat directory, shared across script
+    reruns, so its SQLite connections are opened and its search index is
+    checked once rather than on every run of the page.
+    """
+
+    return ChatHandler(save_directory)
+
+
 class ChatInterface:
     """
     Encapsulates the chat interface, providing a structured framework for
@@ -41,6 +63,10 @@ class ChatInterface:
         messages (list): List of messages in the chat.
         prompt_handler (PromptHandler): Prompt handler to handle prompts.
         model_handler (ModelHandler): Model handler to handle models.
+        use_retrieval (bool): Whether relevant messages of other chats are
+            added to prompts.
+        chat_window_size (int): Messages of an opened chat loaded at
+            first and added by each "load earlier".
 
     Methods:
         __init__(self):
@@ -75,46 +101,35 @@ class ChatInterface:
         self.file_manager = FileManager
         self.file_manager.create_directory(self.appdata_directory)
 
-        self.chat_handler = ChatHandler(f"{self.appdata_directory}/chats")
+        self.chat_handler = get_chat_handler(f"{self.appdata_directory}/chats")
 
-        self.current_chat_id = self.chat_handler.create_chat_id()
+        # Kept in the session, so reruns of the page stay on the same chat
+        if "current_chat_id" not in st.session_state:
+            st.session_state["current_chat_id"] = \
+                self.chat_handler.create_chat_id()
+        self.current_chat_id = st.session_state["current_chat_id"]
         self.messages = None
 
         self.parameter_handler = ParameterHandler(
                 f"{self.appdata_directory}/parameter_states"
         )
 
-        self.model_handler = ModelHandler()
-        self.prompt_handler = PromptHandler()
-
-        self.backends = {
-                "network"     : {
-                        "backend"          : NetworkBackend,
-                        "model_parameters" : NetworkModelParameters,
-                        "generation_method": {
-                                "generate_completion":
-                                    NetworkCompletionParameters,
-                        },
-                },
-                "llamacpp"    : {
-                        "backend"          : LlamaCPPBackend,
-                        "model_parameters" : LlamaCPPModelParameters,
-                        "generation_method": {
-                                "generate_completion":
-                                    LlamaCPPCompletionParameters,
-                        },
-                },
-                "transformers": {
-                        "backend"          : TransformerBackend,
-                        "model_parameters" : MambaModelParameters,
-                        "generation_method": {
-                                "generate": MambaGenerationParameters,
-                        }
-                },
-        }
+        self.model_handler = get_model_handler()
+        self.model_handler.tuning_store = TuningStore(
+                f"{self.appdata_directory}/tuning"
+        )
+        # Kept in the session with its token, prefix and retrieval caches
+        if "prompt_handler" not in st.session_state:
+            st.session_state["prompt_handler"] = PromptHandler()
+        self.prompt_handler = st.session_state["prompt_handler"]
+        self.use_retrieval = False
+        self.chat_window_size = 50
+
+        self.backends = BACKENDS
         self.set_backend(
-                "llamacpp", "generate_completion"
+                "llamacpp", "generate_chat_completion"
         )
+        self.preload_model()
 
     @staticmethod
     def send_message(
@@ -179,42 +194,91 @@ class ChatInterface:
         )
         st.session_state.messages = self.messages
 
-        self.chat_handler.append_and_save_message(
-                self.current_chat_id,
-                {
-                        "role"   : "user",
-                        "content": prompt
-                }
-        )
-
-        self.chat_handler.append_and_save_message(
-                self.current_chat_id,
-                {
-                        "role"   : "assistant",
-                        "content": response
-                }
+        # Saved in the background so the response shows without waiting
+        self.chat_handler.queue_messages(
+                self.current_chat_id, self.messages[-2:]
         )
 
     def update_current_chat_id(
             self
     ):
         """
-        Update the current chat id.
+        Update the current chat id, starting a new chat.
         """
-        self.current_chat_id = \
+        self.current_chat_id = st.session_state["current_chat_id"] = \
             self.chat_handler.create_chat_id()
         self.messages = []
+        self.prompt_handler.conversation_history = self.messages
         st.session_state.messages = self.messages
+        st.session_state["chat_window_start"] = 0
+
+    def open_chat(
+            self,
+            chat_id
+    ):
+        """
+        Makes a saved chat the current chat, with its last chat_window_size
+        messages as the conversation history. Called as a button callback,
+        so the page shows the chat on the rerun that follows.
+
+        Args:
+            chat_id (str): The ID of the chat.
+        """
+
+        st.session_state["current_chat_id"] = chat_id
+        st.session_state["chat_window"] = self.chat_window_size
+        self.load_chat_window(chat_id)
+
+    def load_earlier_messages(
+            self
+    ):
+        """
+        Adds chat_window_size more of the earlier messages of the current
+        chat to the conversation history.
+        """
 
-    def load_and_display_chat(
+        st.session_state["chat_window"] = \
+            st.session_state.get("chat_window", 0) + self.chat_window_size
+        self.load_chat_window(st.session_state["current_chat_id"])
+
+    def load_chat_window(
             self,
             chat_id
     ):
-        messages = self.chat_handler.load_chat(chat_id)
+        """
+        Sets the conversation history to the last chat_window messages of a
+        chat, decoding only those. The number of earlier messages is kept
+        in the session as chat_window_start.
+
+        Args:
+            chat_id (str): The ID of the chat.
+        """
+
+        with self.chat_handler.chat_view(chat_id) as view:
+            start = max(len(view) - st.session_state["chat_window"], 0)
+            messages = view.window(start)
+
+        st.session_state["chat_window_start"] = start
         self.messages = messages
+        self.prompt_handler.conversation_history = messages
         st.session_state.messages = messages
 
-        for message in messages:
+    def display_chat_window(
+            self
+    ):
+        """
+        Displays the messages of the current chat, with a button to load
+        earlier messages if only the last ones are loaded.
+        """
+
+        start = st.session_state.get("chat_window_start", 0)
+        if start:
+            st.button(
+                    f"⬆️ load earlier ({start} more)",
+                    on_click=self.load_earlier_messages,
+                    key=f"load_earlier_{self.current_chat_id}_{start}"
+            )
+        for message in self.messages:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
 
@@ -275,6 +339,7 @@ class ChatInterface:
                     key.replace("Model_", ""),
                     new_value
             )
+            self.show_model_parameter_decision()
 
         if key.startswith("Generation_"):
             self.parameter_handler.update_parameter(
@@ -284,6 +349,27 @@ class ChatInterface:
             )
         st.session_state["widget_changed"] = True
 
+    def show_model_parameter_decision(
+            self
+    ):
+        """
+        Applies changed model parameters to the loaded model, and shows
+        whether they took effect in place or need the model reloaded.
+        """
+
+        decision, keys = self.model_handler.apply_model_parameters()
+        names = ", ".join(keys)
+        if decision == PARAMETERS_APPLIED:
+            st.toast(f"Applied {names} to the loaded model.", icon="⚡")
+        elif decision == MODEL_RELOAD:
+            st.toast(f"Reloading the model for {names}.", icon="🔄")
+        elif decision == RELOAD_DEFERRED:
+            st.toast(
+                    f"The model is busy; {names} will apply once it is "
+                    f"reloaded.",
+                    icon="⏳"
+            )
+
     @staticmethod
     def if_widget_changed():
         """
@@ -316,7 +402,8 @@ class ChatInterface:
         # Extract model parameters, backend class, and generation method
         # name from the map
         model_params_class = self.backends[selected_type]["model_parameters"]
-        backend_class = self.backends[selected_type]["backend"]
+        # Imports the backend module (and its dependencies) on first use
+        backend_class = load_backend_class(selected_type)
         generation_params_class = \
             self.backends[
                 selected_type]["generation_method"][generation_method
@@ -324,9 +411,15 @@ class ChatInterface:
 
         self.parameter_handler.generation_parameters = \
             generation_params_class()
-
-        # Instantiate backend and model parameters
-        self.model_handler.backend = backend_class()
+        self.model_handler.generation_parameters = \
+            self.parameter_handler.generation_parameters
+
+        # Instantiate backend, keeping a loaded model if the backend type is
+        # unchanged across reruns, and model parameters
+        if not isinstance(self.model_handler.backend, backend_class):
+            self.model_handler.eject_model()
+            self.model_handler.backend = backend_class()
+            self.model_handler.warmup = None
         self.parameter_handler.model_parameters = model_params_class()
         self.model_handler.model_parameters = \
             self.parameter_handler.model_parameters
@@ -334,6 +427,94 @@ class ChatInterface:
         # Store generation_method for future reference (if needed)
         self.model_handler.generation_method = generation_method
 
+    def configure_prompt_budget(
+            self
+    ):
+        """
+        Sizes the prompt history to the model context, counting tokens with
+        the active backend's tokenizer, and renders prompts with the model's
+        chat template.
+        """
+
+        self.prompt_handler.set_token_counter(self.model_handler.count_tokens)
+        self.prompt_handler.set_token_budget(*self.model_handler.token_budget())
+        self.prompt_handler.set_chat_template(
+                self.model_handler.chat_template
+        )
+        self.configure_retrieval()
+
+    def configure_retrieval(
+            self
+    ):
+        """
+        Sets the prompt retriever to search the other saved chats, or
+        removes it when retrieval is off. The retriever, and so its cached
+        results, is kept while the current chat stays the same. The chat it
+        was set for is kept in the session with the prompt handler.
+        """
+
+        # The toggle is rendered after the chat input, so its state is read
+        # from the session rather than from the widget's return value
+        self.use_retrieval = st.session_state.get("use_retrieval", False)
+        if not self.use_retrieval:
+            st.session_state["retrieval_chat_id"] = None
+            self.prompt_handler.set_retriever(None)
+        elif st.session_state.get("retrieval_chat_id") != \
+                self.current_chat_id:
+            st.session_state["retrieval_chat_id"] = self.current_chat_id
+            self.prompt_handler.set_retriever(
+                    partial(
+                            self.chat_handler.retrieve,
+                            exclude_chat=self.current_chat_id
+                    )
+            )
+
+    def format_request(
+            self,
+            prompt
+    ):
+        """
+        Formats a prompt for the selected generation method: chat messages
+        for methods that apply the model's chat template, a prompt string
+        otherwise.
+
+        Args:
+            prompt (str): The user prompt.
+        """
+
+        self.configure_prompt_budget()
+        if self.model_handler.uses_chat_messages():
+            return self.prompt_handler.format_messages(prompt)
+        return self.prompt_handler.format_prompt(prompt)
+
+    def preload_model(
+            self
+    ):
+        """
+        Loads the saved parameters and, if a model is configured, loads and
+        warms it up in the background. Readiness is reported by
+        model_handler.warmup_status().
+        """
+
+        self.parameter_handler.load_parameter_group(
+                self.parameter_handler.model_parameters
+        )
+        self.parameter_handler.load_parameter_group(
+                self.parameter_handler.generation_parameters
+        )
+        self.model_handler.model_parameters = \
+            self.parameter_handler.model_parameters
+        self.model_handler.generation_parameters = \
+            self.parameter_handler.generation_parameters
+
+        model_path = self.model_handler.model_parameters.get_parameters().get(
+                "model_path"
+        )
+        if self.model_handler.is_network_backend() or (
+                model_path and Path(model_path).exists()
+        ):
+            self.model_handler.preload()
+
     @staticmethod
     def _load_css_overrides():
         return st.markdown(
@@ -0,0 +1,276 @@
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+
+@dataclass
+class SearchResult:
+    """
+    A chat matching a search.
+
+    Attributes:
+        chat_id (str): The ID of the chat.
+        snippet (str): Excerpt of the best matching message, with the
+            matched terms in bold.
+        score (float): BM25 rank, lower is better.
+    """
+
+    chat_id: str
+    snippet: str
+    score: float
+
+
+class ChatSearchIndex:
+    """
+    A full-text index over the messages of saved chats, stored in an SQLite
+    FTS5 table and ranked with BM25.
+
+    The index is maintained incrementally: appended messages are inserted,
+    saved chats are re-indexed and deleted chats are removed, so a search
+    never has to open the chat files.
+
+    Attributes:
+        database_path (str): Path of the SQLite database.
+
+    Methods:
+        add_message: Index a message appended to a chat.
+        index_chat: Re-index all messages of a chat.
+        delete_chat: Remove a chat from the index.
+        search: Return the chats that best match a query.
+        search_messages: Return the messages that best match a query.
+        is_empty: Whether no chat is indexed.
+    """
+
+    # Messages are kept in a plain table indexed by chat, so re-indexing and
+    # deleting a chat does not scan the whole index. The FTS5 table indexes
+    # their content and is kept in sync by triggers.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY,
+            chat_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            role TEXT,
+            content TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS chat_messages_chat_id
+            ON chat_messages (chat_id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+            content,
+            content = 'chat_messages',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS chat_messages_insert
+            AFTER INSERT ON chat_messages BEGIN
+                INSERT INTO messages (rowid, content)
+                VALUES (new.id, new.content);
+            END;
+        CREATE TRIGGER IF NOT EXISTS chat_messages_delete
+            AFTER DELETE ON chat_messages BEGIN
+                INSERT INTO messages (messages, rowid, content)
+                VALUES ('delete', old.id, old.content);
+            END;
+    """
+
+    def __init__(
+            self,
+            database_path: str
+    ):
+        self.database_path = database_path
+        Path(database_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+                database_path, check_same_thread=False
+        )
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+            self._connection.executescript(self.SCHEMA)
+
+    def close(
+            self
+    ) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def add_message(
+            self,
+            chat_id: str,
+            position: int,
+            message: Dict[str, Any]
+    ) -> None:
+        """
+        Index a message appended to a chat.
+
+        Args:
+            chat_id (str): The ID of the chat.
+            position (int): The index of the message in the chat.
+            message (dict): The message, with "role" and "content".
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                    "INSERT INTO chat_messages "
+                    "(chat_id, position, role, content) VALUES (?, ?, ?, ?)",
+                    (chat_id, position, message.get("role"),
+                     message.get("content") or "")
+            )
+
+    def index_chat(
+            self,
+            chat_id: str,
+            messages: Iterable[Dict[str, Any]]
+    ) -> None:
+        """
+        Replace the indexed messages of a chat.
+
+        Args:
+            chat_id (str): The ID of the chat.
+            messages (list): The messages of the chat.
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                    "DELETE FROM chat_messages WHERE chat_id = ?", (chat_id,)
+            )
+            self._connection.executemany(
+                    "INSERT INTO chat_messages "
+                    "(chat_id, position, role, content) VALUES (?, ?, ?, ?)",
+                    (
+                            (chat_id, position, message.get("role"),
+                             message.get("content") or "")
+                            for position, message in enumerate(messages)
+                    )
+            )
+
+    def delete_chat(
+            self,
+            chat_id: str
+    ) -> None:
+        """
+        Remove a chat from the index.
+
+        Args:
+            chat_id (str): The ID of the chat.
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                    "DELETE FROM chat_messages WHERE chat_id = ?", (chat_id,)
+            )
+
+    def is_empty(
+            self
+    ) -> bool:
+        with self._lock:
+            return self._connection.execute(
+                    "SELECT 1 FROM chat_messages LIMIT 1"
+            ).fetchone() is None
+
+    @staticmethod
+    def build_query(
+            query: str,
+            match_all: bool = True
+    ) -> str:
+        """
+        Turns user input into an FTS5 query matching messages that contain
+        every term, the last term as a prefix, so searches work while typing.
+        Terms are quoted, so FTS5 syntax in the input is matched literally.
+        Without match_all, messages containing any term match.
+        """
+
+        terms = [
+                '"' + term.replace('"', '""') + '"' for term in query.split()
+        ]
+        if terms and match_all:
+            terms[-1] += "*"
+        return (" " if match_all else " OR ").join(terms)
+
+    def search(
+            self,
+            query: str,
+            limit: int = 20
+    ) -> List[SearchResult]:
+        """
+        Return the chats that best match a query.
+
+        Args:
+            query (str): Words to search for.
+            limit (int): Maximum number of chats to return.
+
+        Returns:
+            list[SearchResult]: Matching chats, best match first.
+        """
+
+        match = self.build_query(query)
+        if not match:
+            return []
+
+        # Rank messages and keep each chat's best match. Fetching a few
+        # messages per chat is usually enough; fetch more when a few chats
+        # hold most of the matches.
+        fetch = limit * 4
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                        "SELECT chat_messages.chat_id, "
+                        "snippet(messages, 0, '**', '**', '…', 12), "
+                        "messages.rank "
+                        "FROM messages JOIN chat_messages "
+                        "ON chat_messages.id = messages.rowid "
+                        "WHERE messages MATCH ? "
+                        "ORDER BY messages.rank LIMIT ?",
+                        (match, fetch)
+                ).fetchall()
+
+            results = {}
+            for chat_id, snippet, score in rows:
+                if chat_id not in results:
+                    results[chat_id] = SearchResult(chat_id, snippet, score)
+            if len(results) >= limit or len(rows) < fetch:
+                return list(results.values())[:limit]
+            fetch *= 4
+
+    def search_messages(
+            self,
+            query: str,
+            limit: int = 5,
+            exclude_chat: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the messages that best match any term of a query.
+
+        Args:
+            query (str): Words to search for.
+            limit (int): Maximum number of messages to return.
+            exclude_chat (str, optional): Chat whose messages are skipped.
+
+        Returns:
+            list[dict]: Matching messages with "chat_id", "position", "role"
+            and "content", best match first.
+        """
+
+        match = self.build_query(query, match_all=False)
+        if not match:
+            return []
+
+        with self._lock:
+            rows = self._connection.execute(
+                    "SELECT chat_messages.chat_id, chat_messages.position, "
+                    "chat_messages.role, chat_messages.content "
+                    "FROM messages JOIN chat_messages "
+                    "ON chat_messages.id = messages.rowid "
+                    "WHERE messages MATCH ? "
+                    "AND chat_messages.chat_id IS NOT ? "
+                    "ORDER BY messages.rank LIMIT ?",
+                    (match, exclude_chat, limit)
+            ).fetchall()
+
+        return [
+                {"chat_id": chat_id, "position": position, "role": role,
+                 "content": content}
+                for chat_id, position, role, content in rows
+        ]
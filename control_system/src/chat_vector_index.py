@@ -0,0 +1,333 @@
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass
+class VectorMatch:
+    """
+    A message similar to a query.
+
+    Attributes:
+        chat_id (str): The ID of the chat.
+        position (int): The index of the message in the chat.
+        score (float): Cosine similarity to the query.
+    """
+
+    chat_id: str
+    position: int
+    score: float
+
+
+class ChatVectorIndex:
+    """
+    A vector index over chat messages for semantic search.
+
+    Vectors are normalised and stored as rows of a memory-mapped float32
+    matrix, so a search is one matrix-vector product over the rows in memory
+    or the page cache. The chat and message of each row are kept in SQLite.
+    Deleted rows are marked as tombstones and skipped, and compact() drops
+    them once they make up most of the matrix.
+
+    Attributes:
+        directory (Path): Directory of the matrix and row database.
+        dimension (int): Vector dimension, set by the first vector added.
+        count (int): Rows in use, including tombstones.
+
+    Methods:
+        add: Add vectors for messages of a chat.
+        delete_chat: Remove the vectors of a chat.
+        search: Return the messages most similar to a vector.
+        related_chats: Return the chats most similar to a chat.
+        compact: Drop deleted rows from the matrix.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS vectors (
+            row INTEGER PRIMARY KEY,
+            chat_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS vectors_chat_id ON vectors (chat_id);
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(
+            self,
+            directory: str
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._matrix_path = self.directory / "vectors.f32"
+
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(
+                str(self.directory / "vectors.sqlite3"),
+                check_same_thread=False
+        )
+        with self._connection:
+            self._connection.executescript(self.SCHEMA)
+
+        meta = dict(self._connection.execute("SELECT key, value FROM meta"))
+        self.dimension = meta.get("dimension")
+
+        rows = self._connection.execute(
+                "SELECT chat_id, position, deleted FROM vectors ORDER BY row"
+        ).fetchall()
+        self.count = len(rows)
+        self._chat_ids = [chat_id for chat_id, _, _ in rows]
+        self._positions = [position for _, position, _ in rows]
+        self._live = np.array([not deleted for _, _, deleted in rows], bool)
+
+        self._matrix = None
+        if self.dimension is not None:
+            self._open_matrix(max(self.count, self.INITIAL_CAPACITY))
+
+    def _open_matrix(
+            self,
+            capacity: int
+    ) -> None:
+        """
+        Maps the matrix file with room for capacity rows, growing the file
+        if needed.
+        """
+
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+
+        row_bytes = self.dimension * np.dtype(np.float32).itemsize
+        with open(self._matrix_path, "ab") as f:
+            if f.tell() < capacity * row_bytes:
+                f.truncate(capacity * row_bytes)
+        size = self._matrix_path.stat().st_size // row_bytes
+
+        self._matrix = np.memmap(
+                self._matrix_path, dtype=np.float32, mode="r+",
+                shape=(size, self.dimension)
+        )
+
+    @staticmethod
+    def _normalize(
+            vectors: np.ndarray
+    ) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def close(
+            self
+    ) -> None:
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+                self._matrix = None
+            self._connection.close()
+
+    def add(
+            self,
+            chat_id: str,
+            positions: Sequence[int],
+            vectors: Sequence[Sequence[float]]
+    ) -> None:
+        """
+        Add vectors for messages of a chat.
+
+        Args:
+            chat_id (str): The ID of the chat.
+            positions (list[int]): The index of each message in the chat.
+            vectors (list): One vector per message.
+        """
+
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32))
+        if not len(vectors):
+            return
+
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+                with self._connection:
+                    self._connection.execute(
+                            "INSERT INTO meta VALUES ('dimension', ?)",
+                            (self.dimension,)
+                    )
+                self._open_matrix(self.INITIAL_CAPACITY)
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(
+                        f"Vectors have dimension {vectors.shape[1]}, the "
+                        f"index has {self.dimension}."
+                )
+
+            start = self.count
+            end = start + len(vectors)
+            if end > len(self._matrix):
+                self._open_matrix(max(end, 2 * len(self._matrix)))
+
+            self._matrix[start:end] = vectors
+            self._matrix.flush()
+            with self._connection:
+                self._connection.executemany(
+                        "INSERT INTO vectors (row, chat_id, position) "
+                        "VALUES (?, ?, ?)",
+                        (
+                                (row, chat_id, int(position))
+                                for row, position in
+                                zip(range(start, end), positions)
+                        )
+                )
+
+            self._chat_ids.extend([chat_id] * len(vectors))
+            self._positions.extend(int(position) for position in positions)
+            self._live = np.concatenate(
+                    [self._live, np.ones(len(vectors), bool)]
+            )
+            self.count = end
+
+    def delete_chat(
+            self,
+            chat_id: str
+    ) -> None:
+        """
+        Remove the vectors of a chat. The rows become tombstones until the
+        next compact().
+
+        Args:
+            chat_id (str): The ID of the chat.
+        """
+
+        with self._lock:
+            rows = [
+                    row for (row,) in self._connection.execute(
+                            "SELECT row FROM vectors "
+                            "WHERE chat_id = ? AND deleted = 0",
+                            (chat_id,)
+                    )
+            ]
+            if not rows:
+                return
+
+            with self._connection:
+                self._connection.execute(
+                        "UPDATE vectors SET deleted = 1 WHERE chat_id = ?",
+                        (chat_id,)
+                )
+            self._live[rows] = False
+
+            if self._live.sum() < self.count // 2:
+                self.compact()
+
+    def compact(
+            self
+    ) -> None:
+        """
+        Drop deleted rows from the matrix.
+        """
+
+        with self._lock:
+            live = np.flatnonzero(self._live)
+            if len(live) == self.count:
+                return
+
+            if len(live):
+                self._matrix[:len(live)] = self._matrix[live]
+                self._matrix.flush()
+            self._chat_ids = [self._chat_ids[row] for row in live]
+            self._positions = [self._positions[row] for row in live]
+            self._live = np.ones(len(live), bool)
+            self.count = len(live)
+
+            with self._connection:
+                self._connection.execute("DELETE FROM vectors")
+                self._connection.executemany(
+                        "INSERT INTO vectors (row, chat_id, position) "
+                        "VALUES (?, ?, ?)",
+                        zip(range(self.count), self._chat_ids, self._positions)
+                )
+
+    def search(
+            self,
+            vector: Sequence[float],
+            k: int = 10,
+            exclude_chat: Optional[str] = None
+    ) -> List[VectorMatch]:
+        """
+        Return the messages most similar to a vector.
+
+        Args:
+            vector (list[float]): The query vector.
+            k (int): Maximum number of matches.
+            exclude_chat (str, optional): Chat whose messages are skipped.
+
+        Returns:
+            list[VectorMatch]: Matches, most similar first.
+        """
+
+        with self._lock:
+            if self._matrix is None or not self.count:
+                return []
+
+            query = self._normalize(np.asarray(vector, dtype=np.float32))
+            scores = self._matrix[:self.count] @ query
+            scores[~self._live] = -np.inf
+            if exclude_chat is not None:
+                scores[[
+                        row for row, chat_id in enumerate(self._chat_ids)
+                        if chat_id == exclude_chat
+                ]] = -np.inf
+
+            k = min(k, self.count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [
+                    VectorMatch(
+                            self._chat_ids[row],
+                            self._positions[row],
+                            float(scores[row])
+                    )
+                    for row in top if np.isfinite(scores[row])
+            ]
+
+    def related_chats(
+            self,
+            chat_id: str,
+            k: int = 5
+    ) -> List[VectorMatch]:
+        """
+        Return the chats most similar to a chat, by the mean of its message
+        vectors. Each chat is returned once, with its most similar message.
+
+        Args:
+            chat_id (str): The ID of the chat.
+            k (int): Maximum number of chats.
+
+        Returns:
+            list[VectorMatch]: Related chats, most similar first.
+        """
+
+        with self._lock:
+            rows = [
+                    row for row, (row_chat, live) in
+                    enumerate(zip(self._chat_ids, self._live))
+                    if row_chat == chat_id and live
+            ]
+            if not rows:
+                return []
+            centroid = self._matrix[rows].mean(axis=0)
+
+            # Fetch a few messages per chat to find k distinct chats
+            matches = self.search(centroid, k * 4, exclude_chat=chat_id)
+
+        related = {}
+        for match in matches:
+            related.setdefault(match.chat_id, match)
+        return list(related.values())[:k]
@@ -0,0 +1,246 @@
+import mmap
+import os
+import re
+from array import array
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+from utils.file_manager import FileManager
+
+
+# A JSON string, or a bracket or comma outside strings
+_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{},]', re.DOTALL)
+
+_OPENING = frozenset(b"[{")
+_CLOSING = frozenset(b"]}")
+
+
+def index_messages(
+        data: Union[bytes, mmap.mmap]
+) -> array:
+    """
+    Finds the byte span of every element of a JSON array of messages.
+
+    Args:
+        data (bytes): The JSON array.
+
+    Returns:
+        array: Start and end offsets of each message, interleaved.
+    """
+
+    spans = array("Q")
+    depth = 0
+    start = end = None
+
+    for match in _TOKEN.finditer(data):
+        position = match.start()
+        character = data[position]
+        if isinstance(character, bytes):
+            character = character[0]
+
+        if character in _OPENING:
+            if depth == 1 and start is None:
+                start = position
+            depth += 1
+        elif character in _CLOSING:
+            depth -= 1
+            if depth == 0:
+                if start is not None:
+                    spans.extend((start, end))
+                break
+            if depth == 1:
+                end = match.end()
+        elif character == ord(","):
+            if depth == 1 and start is not None:
+                spans.extend((start, end))
+                start = None
+        elif depth == 1:
+            # A string element
+            start, end = position, match.end()
+
+    return spans
+
+
+def encode_messages(
+        messages: Sequence[Any]
+) -> Tuple[bytes, array]:
+    """
+    Serializes messages as a JSON array and indexes them as it goes.
+
+    Returns:
+        tuple: The JSON bytes and the spans of the messages.
+    """
+
+    parts = [FileManager.serializer.dumps(message) for message in messages]
+    spans = array("Q")
+    position = 1
+    for part in parts:
+        spans.extend((position, position + len(part)))
+        position += len(part) + 1
+    return b"[" + b",".join(parts) + b"]", spans
+
+
+def file_signature(
+        stat: os.stat_result
+) -> Tuple[int, int, int]:
+    """
+    Returns the size, modification time and inode of a file, which an index
+    is stored with. Chats are saved by replacing the file, so a rewrite of
+    the same size within the timestamp resolution still changes the inode.
+    """
+
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def write_index(
+        index_path: str,
+        signature: Tuple[int, int, int],
+        spans: array
+) -> None:
+    """
+    Saves the index of a chat file with the file_signature of the file.
+    """
+
+    index = array("Q", signature)
+    index.extend(spans)
+    FileManager.save_bytes(
+            os.path.dirname(index_path) or ".",
+            os.path.basename(index_path),
+            index.tobytes()
+    )
+
+
+class LazyChatView:
+    """
+    A read-only view of the messages of a chat that decodes only the
+    messages asked for.
+
+    The chat file is memory-mapped, and a sidecar index holds the byte span
+    of every message, so showing the last messages of a long chat costs the
+    same as showing a short one. The index is stored with the size,
+    modification time and inode of the file it describes, and is rebuilt by
+    scanning the file when it is missing or stale.
+
+    Attributes:
+        path (str): The chat file, or None for a view of bytes.
+
+    Methods:
+        window: Return the messages in a range.
+        tail: Return the last messages.
+        close: Unmap the chat file.
+    """
+
+    def __init__(
+            self,
+            path: Optional[str] = None,
+            index_path: Optional[str] = None,
+            data: Optional[bytes] = None
+    ):
+        """
+        Args:
+            path (str, optional): The chat file to map.
+            index_path (str, optional): The sidecar index of the file.
+            data (bytes, optional): The chat JSON, for chats without a file
+                such as archived chats.
+        """
+
+        self.path = path
+        self._file = None
+        self._data = data if data is not None else b""
+
+        if path is not None and os.path.getsize(path):
+            self._file = open(path, "rb")
+            self._data = mmap.mmap(
+                    self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+
+        self._spans = self._load_index(index_path)
+
+    def _load_index(
+            self,
+            index_path: Optional[str]
+    ) -> array:
+        if self._file is None:
+            return index_messages(self._data)
+
+        # The mapped file, even if the path has been replaced since
+        signature = file_signature(os.fstat(self._file.fileno()))
+        if index_path is not None and os.path.exists(index_path):
+            index = array("Q")
+            with open(index_path, "rb") as f:
+                index.frombytes(f.read())
+            if tuple(index[:len(signature)]) == signature:
+                return index[len(signature):]
+
+        spans = index_messages(self._data)
+        if index_path is not None:
+            write_index(index_path, signature, spans)
+        return spans
+
+    def __len__(
+            self
+    ) -> int:
+        return len(self._spans) // 2
+
+    def __enter__(
+            self
+    ) -> "LazyChatView":
+        return self
+
+    def __exit__(
+            self,
+            exc_type,
+            exc_value,
+            traceback
+    ) -> None:
+        self.close()
+
+    def close(
+            self
+    ) -> None:
+        if self._file is not None:
+            self._data.close()
+            self._file.close()
+            self._file = None
+
+    def _message(
+            self,
+            i: int
+    ) -> Any:
+        start, end = self._spans[2 * i], self._spans[2 * i + 1]
+        return FileManager.serializer.loads(self._data[start:end])
+
+    def window(
+            self,
+            start: int,
+            stop: Optional[int] = None
+    ) -> List[Any]:
+        """
+        Return the messages from start up to stop, as slice bounds.
+        """
+
+        return [
+                self._message(i)
+                for i in range(*slice(start, stop).indices(len(self)))
+        ]
+
+    def tail(
+            self,
+            count: int
+    ) -> List[Any]:
+        """
+        Return the last count messages.
+        """
+
+        return self.window(max(len(self) - count, 0))
+
+    def __getitem__(
+            self,
+            key: Union[int, slice]
+    ) -> Any:
+        if isinstance(key, slice):
+            return [self._message(i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("message index out of range")
+        return self._message(key)
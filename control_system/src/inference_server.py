@@ -0,0 +1,611 @@
+import asyncio
+import contextlib
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.model_handler import ModelHandler
+from chat_handler import ChatHandler
+from prompt_handler import PromptHandler
+from utils.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class HTTPError(Exception):
+    """
+    An error returned to the client as an OpenAI style error response.
+    """
+
+    def __init__(
+            self,
+            status: int,
+            message: str,
+            error_type: str = "invalid_request_error"
+    ):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.error_type = error_type
+
+
+class InferenceServer:
+    """
+    A headless HTTP server exposing the OpenAI compatible /v1/completions and
+    /v1/chat/completions endpoints on top of a ModelHandler.
+
+    The server is built on asyncio streams, so it needs no web framework.
+    Requests beyond max_concurrency wait for a slot, and requests beyond
+    max_pending waiting requests are rejected with 503. Responses are
+    streamed as server-sent events when the request sets "stream".
+
+    Chat requests may set a "chat_id" to continue a chat saved by the
+    ChatHandler; the request and the response are then appended to it.
+
+    Attributes:
+        model_handler (ModelHandler): Handler of the served model.
+        chat_handler (ChatHandler): Handler of saved chats, optional.
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        model_name (str): Model name reported to clients.
+        max_concurrency (int): Requests generating at the same time.
+        max_pending (int): Requests waiting for a slot before new requests
+            are rejected.
+        max_body_bytes (int): Largest accepted request body.
+
+    Methods:
+        start: Start listening.
+        serve_forever: Serve until shutdown is called.
+        shutdown: Stop accepting requests and wait for running requests.
+    """
+
+    # Request fields that are not generation parameters
+    REQUEST_FIELDS = frozenset({
+            "model", "prompt", "messages", "stream", "chat_id", "n", "user",
+            "response_format",
+    })
+
+    REASONS = {
+            200: "OK",
+            400: "Bad Request",
+            404: "Not Found",
+            405: "Method Not Allowed",
+            413: "Payload Too Large",
+            500: "Internal Server Error",
+            503: "Service Unavailable",
+    }
+
+    def __init__(
+            self,
+            model_handler: ModelHandler,
+            chat_handler: Optional[ChatHandler] = None,
+            host: str = "127.0.0.1",
+            port: int = 8000,
+            model_name: str = "local",
+            max_concurrency: int = 1,
+            max_pending: int = 64,
+            max_body_bytes: int = 1 << 20
+    ):
+        self.model_handler = model_handler
+        self.chat_handler = chat_handler
+        self.host = host
+        self.port = port
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.max_body_bytes = max_body_bytes
+
+        self._server = None
+        self._slots = None
+        self._pending = 0
+        self._connections = set()
+        self._busy = set()
+        self._stopped = None
+
+    async def start(
+            self
+    ) -> None:
+        """
+        Start listening for connections.
+        """
+
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._stopped = asyncio.Event()
+        self._server = await asyncio.start_server(
+                self._handle_connection, self.host, self.port
+        )
+        # Port 0 binds a free port
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.log("INFO", f"Serving on http://{self.host}:{self.port}")
+
+    async def serve_forever(
+            self
+    ) -> None:
+        """
+        Serve requests until shutdown is called.
+        """
+
+        if self._server is None:
+            await self.start()
+        await self._stopped.wait()
+
+    async def shutdown(
+            self,
+            timeout: float = 30.0
+    ) -> None:
+        """
+        Stop accepting connections and wait up to timeout seconds for running
+        requests to finish before cancelling them.
+
+        Args:
+            timeout (float): Seconds to wait for running requests.
+        """
+
+        if self._server is not None:
+            self._server.close()
+
+        # Idle keep-alive connections are closed, running requests finish
+        for task in self._connections - self._busy:
+            task.cancel()
+        if self._busy:
+            _, running = await asyncio.wait(set(self._busy), timeout=timeout)
+            for task in running:
+                task.cancel()
+        if self._connections:
+            await asyncio.gather(*self._connections, return_exceptions=True)
+
+        if self._server is not None:
+            await self._server.wait_closed()
+        self._stopped.set()
+        logger.log("INFO", "Server stopped.")
+
+    async def _handle_connection(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            keep_alive = True
+            while keep_alive and not self._server_closing():
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._send_error(writer, e, keep_alive=False)
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._busy.add(task)
+                try:
+                    keep_alive = await self._dispatch(
+                            method, path, body, writer, keep_alive
+                    )
+                finally:
+                    self._busy.discard(task)
+        except (ConnectionError, asyncio.IncompleteReadError,
+                asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    def _server_closing(
+            self
+    ) -> bool:
+        return self._server is not None and not self._server.is_serving()
+
+    async def _read_request(
+            self,
+            reader: asyncio.StreamReader
+    ) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None  # Connection closed between requests
+        except asyncio.LimitOverrunError:
+            raise HTTPError(413, "Request headers too large.")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line.")
+
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length.")
+        if length > self.max_body_bytes:
+            raise HTTPError(413, "Request body too large.")
+        body = await reader.readexactly(length) if length else b""
+
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    async def _dispatch(
+            self,
+            method: str,
+            path: str,
+            body: bytes,
+            writer: asyncio.StreamWriter,
+            keep_alive: bool
+    ) -> bool:
+        """
+        Handles a request and returns whether to keep the connection open.
+        """
+
+        routes = {
+                "/v1/completions"     : ("POST", self._completions),
+                "/v1/chat/completions": ("POST", self._chat_completions),
+                "/v1/models"          : ("GET", self._models),
+                "/health"             : ("GET", self._health),
+        }
+
+        try:
+            if path not in routes:
+                raise HTTPError(404, f"Unknown path {path}.")
+            route_method, handler = routes[path]
+            if method != route_method:
+                raise HTTPError(405, f"Use {route_method} for {path}.")
+
+            request = {}
+            if body:
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    raise HTTPError(400, "Request body is not valid JSON.")
+                if not isinstance(request, dict):
+                    raise HTTPError(400, "Request body must be a JSON object.")
+
+            return await handler(request, writer, keep_alive)
+
+        except HTTPError as e:
+            await self._send_error(writer, e, keep_alive)
+            return keep_alive
+        except Exception as e:
+            logger.log("ERROR", f"Error handling {path}: {e}")
+            await self._send_error(
+                    writer, HTTPError(500, str(e), "server_error"), keep_alive
+            )
+            return keep_alive
+
+    async def _models(
+            self,
+            request: Dict[str, Any],
+            writer: asyncio.StreamWriter,
+            keep_alive: bool
+    ) -> bool:
+        await self._send_json(writer, 200, {
+                "object": "list",
+                "data"  : [
+                        {"id": name, "object": "model", "owned_by": "local"}
+                        for name in
+                        [self.model_name, *self.model_handler.adapter_names()]
+                ],
+        }, keep_alive)
+        return keep_alive
+
+    async def _health(
+            self,
+            request: Dict[str, Any],
+            writer: asyncio.StreamWriter,
+            keep_alive: bool
+    ) -> bool:
+        status = self.model_handler.warmup_status()
+        await self._send_json(writer, 200, {
+                "status" : status["state"],
+                "ready"  : status["ready"],
+                "pending": self._pending,
+        }, keep_alive)
+        return keep_alive
+
+    async def _completions(
+            self,
+            request: Dict[str, Any],
+            writer: asyncio.StreamWriter,
+            keep_alive: bool
+    ) -> bool:
+        prompt = request.get("prompt")
+        if isinstance(prompt, list) and len(prompt) == 1:
+            prompt = prompt[0]
+        if not isinstance(prompt, str):
+            raise HTTPError(400, "prompt must be a string.")
+
+        if self.model_handler.uses_chat_messages():
+            prompt = [{"role": "user", "content": prompt}]
+
+        return await self._respond(
+                request, prompt, writer, keep_alive,
+                object_type="text_completion",
+                choice=lambda text: {"text": text, "logprobs": None},
+                delta=lambda text: {"text": text, "logprobs": None}
+        )
+
+    async def _chat_completions(
+            self,
+            request: Dict[str, Any],
+            writer: asyncio.StreamWriter,
+            keep_alive: bool
+    ) -> bool:
+        messages = request.get("messages")
+        if not isinstance(messages, list) or not messages or not all(
+                isinstance(message, dict) and "role" in message
+                and isinstance(message.get("content"), str)
+                for message in messages
+        ):
+            raise HTTPError(
+                    400, "messages must be a list of role and content objects."
+            )
+        if messages[-1]["role"] != "user":
+            raise HTTPError(400, "The last message must be a user message.")
+
+        chat_id = self._chat_id(request)
+        history = []
+        if chat_id and self.chat_handler is not None:
+            history = await self.chat_handler.aload_chat(chat_id)
+
+        prompt = self._format_chat(history, messages)
+
+        async def save(text):
+            # Written behind the response, in one write per turn
+            if chat_id and self.chat_handler is not None:
+                self.chat_handler.queue_messages(chat_id, [
+                        {"role": "user", "content": messages[-1]["content"]},
+                        {"role": "assistant", "content": text},
+                ])
+
+        return await self._respond(
+                request, prompt, writer, keep_alive,
+                object_type="chat.completion",
+                choice=lambda text: {
+                        "message": {"role": "assistant", "content": text}
+                },
+                delta=lambda text: {"delta": {"content": text}},
+                on_complete=save
+        )
+
+    @staticmethod
+    def _chat_id(
+            request: Dict[str, Any]
+    ) -> Optional[str]:
+        """
+        Returns the chat ID of a request, which must be an ID made by
+        ChatHandler.create_chat_id, as it names the chat file.
+        """
+
+        chat_id = request.get("chat_id")
+        if chat_id is None:
+            return None
+        try:
+            valid = isinstance(chat_id, str) and \
+                str(uuid.UUID(chat_id)) == chat_id
+        except ValueError:
+            valid = False
+        if not valid:
+            raise HTTPError(400, "chat_id must be a UUID.")
+        return chat_id
+
+    def _format_chat(
+            self,
+            history: List[Dict[str, str]],
+            messages: List[Dict[str, str]]
+    ):
+        """
+        Formats chat messages for the generation method, fitting the history
+        to the model context with a PromptHandler.
+        """
+
+        system_prompt = "\n\n".join(
+                message["content"] for message in messages
+                if message["role"] == "system"
+        ) or None
+        conversation = history + [
+                {"role": message["role"], "content": message["content"]}
+                for message in messages[:-1] if message["role"] != "system"
+        ]
+
+        prompt_handler = PromptHandler(
+                system_prompt=system_prompt,
+                conversation_history=conversation,
+                token_counter=self.model_handler.count_tokens,
+                chat_template=self.model_handler.chat_template
+        )
+        prompt_handler.set_token_budget(*self.model_handler.token_budget())
+
+        if self.model_handler.uses_chat_messages():
+            return prompt_handler.format_messages(messages[-1]["content"])
+        return prompt_handler.format_prompt(messages[-1]["content"])
+
+    @staticmethod
+    def _response_grammar(
+            response_format: Any
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns the JSON Schema that constrains the output for an OpenAI
+        response_format, or None for plain text.
+        """
+
+        if response_format is None:
+            return None
+        if not isinstance(response_format, dict):
+            raise HTTPError(400, "response_format must be an object.")
+
+        format_type = response_format.get("type", "text")
+        if format_type == "text":
+            return None
+        if format_type == "json_object":
+            return {"type": "object"}
+        if format_type == "json_schema":
+            schema = (response_format.get("json_schema") or {}).get("schema")
+            if not isinstance(schema, dict):
+                raise HTTPError(400, "json_schema.schema must be an object.")
+            return schema
+        raise HTTPError(400, f"Unsupported response_format {format_type}.")
+
+    async def _respond(
+            self,
+            request: Dict[str, Any],
+            prompt,
+            writer: asyncio.StreamWriter,
+            keep_alive: bool,
+            object_type: str,
+            choice,
+            delta,
+            on_complete=None
+    ) -> bool:
+        overrides = {
+                key: value for key, value in request.items()
+                if key not in self.REQUEST_FIELDS
+        }
+        # Fine-tunes are served as models named after their adapter
+        adapter_names = self.model_handler.adapter_names()
+        if "adapter" not in overrides and \
+                request.get("model") in adapter_names:
+            overrides["adapter"] = request["model"]
+        # Unregistered names would be loaded as adapter paths
+        if overrides.get("adapter") and \
+                overrides["adapter"] not in adapter_names:
+            raise HTTPError(400, "adapter must name a served adapter.")
+        grammar = self._response_grammar(request.get("response_format"))
+        if grammar is not None:
+            overrides["grammar"] = grammar
+        response_id = f"{'chatcmpl' if 'chat' in object_type else 'cmpl'}-" \
+                      f"{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def payload(body, object_suffix=""):
+            return {
+                    "id"     : response_id,
+                    "object" : object_type + object_suffix,
+                    "created": created,
+                    "model"  : self.model_name,
+                    "choices": [{"index": 0, **body}],
+            }
+
+        async with self._slot():
+            if not request.get("stream"):
+                text = await self.model_handler.generate(prompt, overrides)
+                if on_complete is not None:
+                    await on_complete(text)
+                await self._send_json(
+                        writer, 200,
+                        payload({**choice(text), "finish_reason": "stop"}),
+                        keep_alive
+                )
+                return keep_alive
+
+            # Streams end by closing the connection
+            await self._send_head(writer, 200, "text/event-stream", None, False)
+            suffix = ".chunk" if "chat" in object_type else ""
+            parts = []
+            try:
+                async for text in self.model_handler.stream(prompt, overrides):
+                    parts.append(text)
+                    await self._send_event(
+                            writer,
+                            payload({**delta(text), "finish_reason": None},
+                                    suffix)
+                    )
+            except (ConnectionError, asyncio.CancelledError):
+                raise
+            except Exception as e:
+                # The status line is already sent, report the error in-stream
+                logger.log("ERROR", f"Error streaming response: {e}")
+                await self._send_event(writer, {"error": {
+                        "message": str(e),
+                        "type"   : "server_error",
+                }})
+                return False
+            await self._send_event(
+                    writer, payload({**delta(""), "finish_reason": "stop"}, suffix)
+            )
+            writer.write(b"data: [DONE]\n\n")
+            await writer.drain()
+
+            if on_complete is not None:
+                await on_complete("".join(parts))
+            return False
+
+    @contextlib.asynccontextmanager
+    async def _slot(
+            self
+    ):
+        """
+        Holds a generation slot, or raises a 503 error if too many requests
+        are waiting.
+        """
+
+        if self._pending >= self.max_pending + self.max_concurrency:
+            raise HTTPError(503, "Too many requests.", "server_busy")
+
+        self._pending += 1
+        try:
+            async with self._slots:
+                yield
+        finally:
+            self._pending -= 1
+
+    async def _send_head(
+            self,
+            writer: asyncio.StreamWriter,
+            status: int,
+            content_type: str,
+            length: Optional[int],
+            keep_alive: bool
+    ) -> None:
+        head = [
+                f"HTTP/1.1 {status} {self.REASONS.get(status, '')}",
+                f"Content-Type: {content_type}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if length is not None:
+            head.append(f"Content-Length: {length}")
+        else:
+            head.append("Cache-Control: no-cache")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send_json(
+            self,
+            writer: asyncio.StreamWriter,
+            status: int,
+            data: Dict[str, Any],
+            keep_alive: bool
+    ) -> None:
+        body = json.dumps(data).encode("utf-8")
+        await self._send_head(
+                writer, status, "application/json", len(body), keep_alive
+        )
+        writer.write(body)
+        await writer.drain()
+
+    async def _send_event(
+            self,
+            writer: asyncio.StreamWriter,
+            data: Dict[str, Any]
+    ) -> None:
+        writer.write(b"data: " + json.dumps(data).encode("utf-8") + b"\n\n")
+        await writer.drain()
+
+    async def _send_error(
+            self,
+            writer: asyncio.StreamWriter,
+            error: HTTPError,
+            keep_alive: bool
+    ) -> None:
+        await self._send_json(writer, error.status, {
+                "error": {
+                        "message": error.message,
+                        "type"   : error.error_type,
+                }
+        }, keep_alive)
@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import json
+import signal
+from pathlib import PurePath
+
+from backend.backend_registry import BACKENDS, load_backend_class
+from backend.model_eviction import EvictionController
+from backend.model_handler import ModelHandler
+from backend.parameter_handler import ParameterHandler
+from backend.tuning_store import TuningStore
+from chat_handler import ChatHandler
+from utils.io_executor import io_executor
+
+
+APPDATA_DIRECTORY = PurePath("appdata")
+
+
+def build_model_handler(
+        backend_type: str,
+        generation_method: str = None,
+        model_path: str = None
+) -> ModelHandler:
+    """
+    Creates a model handler for a backend with the parameters saved by the
+    parameters page.
+
+    Args:
+        backend_type (str): Backend type (a key of BACKENDS).
+        generation_method (str, optional): Generation method, defaults to the
+            backend's first.
+        model_path (str, optional): Overrides the saved model path.
+
+    Returns:
+        ModelHandler: The model handler.
+    """
+
+    backend = BACKENDS[backend_type]
+    generation_method = generation_method or next(
+            iter(backend["generation_method"])
+    )
+
+    parameter_handler = ParameterHandler(
+            str(APPDATA_DIRECTORY.joinpath("parameter_states"))
+    )
+    parameter_handler.load_parameter_group(backend["model_parameters"]())
+    parameter_handler.load_parameter_group(
+            backend["generation_method"][generation_method]()
+    )
+    if model_path:
+        parameter_handler.model_parameters.update_parameter(
+                "model_path", model_path
+        )
+
+    model_handler = ModelHandler()
+    model_handler.backend = load_backend_class(backend_type)()
+    model_handler.model_parameters = parameter_handler.model_parameters
+    model_handler.generation_parameters = \
+        parameter_handler.generation_parameters
+    model_handler.generation_method = generation_method
+    model_handler.tuning_store = TuningStore(
+            str(APPDATA_DIRECTORY.joinpath("tuning"))
+    )
+    return model_handler
+
+
+async def serve(
+        args: argparse.Namespace
+) -> None:
+    """
+    Runs the inference server until SIGINT or SIGTERM.
+    """
+
+    from inference_server import InferenceServer
+
+    model_handler = build_model_handler(
+            args.backend, args.generation_method, args.model_path
+    )
+    for adapter in args.adapter:
+        name, _, path = adapter.partition("=")
+        model_handler.register_adapter(name, path or name)
+
+    eviction_controller = EvictionController()
+    eviction_controller.register(model_handler)
+    eviction_controller.start()
+
+    server = InferenceServer(
+            model_handler,
+            chat_handler=ChatHandler(str(APPDATA_DIRECTORY.joinpath("chats"))),
+            host=args.host,
+            port=args.port,
+            model_name=args.model_name,
+            max_concurrency=args.max_concurrency,
+            max_pending=args.max_pending
+    )
+    await server.start()
+    if not args.no_preload:
+        model_handler.preload()
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await stop.wait()
+    await server.shutdown(args.shutdown_timeout)
+    # Write the chat turns saved behind the last responses
+    await asyncio.to_thread(io_executor.flush, args.shutdown_timeout)
+    eviction_controller.stop()
+
+
+async def batch(
+        args: argparse.Namespace
+) -> None:
+    """
+    Runs the prompts of a JSONL file and prints a throughput summary.
+    """
+
+    from batch_runner import BatchRunner
+
+    model_handler = build_model_handler(
+            args.backend, args.generation_method, args.model_path
+    )
+    if args.parameters:
+        overrides = json.loads(args.parameters)
+        for key, value in overrides.items():
+            model_handler.generation_parameters.update_parameter(key, value)
+
+    runner = BatchRunner(
+            model_handler,
+            args.input,
+            args.output,
+            checkpoint_path=args.checkpoint,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            overwrite=args.overwrite
+    )
+    summary = await runner.run(resume=not args.restart)
+    print(summary.report())
+
+
+async def archive(
+        args: argparse.Namespace
+) -> None:
+    """
+    Moves the chats untouched for the given days into the chat archive.
+    """
+
+    chat_handler = ChatHandler(str(APPDATA_DIRECTORY.joinpath("chats")))
+    print(f"Archived {chat_handler.archive_chats(args.days)} chats.")
+
+
+async def tune(
+        args: argparse.Namespace
+) -> None:
+    """
+    Benchmarks thread counts, batch sizes and GPU offload for a llama.cpp
+    model on this host, and saves the fastest for the model to load with.
+    """
+
+    from backend.llamacpp.auto_tune import AutoTuner
+
+    model_handler = build_model_handler("llamacpp", model_path=args.model_path)
+    model_path = model_handler.model_parameters.get_parameters()["model_path"]
+
+    tuner = AutoTuner(
+            model_handler.backend,
+            model_handler.backend_parameters(model_handler.model_parameters),
+            prompt_tokens=args.prompt_tokens,
+            decode_tokens=args.decode_tokens,
+            batch_sizes=args.batch_size or (256, 512, 1024),
+            gpu_layers=args.gpu_layers or None
+    )
+    results = await asyncio.to_thread(tuner.run)
+    if not results:
+        print("No configuration could be loaded.")
+        return
+
+    print(AutoTuner.report(results))
+    model_handler.tuning_store.save(
+            model_path,
+            results[0].parameters,
+            [result.to_dict() for result in results]
+    )
+    print(f"Saved {results[0].parameters} for {model_path} on "
+          f"{model_handler.tuning_store.host_id}.")
+
+
+def add_model_arguments(
+        parser: argparse.ArgumentParser
+) -> None:
+    parser.add_argument(
+            "--backend", choices=sorted(BACKENDS), default="llamacpp"
+    )
+    parser.add_argument(
+            "--generation-method", default=None,
+            help="Backend generation method, defaults to the backend's first."
+    )
+    parser.add_argument(
+            "--model-path", default=None,
+            help="Model to run, defaults to the saved model parameters."
+    )
+
+
+def main(
+        argv=None
+) -> None:
+    parser = argparse.ArgumentParser(description="Control System")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser(
+            "serve", help="Serve OpenAI compatible completion endpoints."
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    add_model_arguments(serve_parser)
+    serve_parser.add_argument("--model-name", default="local")
+    serve_parser.add_argument(
+            "--adapter", action="append", default=[], metavar="NAME=PATH",
+            help="LoRA adapter served as model NAME. Can be repeated."
+    )
+    serve_parser.add_argument(
+            "--max-concurrency", type=int, default=1,
+            help="Requests generating at the same time."
+    )
+    serve_parser.add_argument(
+            "--max-pending", type=int, default=64,
+            help="Requests waiting for a slot before requests are rejected."
+    )
+    serve_parser.add_argument(
+            "--shutdown-timeout", type=float, default=30.0,
+            help="Seconds to wait for running requests on shutdown."
+    )
+    serve_parser.add_argument(
+            "--no-preload", action="store_true",
+            help="Load the model on the first request instead of at start."
+    )
+    serve_parser.set_defaults(func=serve)
+
+    batch_parser = commands.add_parser(
+            "batch", help="Run the prompts of a JSONL file."
+    )
+    batch_parser.add_argument("input", help="JSONL file of prompts.")
+    batch_parser.add_argument("output", help="JSONL file of responses.")
+    add_model_arguments(batch_parser)
+    batch_parser.add_argument(
+            "--parameters", default=None,
+            help="JSON object of generation parameters for the whole run."
+    )
+    batch_parser.add_argument(
+            "--checkpoint", default=None,
+            help="Checkpoint file, defaults to OUTPUT.checkpoint."
+    )
+    batch_parser.add_argument(
+            "--concurrency", type=int, default=1,
+            help="Batches in flight at the same time."
+    )
+    batch_parser.add_argument(
+            "--batch-size", type=int, default=8,
+            help="Prompts per batch, for backends that batch."
+    )
+    batch_parser.add_argument(
+            "--restart", action="store_true",
+            help="Ignore the checkpoint and start the output over."
+    )
+    batch_parser.add_argument(
+            "--overwrite", action="store_true",
+            help="Start over an existing output that has no checkpoint."
+    )
+    batch_parser.set_defaults(func=batch)
+
+    archive_parser = commands.add_parser(
+            "archive", help="Compress the chats untouched for some days."
+    )
+    archive_parser.add_argument(
+            "--days", type=float, default=30.0,
+            help="Days since a chat was last changed."
+    )
+    archive_parser.set_defaults(func=archive)
+
+    tune_parser = commands.add_parser(
+            "tune", help="Find the fastest llama.cpp settings for this host."
+    )
+    tune_parser.add_argument(
+            "--model-path", default=None,
+            help="Model to tune, defaults to the saved model parameters."
+    )
+    tune_parser.add_argument(
+            "--prompt-tokens", type=int, default=256,
+            help="Tokens of the prefill benchmark."
+    )
+    tune_parser.add_argument(
+            "--decode-tokens", type=int, default=32,
+            help="Tokens of the decode benchmark."
+    )
+    tune_parser.add_argument(
+            "--batch-size", type=int, action="append", default=[],
+            help="n_batch value to try. Can be repeated."
+    )
+    tune_parser.add_argument(
+            "--gpu-layers", type=int, action="append", default=[],
+            help="n_gpu_layers value to try. Can be repeated."
+    )
+    tune_parser.set_defaults(func=tune)
+
+    args = parser.parse_args(argv)
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,30 @@
+from collections import OrderedDict
+
+
 class PromptHandler:
     """
     Handles the formatting of the prompt.
+
+    When a token budget is set, the conversation history is filled newest
+    first until the budget derived from n_ctx and max_tokens is used up,
+    instead of taking a fixed number of recent messages.
+
+    Prompts are rendered incrementally: the static preamble (system, tool and
+    agent prompts and the tool list) is rendered once per configuration, each
+    history message is rendered once, and the new turn is rendered the way it
+    will appear in the history. Consecutive prompts therefore share a
+    byte-identical prefix, which lets backend prefix caches hit. Rendered
+    messages and their token counts are kept for the message_cache_size
+    most recently used messages.
+
+    With a chat template set, or through format_messages for backends that
+    apply the model's own template, prompts use the model's native chat
+    format instead of "role: content" lines.
+
+    With a retriever set, the top-k relevant past messages or document
+    chunks for each prompt are injected ahead of the new turn, within a share
+    of the token budget. Retrieval results are cached per prompt. This keeps
+    long-term memory available with a short recent history.
     """
 
     def __init__(
@@ -9,14 +33,178 @@ class PromptHandler:
             tool_prompt=None,
             agent_prompt=None,
             conversation_history=None,
-            available_tools=None
+            available_tools=None,
+            token_counter=None,
+            n_ctx=None,
+            max_tokens=None,
+            pin_system_prompt=True,
+            overflow_summarizer=None,
+            chat_template=None,
+            retriever=None,
+            retrieval_k=4,
+            retrieval_budget=None,
+            retrieval_cache_size=32,
+            message_cache_size=1024
     ):
         self.system_prompt = system_prompt
         self.tool_prompt = tool_prompt
         self.agent_prompt = agent_prompt
-        self.conversation_history = conversation_history or []
+        self.conversation_history = conversation_history \
+            if conversation_history is not None else []
         self.available_tools = available_tools or []
 
+        self.token_counter = token_counter
+        self.n_ctx = n_ctx
+        self.max_tokens = max_tokens
+        self.pin_system_prompt = pin_system_prompt
+        self.overflow_summarizer = overflow_summarizer
+        self.chat_template = chat_template
+        self.message_cache_size = message_cache_size
+        self._token_cache = OrderedDict()
+
+        self.retriever = retriever
+        self.retrieval_k = retrieval_k
+        self.retrieval_budget = retrieval_budget
+        self.retrieval_cache_size = retrieval_cache_size
+        self._retrieval_cache = OrderedDict()
+
+        self._preamble_key = None
+        self._preambles = {}
+        self._message_cache = OrderedDict()
+        self._history_keys = []
+        self._history_text = ""
+
+    def set_token_counter(
+            self,
+            token_counter
+            ):
+        """
+        Sets the function used to count tokens, usually the active backend's
+        tokenizer. Clears the per-message token counts.
+
+        Args:
+            token_counter (callable): Takes a string and returns its token
+                count, or None if the tokenizer is not available.
+        """
+        if token_counter != self.token_counter:
+            self.token_counter = token_counter
+            self._token_cache = OrderedDict()
+
+    def set_token_budget(
+            self,
+            n_ctx,
+            max_tokens
+            ):
+        """
+        Sets the context length and the tokens reserved for the response.
+
+        Args:
+            n_ctx (int): The context length of the model.
+            max_tokens (int): The maximum number of tokens to generate.
+        """
+        self.n_ctx = n_ctx
+        self.max_tokens = max_tokens
+
+    def set_retriever(
+            self,
+            retriever
+            ):
+        """
+        Sets the function used to retrieve relevant context for a prompt.
+        Clears the cached retrieval results.
+
+        Args:
+            retriever (callable): Takes a prompt and k, and returns up to k
+                relevant texts, most relevant first. None disables retrieval.
+        """
+        if retriever != self.retriever:
+            self.retriever = retriever
+            self._retrieval_cache = OrderedDict()
+
+    def set_chat_template(
+            self,
+            chat_template
+            ):
+        """
+        Sets the chat template prompts are rendered with, usually the one of
+        the loaded model.
+
+        Args:
+            chat_template (ChatTemplate): The template. None formats prompts
+                as "role: content" lines.
+        """
+        self.chat_template = chat_template
+
+    def count_tokens(
+            self,
+            text
+            ):
+        """
+        Counts the tokens in a text, estimating 4 characters per token if no
+        tokenizer is available.
+
+        Args:
+            text (str): The text to count.
+
+        Returns:
+            int: The number of tokens.
+        """
+        if self.token_counter is not None:
+            count = self.token_counter(text)
+            if count is not None:
+                return count
+        return len(text) // 4 + 1
+
+    def _message_tokens(
+            self,
+            message
+            ):
+        """
+        Counts the tokens of a formatted message, cached per message.
+        """
+        key = (message["role"], message["content"])
+        count = self._cache_get(self._token_cache, key)
+        if count is not None:
+            return count
+
+        text = self._render_message(message)
+        if self.token_counter is not None:
+            count = self.token_counter(text)
+        if count is None:
+            # Estimates are not cached, the tokenizer may become available
+            return self.count_tokens(text)
+        self._cache_put(
+                self._token_cache, key, count, self.message_cache_size
+        )
+        return count
+
+    @staticmethod
+    def _cache_get(
+            cache,
+            key
+            ):
+        """
+        Returns a cached value, or None, and marks it as recently used.
+        """
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    @staticmethod
+    def _cache_put(
+            cache,
+            key,
+            value,
+            size
+            ):
+        """
+        Caches a value, dropping the least recently used beyond the size.
+        """
+        cache[key] = value
+        if len(cache) > size:
+            cache.popitem(last=False)
+
     @staticmethod
     def _format_context_messages(
             context_messages
@@ -31,11 +219,106 @@ class PromptHandler:
             str: The formatted context messages.
         """
         formatted_messages = "\n".join(
-                f"{role}: {content}" for message in context_messages
-                for role, content in message.items()
+                f"{message['role']}: {message['content']}"
+                for message in context_messages
         )
         return formatted_messages
 
+    def _render_message(
+            self,
+            message
+            ):
+        """
+        Renders a message, cached per message. Messages are rendered without
+        the chat template, which may reject a message on its own.
+        """
+        key = (message["role"], message["content"])
+        rendered = self._cache_get(self._message_cache, key)
+        if rendered is None:
+            rendered = self._format_context_messages([message])
+            self._cache_put(
+                    self._message_cache, key, rendered,
+                    self.message_cache_size
+            )
+        return rendered
+
+    def _render_history(
+            self,
+            messages
+            ):
+        """
+        Renders the history, appending only the messages added since the
+        previous call when the history has grown.
+
+        Args:
+            messages (list): The messages to render.
+
+        Returns:
+            str: The rendered history.
+        """
+        keys = [(message["role"], message["content"]) for message in messages]
+        cached = len(self._history_keys)
+
+        if cached and keys[:cached] == self._history_keys:
+            new_text = "\n".join(
+                    self._render_message(message)
+                    for message in messages[cached:]
+            )
+            if new_text:
+                self._history_text += f"\n{new_text}"
+        else:
+            self._history_text = "\n".join(
+                    self._render_message(message) for message in messages
+            )
+
+        self._history_keys = keys
+        return self._history_text
+
+    def _preamble(
+            self,
+            include_system_prompt=True
+            ):
+        """
+        Renders the static part of the prompt, once per configuration.
+        Unset sections are left out.
+
+        Args:
+            include_system_prompt (bool): Whether to include the system
+                prompt.
+
+        Returns:
+            str: The rendered preamble.
+        """
+        key = (self.system_prompt, self.tool_prompt, self.agent_prompt,
+               tuple(self.available_tools))
+        if key != self._preamble_key:
+            self._preamble_key = key
+            self._preambles = {}
+
+        preamble = self._preambles.get(include_system_prompt)
+        if preamble is None:
+            sections = [
+                    self.system_prompt if include_system_prompt else None,
+                    self.tool_prompt,
+                    self.agent_prompt
+            ]
+            tools_string = "\n".join(self.available_tools)
+            if tools_string:
+                sections.append(f"Available Tools:\n{tools_string}")
+            preamble = "\n\n".join(section for section in sections if section)
+            self._preambles[include_system_prompt] = preamble
+        return preamble
+
+    @staticmethod
+    def _render_turn(
+            prompt
+            ):
+        """
+        Renders the new turn as it will later appear in the history, followed
+        by the assistant cue.
+        """
+        return f"user: {prompt}\nassistant: "
+
     def _get_recent_messages(
             self,
             num_messages=5
@@ -51,7 +334,139 @@ class PromptHandler:
         """
         return self.conversation_history[-num_messages:]
 
-    def _format_prompt(
+    def _get_budgeted_messages(
+            self,
+            budget
+            ):
+        """
+        Gets the most recent messages that fit in a token budget, adding a
+        summary of the older messages if an overflow summarizer is set.
+
+        Args:
+            budget (int): The number of tokens available for the history.
+
+        Returns:
+            list: The messages, oldest first.
+        """
+        messages = []
+        for index in range(len(self.conversation_history) - 1, -1, -1):
+            message = self.conversation_history[index]
+            tokens = self._message_tokens(message)
+            if tokens > budget:
+                break
+            messages.append(message)
+            budget -= tokens
+        messages.reverse()
+
+        kept = len(messages)
+        overflow = self.conversation_history[
+                   :len(self.conversation_history) - kept]
+        if overflow and self.overflow_summarizer is not None:
+            summary = self._summarize(overflow)
+
+            # Make room for the summary by dropping the oldest messages
+            while messages and self._message_tokens(summary) > budget:
+                budget += self._message_tokens(messages.pop(0))
+            if len(messages) != kept:
+                summary = self._summarize(
+                        self.conversation_history[
+                        :len(self.conversation_history) - len(messages)]
+                )
+
+            if self._message_tokens(summary) <= budget:
+                messages.insert(0, summary)
+
+        return messages
+
+    def _summarize(
+            self,
+            messages
+            ):
+        """
+        Summarizes messages that do not fit in the token budget.
+
+        Returns:
+            dict: A system message containing the summary.
+        """
+        return {
+                "role"   : "system",
+                "content": "Summary of the earlier conversation: "
+                           f"{self.overflow_summarizer(messages)}"
+        }
+
+    def _retrieve(
+            self,
+            prompt
+            ):
+        """
+        Retrieves relevant texts for a prompt, cached per prompt.
+
+        Returns:
+            list: The retrieved texts, most relevant first.
+        """
+        if self.retriever is None:
+            return []
+
+        key = (prompt, self.retrieval_k)
+        results = self._cache_get(self._retrieval_cache, key)
+        if results is None:
+            results = list(self.retriever(prompt, self.retrieval_k))
+            self._cache_put(
+                    self._retrieval_cache, key, results,
+                    self.retrieval_cache_size
+            )
+        return results
+
+    @staticmethod
+    def _render_retrieved(
+            texts
+            ):
+        """
+        Renders retrieved texts as a context block.
+        """
+        if not texts:
+            return ""
+        return "Relevant context:\n" + "\n".join(f"- {text}" for text in texts)
+
+    def _get_retrieved(
+            self,
+            prompt,
+            budget=None
+            ):
+        """
+        Gets the retrieved texts that fit in a token budget, leaving out
+        texts already in the conversation.
+
+        Args:
+            prompt (str): The prompt to retrieve context for.
+            budget (int): The number of tokens available, or None for no
+                limit.
+
+        Returns:
+            tuple: The context block and its token count.
+        """
+        in_conversation = {
+                message["content"] for message in self.conversation_history
+        }
+        in_conversation.update(
+                f"{message['role']}: {message['content']}"
+                for message in self.conversation_history
+        )
+
+        texts = []
+        for text in self._retrieve(prompt):
+            if text in in_conversation:
+                continue
+            if budget is not None and self.count_tokens(
+                    self._render_retrieved(texts + [text])
+            ) > budget:
+                break
+            texts.append(text)
+
+        block = self._render_retrieved(texts)
+        return block, self.count_tokens(block) if block else 0
+
+    def format_prompt(
             self,
             prompt
             ):
@@ -64,13 +479,105 @@ class PromptHandler:
         Returns:
             str: The formatted prompt.
         """
-        context_string = self._format_context_messages(
-                self._get_recent_messages()
+        return self._format_prompt(prompt)
+
+    def format_messages(
+            self,
+            prompt
+            ):
+        """
+        Formats the prompt as chat messages, for rendering with the model's
+        chat template. The preamble becomes the system message.
+
+        Args:
+            prompt (str): The prompt to format.
+
+        Returns:
+            list: Messages with "role" and "content" keys.
+        """
+        preamble, context_messages, retrieved = self._select_context(prompt)
+
+        messages = [{"role": "system", "content": preamble}] if preamble \
+            else []
+        messages.extend(
+                {"role": message["role"], "content": message["content"]}
+                for message in context_messages
         )
-        formatted_prompt = (f"{self.system_prompt}\n\n{context_string}\n\n"
-                            f"{prompt}\n\n{self.tool_prompt}\n\n"
-                            f"{self.agent_prompt}")
-        tools_string = "\n".join(self.available_tools)
-        if tools_string:
-            formatted_prompt += f"\n\nAvailable Tools:\n{tools_string}"
-        return formatted_prompt
+        # Retrieved context goes in the user turn, as chat templates may only
+        # accept a leading system message
+        content = f"{retrieved}\n\n{prompt}" if retrieved else prompt
+        messages.append({"role": "user", "content": content})
+        return messages
+
+    def _select_context(
+            self,
+            prompt
+            ):
+        """
+        Selects the preamble and the history messages for a prompt.
+
+        Args:
+            prompt (str): The prompt to format.
+
+        Returns:
+            tuple: The preamble, the history messages and the retrieved
+            context block.
+        """
+        preamble = self._preamble()
+
+        if self.n_ctx:
+            static_preamble = self._preamble(include_system_prompt=False)
+            budget = self.n_ctx - (self.max_tokens or 0) \
+                     - self.count_tokens(
+                    f"{static_preamble}{self._render_turn(prompt)}"
+            )
+            system_tokens = self.count_tokens(self.system_prompt or "")
+            if self.pin_system_prompt or system_tokens <= budget:
+                budget -= system_tokens
+            else:
+                preamble = static_preamble
+
+            # Retrieved context gets a share of the budget, by default a
+            # quarter, and the history the rest
+            retrieval_budget = self.retrieval_budget \
+                if self.retrieval_budget is not None else budget // 4
+            retrieved, retrieved_tokens = self._get_retrieved(
+                    prompt, max(min(retrieval_budget, budget), 0)
+            )
+            budget -= retrieved_tokens
+            context_messages = self._get_budgeted_messages(max(budget, 0))
+        else:
+            retrieved, _ = self._get_retrieved(prompt)
+            context_messages = self._get_recent_messages()
+
+        return preamble, context_messages, retrieved
+
+    def _format_prompt(
+            self,
+            prompt
+            ):
+        """
+        Formats the prompt for the agent.
+
+        Args:
+            prompt (str): The prompt to format.
+
+        Returns:
+            str: The formatted prompt.
+        """
+        if self.chat_template is not None:
+            return self.chat_template.render(self.format_messages(prompt))
+
+        preamble, context_messages, retrieved = self._select_context(prompt)
+        turn = self._render_turn(prompt)
+
+        sections = [preamble, self._render_history(context_messages)]
+        prefix = "\n\n".join(section for section in sections if section)
+        # Retrieved context varies per prompt, so it follows the history to
+        # keep the prefix stable
+        if retrieved:
+            return f"{prefix}\n\n{retrieved}\n\n{turn}" if prefix \
+                else f"{retrieved}\n\n{turn}"
+        if context_messages:
+            return f"{prefix}\n{turn}"
+        return f"{prefix}\n\n{turn}" if prefix else turn
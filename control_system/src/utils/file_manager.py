@@ -1,9 +1,18 @@
-import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Iterator, List
 
+from .json_serializer import get_serializer
 from .logger import Logger
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 
 logger = Logger(__name__)
 
@@ -12,6 +21,9 @@ class FileManager:
     """
     A class for file system operations.
 
+    JSON is read and written as bytes with the fastest installed serializer,
+    see set_serializer.
+
     Methods:
       create_directory(self, directory_path):
           Creates a directory at the specified path.
@@ -20,7 +32,16 @@ class FileManager:
           Loads data from a JSON file at the specified path.
 
       save_json(self, data, file_path):
-          Saves data to a JSON file at the specified path.
+          Atomically saves data to a JSON file at the specified path.
+
+      set_serializer(cls, name):
+          Selects the JSON serializer.
+
+      save_bytes(self, base_dir, filename, contents):
+          Atomically saves bytes to a file at the specified path.
+
+      lock(self, base_dir, filename):
+          Holds an exclusive lock on a file while writing it.
 
       delete_file(self, file_path):
           Deletes the file at the specified path.
@@ -32,6 +53,12 @@ class FileManager:
           Lists all files in the base directory.
     """
 
+    serializer = get_serializer()
+
+    # Process-local locks, for platforms without fcntl
+    _locks = {}
+    _locks_lock = threading.Lock()
+
     def __enter__(
             self
             ) -> 'FileManager':
@@ -55,6 +82,20 @@ class FileManager:
         """
         pass
 
+    @classmethod
+    def set_serializer(
+            cls,
+            name: str = None
+            ) -> None:
+        """
+        Select the JSON serializer.
+
+        Args:
+            name (str, optional): "orjson", "msgspec" or "json". Defaults to
+                the fastest installed serializer.
+        """
+        cls.serializer = get_serializer(name)
+
     @staticmethod
     def create_directory(
             base_dir: str
@@ -76,8 +117,9 @@ class FileManager:
         except OSError as e:
             logger.log("INFO", f"Error creating directory: {e}")
 
-    @staticmethod
+    @classmethod
     def load_json(
+            cls,
             base_dir: str,
             filename: str
             ) -> Any:
@@ -94,28 +136,111 @@ class FileManager:
         """
         path = Path(base_dir) / filename
         if path.exists():
-            with open(path, 'r') as file:
-                return json.load(file)
+            with open(path, 'rb') as file:
+                return cls.serializer.loads(file.read())
         else:
             return []
 
-    @staticmethod
+    @classmethod
     def save_json(
+            cls,
             base_dir: str,
             filename: str,
-            data: Any
+            data: Any,
+            sync_directory: bool = False
             ) -> None:
         """
         Save data to a JSON file.
 
+        The data is written to a temporary file in the same directory, synced
+        to disk and renamed over the file, so readers and crashes never see a
+        partially written file.
+
         Args:
             base_dir (str): The base directory for file operations.
             filename (str): The name of the file to save to.
             data (Any): The data to save.
+            sync_directory (bool, optional): Also sync the directory, so the
+                rename itself survives a power loss. Defaults to False.
+        """
+        cls.save_bytes(
+                base_dir, filename, cls.serializer.dumps(data), sync_directory
+        )
+
+    @staticmethod
+    def save_bytes(
+            base_dir: str,
+            filename: str,
+            contents: bytes,
+            sync_directory: bool = False
+            ) -> None:
+        """
+        Atomically save bytes to a file, as save_json does.
+
+        Args:
+            base_dir (str): The base directory for file operations.
+            filename (str): The name of the file to save to.
+            contents (bytes): The bytes to save.
+            sync_directory (bool, optional): Also sync the directory.
+                Defaults to False.
         """
         path = Path(base_dir) / filename
-        with open(path, 'w') as file:
-            json.dump(data, file)
+
+        fd, tmp_path = tempfile.mkstemp(
+                dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(contents)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        if sync_directory and hasattr(os, "O_DIRECTORY"):
+            directory_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+
+    @classmethod
+    @contextmanager
+    def lock(
+            cls,
+            base_dir: str,
+            filename: str
+            ) -> Iterator[None]:
+        """
+        Hold an exclusive advisory lock on a file, for read-modify-write
+        updates by concurrent writers.
+
+        The lock is taken on a hidden sidecar file, as atomic saves replace
+        the file itself. The sidecar is never deleted: a waiter would keep
+        locking the deleted file while new callers lock a new one. Without
+        fcntl the lock only covers this process.
+
+        Args:
+            base_dir (str): The base directory for file operations.
+            filename (str): The name of the file to lock.
+        """
+        path = Path(base_dir) / f".{filename}.lock"
+
+        if fcntl is None:
+            with cls._locks_lock:
+                lock = cls._locks.setdefault(str(path), threading.Lock())
+            with lock:
+                yield
+            return
+
+        with open(path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
 
     @staticmethod
     def delete_file(
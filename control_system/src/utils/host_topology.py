@@ -0,0 +1,159 @@
+import functools
+import os
+import socket
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+SYSFS_DIRECTORY = "/sys/devices/system"
+
+
+def parse_cpu_list(
+        text: str
+        ) -> List[int]:
+    """
+    Parses a kernel CPU list, such as "0-3,8,10-11".
+    """
+
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def _read_cpu_list(
+        path: Path
+        ) -> Optional[List[int]]:
+    try:
+        return parse_cpu_list(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class HostTopology:
+    """
+    The CPUs of the host that this process may run on, grouped into
+    physical cores and NUMA nodes.
+
+    Attributes:
+        hostname (str): The host name.
+        cores (tuple): The logical CPUs of each physical core, so hyper-
+            threads of one core are grouped together.
+        nodes (tuple): The logical CPUs of each NUMA node, in node order.
+
+    Methods:
+        logical_cpus: Returns the logical CPUs.
+        physical_cores: Returns one logical CPU per physical core.
+        host_id: Returns an ID of the host and its CPU layout.
+    """
+
+    hostname: str
+    cores: Tuple[Tuple[int, ...], ...]
+    nodes: Tuple[Tuple[int, ...], ...]
+
+    def logical_cpus(
+            self,
+            node: Optional[int] = None
+            ) -> List[int]:
+        """
+        Returns the logical CPUs, of one NUMA node if given.
+        """
+
+        if node is not None:
+            return list(self.nodes[node])
+        return sorted(cpu for core in self.cores for cpu in core)
+
+    def physical_cores(
+            self,
+            node: Optional[int] = None
+            ) -> List[int]:
+        """
+        Returns the first logical CPU of each physical core, of one NUMA
+        node if given.
+        """
+
+        cpus = set(self.nodes[node]) if node is not None else None
+        return [
+                core[0] for core in self.cores
+                if cpus is None or core[0] in cpus
+        ]
+
+    def host_id(
+            self
+            ) -> str:
+        """
+        Returns an ID of the host and its CPU layout, which changes when the
+        process is given other CPUs.
+        """
+
+        return f"{self.hostname}-{len(self.nodes)}n" \
+               f"{len(self.cores)}c{len(self.logical_cpus())}t"
+
+
+def read_host_topology(
+        sysfs_directory: str = SYSFS_DIRECTORY,
+        allowed: Optional[List[int]] = None
+        ) -> HostTopology:
+    """
+    Reads the topology of the CPUs this process may run on from sysfs.
+    Without sysfs every CPU is its own core on a single node.
+
+    Args:
+        sysfs_directory (str, optional): The sysfs system directory.
+        allowed (list, optional): The CPUs to include, defaults to the CPU
+            affinity of the process.
+
+    Returns:
+        HostTopology: The topology.
+    """
+
+    if allowed is None:
+        if hasattr(os, "sched_getaffinity"):
+            allowed = sorted(os.sched_getaffinity(0))
+        else:
+            allowed = list(range(os.cpu_count() or 1))
+    allowed_set = set(allowed)
+    system = Path(sysfs_directory)
+
+    cores: Dict[Tuple[int, ...], None] = {}
+    for cpu in allowed:
+        siblings = _read_cpu_list(
+                system / "cpu" / f"cpu{cpu}" / "topology"
+                / "thread_siblings_list"
+        ) or [cpu]
+        core = tuple(sibling for sibling in siblings
+                     if sibling in allowed_set)
+        cores[core or (cpu,)] = None
+
+    nodes = []
+    node_directories = sorted(
+            system.glob("node/node[0-9]*"),
+            key=lambda path: int(path.name[4:])
+    )
+    for node_directory in node_directories:
+        cpus = _read_cpu_list(node_directory / "cpulist") or []
+        cpus = tuple(cpu for cpu in cpus if cpu in allowed_set)
+        if cpus:
+            nodes.append(cpus)
+    if not nodes:
+        nodes = [tuple(allowed)]
+
+    return HostTopology(
+            hostname=socket.gethostname(),
+            cores=tuple(sorted(cores)),
+            nodes=tuple(nodes)
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def host_topology() -> HostTopology:
+    """
+    Returns the topology of this host, read once.
+    """
+
+    return read_host_topology()
@@ -0,0 +1,180 @@
+import asyncio
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Set
+
+from .logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class IOExecutor:
+    """
+    Runs file I/O on a dedicated thread pool, off the event loop and the
+    page's script thread.
+
+    Jobs are submitted with a key, usually the path they touch. Jobs with the
+    same key run one at a time in submission order, so a read submitted after
+    a write sees it, while jobs on different keys run in parallel. Pending
+    jobs are flushed at interpreter exit.
+
+    Attributes:
+        max_workers (int): Number of I/O threads.
+
+    Methods:
+        submit: Queue a job and return its future.
+        run: Run a job and await its result.
+        wait: Block until the queued jobs of a key are done.
+        flush: Block until all queued jobs are done.
+        shutdown: Flush and stop the threads.
+    """
+
+    def __init__(
+            self,
+            max_workers: int = 2
+            ):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._queues: Dict[Hashable, Deque] = {}
+        self._pending: Set[Future] = set()
+        atexit.register(self.shutdown)
+
+    def _get_executor(
+            self
+            ) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="io"
+            )
+        return self._executor
+
+    def submit(
+            self,
+            key: Hashable,
+            function: Callable[..., Any],
+            *args: Any
+            ) -> Future:
+        """
+        Queue a job after the queued jobs of the same key.
+
+        Args:
+            key (Hashable): Jobs with equal keys run in order.
+            function (callable): The job.
+            *args: Arguments of the job.
+
+        Returns:
+            Future: The result of the job. Failures are also logged, as
+            write-behind callers may never look at the future.
+        """
+
+        future = Future()
+
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                # Raises RuntimeError once the pool is shut down at exit
+                self._get_executor().submit(self._drain, key)
+                queue = self._queues[key] = deque()
+            queue.append((future, function, args))
+            self._pending.add(future)
+        return future
+
+    def _drain(
+            self,
+            key: Hashable
+            ) -> None:
+        """
+        Runs the queued jobs of a key in order, until its queue is empty.
+        The jobs run in one pool task, so jobs queued while it runs are
+        still done when the pool is joined at exit.
+        """
+
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                # Left in the queue while it runs, for wait()
+                future, function, args = queue[0]
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except BaseException as e:
+                    logger.log("ERROR", f"Error in I/O job for {key}: {e}")
+                    future.set_exception(e)
+
+            with self._lock:
+                queue.popleft()
+                self._pending.discard(future)
+
+    async def run(
+            self,
+            key: Hashable,
+            function: Callable[..., Any],
+            *args: Any
+            ) -> Any:
+        """
+        Run a job after the queued jobs of the same key and return its
+        result.
+        """
+
+        return await asyncio.wrap_future(self.submit(key, function, *args))
+
+    def wait(
+            self,
+            key: Hashable,
+            timeout: Optional[float] = None
+            ) -> None:
+        """
+        Block until the queued jobs of a key are done.
+        """
+
+        with self._lock:
+            queue = self._queues.get(key)
+            tail = queue[-1][0] if queue else None
+        if tail is not None:
+            wait([tail], timeout)
+
+    def flush(
+            self,
+            timeout: Optional[float] = None
+            ) -> None:
+        """
+        Block until all queued jobs, including jobs queued while waiting,
+        are done.
+        """
+
+        while True:
+            with self._lock:
+                pending = set(self._pending)
+            if not pending:
+                return
+            _, not_done = wait(pending, timeout)
+            if not_done:
+                logger.log(
+                        "WARNING", f"{len(not_done)} I/O jobs did not finish."
+                )
+                return
+
+    def shutdown(
+            self
+            ) -> None:
+        """
+        Flush the queued jobs and stop the threads.
+        """
+
+        self.flush()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# Shared by the chat and parameter handlers
+io_executor = IOExecutor()
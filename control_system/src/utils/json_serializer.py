@@ -0,0 +1,133 @@
+import json
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class JSONSerializer:
+    """
+    Serializes data to and from compact JSON bytes with the standard library.
+    Subclasses use faster libraries and fall back to this one for values the
+    library rejects, so every serializer accepts the same data.
+
+    Attributes:
+        name (str): Name of the serializer.
+
+    Methods:
+        dumps: Serialize data to JSON bytes.
+        loads: Deserialize JSON bytes.
+    """
+
+    name = "json"
+
+    @staticmethod
+    def dumps(
+            data: Any
+            ) -> bytes:
+        return json.dumps(
+                data, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+    @staticmethod
+    def loads(
+            data: bytes
+            ) -> Any:
+        return json.loads(data)
+
+
+class OrjsonSerializer(JSONSerializer):
+    """
+    Serializes JSON with orjson.
+    """
+
+    name = "orjson"
+
+    @staticmethod
+    def dumps(
+            data: Any
+            ) -> bytes:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            # Values orjson rejects, such as integers over 64 bits
+            return JSONSerializer.dumps(data)
+
+    @staticmethod
+    def loads(
+            data: bytes
+            ) -> Any:
+        return orjson.loads(data)
+
+
+class MsgspecSerializer(JSONSerializer):
+    """
+    Serializes JSON with msgspec.
+    """
+
+    name = "msgspec"
+
+    @staticmethod
+    def dumps(
+            data: Any
+            ) -> bytes:
+        try:
+            return msgspec.json.encode(data)
+        except (TypeError, msgspec.EncodeError):
+            return JSONSerializer.dumps(data)
+
+    @staticmethod
+    def loads(
+            data: bytes
+            ) -> Any:
+        try:
+            return msgspec.json.decode(data)
+        except msgspec.DecodeError as e:
+            # Raise the same error as the other serializers
+            raise ValueError(str(e)) from e
+
+
+# Installed serializers, fastest first
+SERIALIZERS: Dict[str, type] = {
+        serializer.name: serializer
+        for serializer, module in (
+                (OrjsonSerializer, orjson),
+                (MsgspecSerializer, msgspec),
+                (JSONSerializer, json),
+        )
+        if module is not None
+}
+
+
+def get_serializer(
+        name: Optional[str] = None
+        ) -> type:
+    """
+    Return a JSON serializer.
+
+    Args:
+        name (str, optional): "orjson", "msgspec" or "json". Defaults to the
+            fastest installed serializer.
+
+    Returns:
+        type: The serializer class.
+
+    Raises:
+        ValueError: If the serializer is unknown or not installed.
+    """
+
+    if name is None:
+        return next(iter(SERIALIZERS.values()))
+    if name not in SERIALIZERS:
+        raise ValueError(
+                f"JSON serializer {name} is not available, choose from "
+                f"{', '.join(SERIALIZERS)}."
+        )
+    return SERIALIZERS[name]
@@ -25,6 +25,10 @@ class Chat(ChatInterface):
         chat_component(self) -> None:
             Constructs and renders the main chat interface component.
 
+        model_status_component(self) -> None:
+            Renders the readiness of a model that is loading in the
+            background.
+
         chat_history_component(self) -> None:
             Constructs and renders the component for managing and displaying
             chat history.
@@ -58,6 +62,7 @@ class Chat(ChatInterface):
 
         st.header(f"{self.page_icon} Chat", divider=True)
         st.container(height=48, border=False)
+        self.model_status_component()
 
         # Initialize session state
         if "messages" not in st.session_state:
@@ -70,32 +75,41 @@ class Chat(ChatInterface):
             # Initialize chat history from PromptHandler
             self.messages = self.prompt_handler.conversation_history
 
-        # Display chat messages from history from PromptHandler
-        for message in self.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
+        # Display the loaded messages of the chat from PromptHandler
+        self.display_chat_window()
 
         if prompt := st.chat_input(placeholder="Prompt..."):
             # Display user message in chat message container
             with st.chat_message("user", avatar="🥷"):
                 st.markdown(prompt)
 
-            # Format the prompt
-            formatted_prompt = self.prompt_handler.format_prompt(prompt)
+            # Format the prompt within the model's context window
+            formatted_prompt = self.format_request(prompt)
 
             # Display assistant response in chat message container
             with st.chat_message("assistant", avatar="🤖"):
                 response_placeholder = st.empty()
                 response = asyncio.run(
-                        self.model_handler.backend.generate_response(
-                                formatted_prompt
-                        )
+                        self.model_handler.generate(formatted_prompt)
                 )
 
                 if response:
                     response_placeholder.markdown(response)
                     self.update_chat_history(prompt, response)
 
+    def model_status_component(
+            self
+            ):
+        """
+        Model readiness component
+        """
+
+        status = self.model_handler.warmup_status()
+        if status["state"] in ("loading", "warming"):
+            st.info(f"⏳ Model {status['state']}...")
+        elif status["state"] == "failed":
+            st.warning(f"Model failed to load: {status['error']}")
+
     def chat_history_component(
             self
             ):
@@ -107,8 +121,6 @@ class Chat(ChatInterface):
         if "sidebar_chats_to_display" not in st.session_state:
             st.session_state["sidebar_chats_to_display"] = 25
 
-        chat_dir = self.chat_handler.list_chats()
-
         with st.sidebar:
             with st.expander("chats", expanded=True):
                 key = "new_chat_button"
@@ -119,17 +131,43 @@ class Chat(ChatInterface):
                         on_click=self.update_current_chat_id
                 )
 
+                self.use_retrieval = st.toggle(
+                        "📚 recall other chats",
+                        key="use_retrieval",
+                        help="Add relevant messages of other chats to prompts"
+                )
+
+                query = st.text_input(
+                        "🔎 search",
+                        key="chat_search",
+                        placeholder="search chats"
+                )
+
+                # Search results come with a snippet of the matching message
+                if query.strip():
+                    results = self.chat_handler.search(
+                            query,
+                            limit=st.session_state["sidebar_chats_to_display"]
+                    )
+                    snippets = {
+                            result.chat_id: result.snippet
+                            for result in results
+                    }
+                    chat_dir = list(snippets)
+                else:
+                    snippets = {}
+                    chat_dir = self.chat_handler.list_chats()
+
                 col1, col2, col3 = st.columns([10, 1, 1])
                 for file in chat_dir[
                             :st.session_state["sidebar_chats_to_display"]]:
-                    snippet = \
+                    snippet = snippets.get(file) or \
                         self.chat_handler.get_chat_snippet(file)
                     with col1:
                         key = f"load_{file}"
                         st.button(
                                 snippet,
-                                on_click=(
-                                        self.load_and_display_chat),
+                                on_click=self.open_chat,
                                 args=(file,),
                                 use_container_width=True,
                                 key=key
@@ -0,0 +1,82 @@
+import unittest
+
+from src.backend.adapter_cache import AdapterCache
+
+
+class TestAdapterCache(unittest.TestCase):
+    """
+    Test AdapterCache class.
+
+    Tests:
+        loading once
+        eviction
+        re-registration
+
+    Attributes:
+        loaded (list): Paths passed to load.
+        unloaded (list): Adapters passed to unload.
+        cache (AdapterCache): Adapter cache.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.loaded = []
+        self.unloaded = []
+        self.cache = AdapterCache(
+                self.load, self.unloaded.append, max_loaded=2
+        )
+        for name in ("a", "b", "c"):
+            self.cache.register(name, f"/adapters/{name}.gguf", 0.5)
+
+    def load(self, path, scale):
+        """
+        Record a loaded adapter.
+        """
+
+        self.loaded.append(path)
+        return (path, scale)
+
+    def test_adapter_is_loaded_once(self):
+        """
+        Test an adapter is loaded on first use only.
+        """
+
+        self.assertEqual(self.cache.get("a"), ("/adapters/a.gguf", 0.5))
+        self.cache.get("a")
+
+        self.assertEqual(self.loaded, ["/adapters/a.gguf"])
+        self.assertEqual(self.cache.get("/other.gguf"), ("/other.gguf", 1.0))
+
+    def test_active_adapter_is_not_evicted(self):
+        """
+        Test the least recently used adapter that is not active is unloaded.
+        """
+
+        self.cache.get("a")
+        self.cache.active = "a"
+        self.cache.get("b")
+        self.cache.get("c")
+
+        self.assertEqual(self.unloaded, [("/adapters/b.gguf", 0.5)])
+        self.cache.get("a")
+        self.assertEqual(len(self.loaded), 3)
+
+    def test_reregistered_adapter_is_reloaded(self):
+        """
+        Test registering a new path for a name unloads the old adapter.
+        """
+
+        self.cache.get("a")
+        self.cache.active = "a"
+        self.cache.register("a", "/adapters/a2.gguf")
+
+        self.assertIs(self.cache.active, AdapterCache.UNKNOWN)
+        self.assertEqual(self.cache.get("a"), ("/adapters/a2.gguf", 1.0))
+        self.assertEqual(self.cache.names(), ["a", "b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import importlib.util
+import unittest
+
+from src.backend.chat_template import ChatTemplate, compile_template
+
+JINJA2 = importlib.util.find_spec("jinja2") is not None
+
+
+@unittest.skipUnless(JINJA2, "jinja2 is not installed")
+class TestChatTemplate(unittest.TestCase):
+    """
+    Test rendering messages with a chat template.
+
+    Tests:
+        rendering messages and special tokens
+        templates rejecting messages
+        compiled template cache
+
+    Attributes:
+        chat_template (ChatTemplate): A ChatML-style template.
+    """
+
+    TEMPLATE = (
+            "{{ bos_token }}"
+            "{% for message in messages %}"
+            "{% if message['role'] == 'tool' %}"
+            "{{ raise_exception('Unsupported role') }}"
+            "{% endif %}"
+            "<|{{ message['role'] }}|>{{ message['content'] }}{{ eos_token }}"
+            "{% endfor %}"
+            "{% if add_generation_prompt %}<|assistant|>{% endif %}"
+    )
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.chat_template = ChatTemplate(self.TEMPLATE, "<s>", "</s>")
+
+    def test_render(self):
+        messages = [
+                {"role": "system", "content": "Be brief."},
+                {"role": "user", "content": "Hello"}
+        ]
+
+        self.assertEqual(
+                self.chat_template.render(messages),
+                "<s><|system|>Be brief.</s><|user|>Hello</s><|assistant|>"
+        )
+        self.assertEqual(
+                self.chat_template.render(
+                        messages[1:], add_generation_prompt=False
+                ),
+                "<s><|user|>Hello</s>"
+        )
+
+    def test_rejected_messages(self):
+        from jinja2.exceptions import TemplateError
+
+        with self.assertRaisesRegex(TemplateError, "Unsupported role"):
+            self.chat_template.render([{"role": "tool", "content": "{}"}])
+
+    def test_compiled_once(self):
+        compile_template.cache_clear()
+        self.chat_template.render([])
+        ChatTemplate(self.TEMPLATE).render([])
+
+        self.assertEqual(compile_template.cache_info().misses, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
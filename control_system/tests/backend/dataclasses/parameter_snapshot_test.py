@@ -0,0 +1,76 @@
+import unittest
+
+from src.backend.llamacpp.llamacpp_parameters import (
+    LlamaCPPCompletionParameters
+)
+
+
+class TestParameterSnapshot(unittest.TestCase):
+    """
+    Test ParameterSnapshot class.
+
+    Tests:
+        cached snapshot
+        invalidation on update
+        immutability
+        hashing
+
+    Attributes:
+        group (LlamaCPPCompletionParameters): Parameter group.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.group = LlamaCPPCompletionParameters()
+
+    def test_snapshot_is_cached(self):
+        """
+        Test the snapshot is reused while no parameter changes.
+        """
+
+        self.assertIs(self.group.snapshot(), self.group.snapshot())
+        self.assertEqual(
+                self.group.get_parameters(), dict(self.group.snapshot().kwargs)
+        )
+
+    def test_update_invalidates_snapshot(self):
+        """
+        Test update_parameter produces a new snapshot.
+        """
+
+        before = self.group.snapshot()
+        self.group.update_parameter("temperature", 0.5)
+        after = self.group.snapshot()
+
+        self.assertIsNot(before, after)
+        self.assertNotEqual(before, after)
+        self.assertEqual(after.kwargs["temperature"], 0.5)
+
+    def test_snapshot_is_immutable(self):
+        """
+        Test the snapshot and its kwargs cannot be changed.
+        """
+
+        snapshot = self.group.snapshot()
+
+        with self.assertRaises(AttributeError):
+            snapshot.group_name = "other"
+        with self.assertRaises(TypeError):
+            snapshot.kwargs["temperature"] = 0.5
+
+    def test_equal_values_hash_equal(self):
+        """
+        Test snapshots with equal values share a hash.
+        """
+
+        other = LlamaCPPCompletionParameters()
+
+        self.assertEqual(self.group.snapshot(), other.snapshot())
+        self.assertEqual(hash(self.group.snapshot()), hash(other.snapshot()))
+
+
+if __name__ == "__main__":
+    unittest.main()
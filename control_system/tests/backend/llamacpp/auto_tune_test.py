@@ -0,0 +1,110 @@
+import unittest
+
+from src.backend.llamacpp.auto_tune import AutoTuner
+from src.utils.host_topology import HostTopology
+
+
+class FakeModel:
+    """
+    A model whose evaluation advances a fake clock. Prompts run fastest on
+    every logical CPU and generation on the physical cores.
+    """
+
+    def __init__(self, backend, parameters):
+        self.backend = backend
+        self.parameters = parameters
+
+    def tokenize(self, text):
+        return list(range(len(text.split())))
+
+    def reset(self):
+        pass
+
+    def eval(self, tokens):
+        threads = self.backend.threads
+        if len(tokens) > 1:
+            cost = len(tokens) / threads["n_threads_batch"]
+        else:
+            n_threads = threads["n_threads"]
+            cost = 1 / n_threads + (1 if n_threads > 4 else 0)
+        cost /= 2 if self.parameters["n_gpu_layers"] else 1
+        self.backend.now += cost
+
+
+class FakeBackend:
+    """
+    A backend loading fake models, which fails to offload 99 layers.
+    """
+
+    def __init__(self):
+        self.model = None
+        self.now = 0.0
+        self.threads = {}
+        self.loads = []
+
+    def load_model(self, parameters):
+        self.loads.append(parameters)
+        if parameters["n_gpu_layers"] == 99:
+            raise ValueError("out of memory")
+        self.model = FakeModel(self, parameters)
+
+    def apply_runtime_parameters(self, parameters):
+        self.threads.update(parameters)
+
+
+class TestAutoTuner(unittest.TestCase):
+    """
+    Test AutoTuner class.
+
+    Tests:
+        thread counts from the topology
+        choosing the fastest configuration
+
+    Attributes:
+        backend (FakeBackend): Backend of the tuner.
+        tuner (AutoTuner): Tuner on two nodes of two hyper-threaded cores.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.backend = FakeBackend()
+        topology = HostTopology(
+                hostname="host",
+                cores=((0, 4), (1, 5), (2, 6), (3, 7)),
+                nodes=((0, 1, 4, 5), (2, 3, 6, 7))
+        )
+        self.tuner = AutoTuner(
+                self.backend,
+                {"model_path": "model.gguf", "n_ctx": 512},
+                topology=topology,
+                prompt_tokens=64,
+                decode_tokens=8,
+                batch_sizes=(256, 512),
+                gpu_layers=(0, 20, 99),
+                clock=lambda: self.backend.now
+        )
+
+    def test_thread_counts(self):
+        self.assertEqual(self.tuner.thread_counts(), [2, 4, 8])
+        self.assertEqual(self.tuner.batch_thread_counts(), [4, 8])
+
+    def test_run(self):
+        results = self.tuner.run()
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(
+                results[0].parameters,
+                {"n_threads": 4, "n_threads_batch": 8, "n_batch": 256,
+                 "n_gpu_layers": 20}
+        )
+        self.assertAlmostEqual(results[0].prefill_tokens_per_second, 16)
+        self.assertEqual(len(self.backend.loads), 6)
+        self.assertIsNone(self.backend.model)
+        self.assertIn("n_threads", AutoTuner.report(results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+from src.backend.llamacpp.grammar_cache import GrammarCache, grammar_source
+
+
+class TestGrammarCache(unittest.TestCase):
+    """
+    Test GrammarCache class, with a compiler that records its calls in
+    place of llama_cpp.
+
+    Tests:
+        grammar kinds
+        cache hits
+        LRU eviction
+
+    Attributes:
+        compiled (list): Grammars passed to the compiler.
+        cache (GrammarCache): Grammar cache.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.compiled = []
+        self.cache = GrammarCache(maxsize=2, compiler=self.compile)
+
+    def compile(self, kind, text):
+        """
+        Record a compiled grammar.
+        """
+
+        self.compiled.append((kind, text))
+        return (kind, text)
+
+    def test_grammar_kinds(self):
+        """
+        Test JSON Schemas are told apart from GBNF.
+        """
+
+        self.assertEqual(grammar_source('root ::= "yes"')[0], "gbnf")
+        self.assertEqual(grammar_source({"type": "object"})[0], "json_schema")
+        self.assertEqual(
+                grammar_source('{"type": "object"}'),
+                grammar_source({"type": "object"})
+        )
+
+    def test_grammar_is_compiled_once(self):
+        """
+        Test equal grammars are compiled once, whatever their key order.
+        """
+
+        first = self.cache.get({"type": "object", "required": []})
+        second = self.cache.get('{"required": [], "type": "object"}')
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.compiled), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        """
+        Test the least recently used grammar is evicted first.
+        """
+
+        self.cache.get('a ::= "a"')
+        self.cache.get('b ::= "b"')
+        self.cache.get('a ::= "a"')
+        self.cache.get('c ::= "c"')
+        self.cache.get('a ::= "a"')
+        self.cache.get('b ::= "b"')
+
+        self.assertEqual(
+                [text for _, text in self.compiled],
+                ['a ::= "a"', 'b ::= "b"', 'c ::= "c"', 'b ::= "b"']
+        )
+        self.assertEqual(len(self.cache), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
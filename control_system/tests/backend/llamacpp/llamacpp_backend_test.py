@@ -0,0 +1,192 @@
+import importlib.util
+import unittest
+from types import MappingProxyType
+from unittest import mock
+
+from src.backend.dataclasses.parameter_snapshot import ParameterSnapshot
+
+LLAMA_CPP = importlib.util.find_spec("llama_cpp") is not None
+if LLAMA_CPP:
+    from src.backend.llamacpp.llamacpp_backend import (
+        LlamaCPPBackend,
+        _llama_function,
+        llama_enums
+    )
+
+
+@unittest.skipUnless(LLAMA_CPP, "llama_cpp is not installed")
+class TestPrepareParameters(unittest.TestCase):
+    """
+    Test resolving parameters for llama_cpp.
+
+    Tests:
+        enum table
+        enum names resolved to their values
+        unknown enum names
+        grammars compiled through the grammar cache
+        caller's parameters left unchanged
+
+    Attributes:
+        enum_name (str): A LLAMA_* constant of llama_cpp.
+        enum_value (int): Its value.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        LlamaCPPBackend.prepare_parameters.cache_clear()
+        self.enum_name, self.enum_value = next(iter(llama_enums().items()))
+
+    @staticmethod
+    def snapshot(**parameters):
+        """
+        Return a snapshot of generation parameters.
+        """
+
+        return ParameterSnapshot("generation", "llamacpp", parameters)
+
+    def test_enum_table(self):
+        enums = llama_enums()
+
+        self.assertIsInstance(enums, MappingProxyType)
+        self.assertIs(llama_enums(), enums)
+        self.assertTrue(all(name.startswith("LLAMA_") for name in enums))
+        self.assertTrue(
+                all(isinstance(value, int) for value in enums.values())
+        )
+
+    def test_enum_resolved(self):
+        snapshot = self.snapshot(split_mode=self.enum_name, top_k=40)
+        parameters = LlamaCPPBackend.prepare_parameters(snapshot)
+
+        self.assertEqual(
+                dict(parameters),
+                {"split_mode": self.enum_value, "top_k": 40}
+        )
+        self.assertIsInstance(parameters, MappingProxyType)
+        # Resolved once per snapshot
+        self.assertIs(LlamaCPPBackend.prepare_parameters(snapshot), parameters)
+
+    def test_unknown_enum(self):
+        parameters = LlamaCPPBackend.prepare_parameters(
+                self.snapshot(split_mode="LLAMA_NOT_A_CONSTANT")
+        )
+
+        self.assertEqual(parameters["split_mode"], "LLAMA_NOT_A_CONSTANT")
+
+    def test_grammar_compiled(self):
+        compiled = object()
+        with mock.patch(
+                "src.backend.llamacpp.llamacpp_backend.grammar_cache"
+        ) as grammar_cache:
+            grammar_cache.get.return_value = compiled
+            parameters = LlamaCPPBackend.prepare_parameters(
+                    self.snapshot(grammar='root ::= "yes"')
+            )
+
+        grammar_cache.get.assert_called_once_with('root ::= "yes"')
+        self.assertIs(parameters["grammar"], compiled)
+
+    def test_parameters_not_mutated(self):
+        values = {"split_mode": self.enum_name, "stop": ["\n"]}
+        snapshot = self.snapshot(**values)
+        LlamaCPPBackend.prepare_parameters(snapshot)
+
+        self.assertEqual(snapshot.kwargs["split_mode"], self.enum_name)
+        self.assertEqual(
+                values, {"split_mode": self.enum_name, "stop": ["\n"]}
+        )
+
+        model_parameters = {
+                "model_path": "model.gguf", "chat_format": "", "numa": "auto"
+        }
+        with mock.patch("llama_cpp.Llama") as llama:
+            LlamaCPPBackend().load_model(model_parameters)
+
+        self.assertEqual(
+                model_parameters,
+                {"model_path": "model.gguf", "chat_format": "", "numa": "auto"}
+        )
+        loaded = llama.call_args.kwargs
+        self.assertNotIn("chat_format", loaded)
+        self.assertIsInstance(loaded["numa"], int)
+
+
+@unittest.skipUnless(LLAMA_CPP, "llama_cpp is not installed")
+class TestChatCompletion(unittest.TestCase):
+    """
+    Test chat completions with the model's own chat template.
+
+    Tests:
+        messages and accepted parameters passed to llama_cpp
+        streamed chat completions
+
+    Attributes:
+        backend (LlamaCPPBackend): Backend with a mock model.
+        messages (list): Chat messages.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.backend = LlamaCPPBackend()
+        self.backend.model = mock.Mock()
+        self.messages = [
+                {"role": "system", "content": "Be brief."},
+                {"role": "user", "content": "Hello"}
+        ]
+
+    def test_generate_chat_completion(self):
+        self.backend.model.create_chat_completion.return_value = {
+                "choices": [{"message": {"content": "Hi"}}]
+        }
+
+        response = self.backend.generate_chat_completion(
+                self.messages,
+                {"temperature": 0.5, "echo": True, "suffix": "x"}
+        )
+
+        self.assertEqual(response, "Hi")
+        # Completion-only parameters are left out
+        self.backend.model.create_chat_completion.assert_called_once_with(
+                messages=self.messages, temperature=0.5
+        )
+
+    def test_stream_chat_completion(self):
+        self.backend.model.create_chat_completion.return_value = iter([
+                {"choices": [{"delta": {"role": "assistant"}}]},
+                {"choices": [{"delta": {"content": "Hi"}}]},
+                {"choices": [{"delta": {"content": " there"}}]},
+        ])
+
+        chunks = list(self.backend.stream_chat_completion(
+                self.messages, {"temperature": 0.5}
+        ))
+
+        self.assertEqual(chunks, ["Hi", " there"])
+        self.assertTrue(
+                self.backend.model.create_chat_completion.call_args.kwargs[
+                    "stream"]
+        )
+
+
+@unittest.skipUnless(LLAMA_CPP, "llama_cpp is not installed")
+class TestAdapterApi(unittest.TestCase):
+    """
+    Test finding the LoRA adapter functions of llama_cpp.
+
+    Tests:
+        llama_cpp releases without an adapter API
+    """
+
+    def test_missing_adapter_api(self):
+        with self.assertRaisesRegex(RuntimeError, "no LoRA adapter API"):
+            _llama_function("llama_no_such_function")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.backend.model_eviction import EvictionController, MemoryMonitor
+from src.backend.model_handler import ModelHandler
+
+
+class FakeMonitor:
+    """
+    A memory monitor under pressure until a set number of ejections.
+    """
+
+    def __init__(self, pressured_checks=0):
+        self.pressured_checks = pressured_checks
+
+    def under_pressure(self):
+        self.pressured_checks -= 1
+        return self.pressured_checks >= 0
+
+    @staticmethod
+    def snapshot():
+        return {}
+
+
+class TestMemoryMonitor(unittest.TestCase):
+    """
+    Test reading memory usage.
+
+    Tests:
+        reading /proc fields
+        system memory pressure
+        CUDA memory pressure
+
+    Attributes:
+        monitor (MemoryMonitor): Monitor with 10% thresholds.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.monitor = MemoryMonitor()
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        self.directory.cleanup()
+
+    def test_read_kb_fields(self):
+        path = Path(self.directory.name) / "meminfo"
+        path.write_text(
+                "MemTotal:       16384 kB\n"
+                "MemFree:         1024 kB\n"
+                "MemAvailable:    4096 kB\n"
+        )
+
+        self.assertEqual(
+                MemoryMonitor._read_kb_fields(
+                        str(path), "MemTotal", "MemAvailable"
+                ),
+                {"MemTotal": 16384 * 1024, "MemAvailable": 4096 * 1024}
+        )
+        self.assertEqual(
+                MemoryMonitor._read_kb_fields(
+                        str(path.with_name("missing")), "MemTotal"
+                ),
+                {}
+        )
+
+    def test_system_memory_pressure(self):
+        with mock.patch.object(
+                self.monitor, "system_memory", return_value=(1000, 200)
+        ):
+            self.assertFalse(self.monitor.under_pressure())
+        with mock.patch.object(
+                self.monitor, "system_memory", return_value=(1000, 50)
+        ):
+            self.assertTrue(self.monitor.under_pressure())
+
+    def test_cuda_memory_pressure(self):
+        torch = mock.Mock()
+        torch.cuda.is_available.return_value = True
+        torch.cuda.mem_get_info.return_value = (50, 1000)
+
+        with mock.patch.object(
+                self.monitor, "system_memory", return_value=None
+        ), mock.patch.dict("sys.modules", {"torch": torch}):
+            self.assertEqual(self.monitor.cuda_memory(), (50, 1000))
+            self.assertTrue(self.monitor.under_pressure())
+            self.assertEqual(self.monitor.snapshot()["cuda_free"], 50)
+
+
+class TestEvictionController(unittest.TestCase):
+    """
+    Test ejecting idle models.
+
+    Tests:
+        ejection after the idle time
+        the idle time of a handler
+        models in use
+        ejection under memory pressure, least recently used first
+    """
+
+    @staticmethod
+    def handler(idle_seconds):
+        """
+        Return a model handler with a model idle for the given seconds.
+        """
+
+        model_handler = ModelHandler()
+        model_handler.model = object()
+        model_handler.last_used = 1000.0 - idle_seconds
+        return model_handler
+
+    def check(self, controller):
+        """
+        Run one eviction pass at a fixed time.
+        """
+
+        with mock.patch(
+                "src.backend.model_eviction.time.monotonic",
+                return_value=1000.0
+        ):
+            return controller.check()
+
+    def test_idle_time(self):
+        controller = EvictionController(FakeMonitor(), idle_time=60.0)
+        idle, recent = self.handler(120.0), self.handler(10.0)
+        controller.register(idle)
+        controller.register(recent)
+
+        self.assertEqual(self.check(controller), [idle])
+        self.assertIsNone(idle.model)
+        self.assertIsNotNone(recent.model)
+
+    def test_handler_eject_time(self):
+        controller = EvictionController(FakeMonitor(), idle_time=None)
+        model_handler = self.handler(120.0)
+        controller.register(model_handler)
+        self.assertEqual(self.check(controller), [])
+
+        model_handler.use_timer = True
+        model_handler.eject_time = 60.0
+        self.assertEqual(self.check(controller), [model_handler])
+
+    def test_in_use(self):
+        controller = EvictionController(FakeMonitor(1), idle_time=60.0)
+        model_handler = self.handler(120.0)
+        model_handler.active_requests = 1
+        controller.register(model_handler)
+
+        self.assertEqual(self.check(controller), [])
+        self.assertIsNotNone(model_handler.model)
+
+    def test_memory_pressure(self):
+        controller = EvictionController(
+                FakeMonitor(1), idle_time=None, pressure_idle_time=30.0
+        )
+        newer, older, recent = (
+                self.handler(40.0), self.handler(50.0), self.handler(10.0)
+        )
+        for model_handler in (newer, older, recent):
+            controller.register(model_handler)
+
+        # Only one ejection is needed to relieve the pressure
+        self.assertEqual(self.check(controller), [older])
+        self.assertIsNotNone(newer.model)
+        self.assertIsNotNone(recent.model)
+
+
+if __name__ == "__main__":
+    unittest.main()
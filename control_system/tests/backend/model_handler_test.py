@@ -0,0 +1,514 @@
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.backend.chat_template import ChatTemplate
+from src.backend.llamacpp.llamacpp_parameters import LlamaCPPModelParameters
+from src.backend.model_handler import (
+    MODEL_RELOAD,
+    PARAMETERS_APPLIED,
+    PARAMETERS_UNCHANGED,
+    ModelHandler
+)
+from src.backend.numa_placement import NumaPlacer
+from src.backend.tuning_store import TuningStore
+from src.utils.host_topology import HostTopology
+
+
+class FakeBackend:
+    """
+    A backend that records the parameters it is loaded with.
+    """
+
+    def __init__(self):
+        self.model = None
+        self.loads = []
+        self.applied = []
+
+    def load_model(self, model_parameters):
+        self.loads.append(dict(model_parameters))
+        self.model = object()
+
+
+class AdjustableBackend(FakeBackend):
+    """
+    A backend that also records the parameters applied to its model.
+    """
+
+    def apply_runtime_parameters(self, model_parameters):
+        self.applied.append(dict(model_parameters))
+
+
+class TestModelParameterChanges(unittest.TestCase):
+    """
+    Test applying model parameter changes to a loaded model.
+
+    Tests:
+        runtime-adjustable changes applied in place
+        load-time changes ejecting the model
+        backends without runtime parameters
+
+    Attributes:
+        backend (AdjustableBackend): Backend of the handler.
+        model_handler (ModelHandler): Model handler with a loaded model.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.backend = AdjustableBackend()
+        self.model_handler = self.loaded_handler(self.backend)
+
+    @staticmethod
+    def loaded_handler(backend):
+        """
+        Return a model handler with a model loaded by the backend.
+        """
+
+        model_handler = ModelHandler()
+        model_handler.backend = backend
+        model_handler.model_parameters = LlamaCPPModelParameters()
+        model_handler.load_model()
+        return model_handler
+
+    def test_unchanged(self):
+        self.assertEqual(
+                self.model_handler.apply_model_parameters(),
+                (PARAMETERS_UNCHANGED, [])
+        )
+
+    def test_runtime_change_applied_in_place(self):
+        self.model_handler.model_parameters.update_parameter("n_threads", 6)
+
+        decision = self.model_handler.apply_model_parameters()
+
+        self.assertEqual(decision, (PARAMETERS_APPLIED, ["n_threads"]))
+        self.assertEqual(self.backend.applied, [{"n_threads": 6}])
+        self.assertEqual(len(self.backend.loads), 1)
+        self.assertIsNotNone(self.model_handler.model)
+        self.assertEqual(
+                self.model_handler.apply_model_parameters(),
+                (PARAMETERS_UNCHANGED, [])
+        )
+
+    def test_load_time_change_ejects(self):
+        parameters = self.model_handler.model_parameters
+        parameters.update_parameter("n_threads", 6)
+        parameters.update_parameter("n_ctx", 4096)
+
+        decision = self.model_handler.apply_model_parameters()
+
+        self.assertEqual(decision, (MODEL_RELOAD, ["n_ctx"]))
+        self.assertEqual(self.backend.applied, [])
+        self.assertIsNone(self.model_handler.model)
+
+        self.model_handler.load_model()
+        self.assertEqual(self.backend.loads[-1]["n_threads"], 6)
+        self.assertEqual(self.backend.loads[-1]["n_ctx"], 4096)
+
+    def test_backend_without_runtime_parameters(self):
+        model_handler = self.loaded_handler(FakeBackend())
+        model_handler.model_parameters.update_parameter("n_threads", 6)
+
+        self.assertEqual(
+                model_handler.apply_model_parameters(),
+                (MODEL_RELOAD, ["n_threads"])
+        )
+
+
+class TestTunedParameters(unittest.TestCase):
+    """
+    Test applying auto-tuned parameters on load.
+
+    Tests:
+        tuned parameters applied to unset parameters
+        other hosts and replaced models
+
+    Attributes:
+        model_path (Path): A model file.
+        store (TuningStore): Tuning store of this host.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.model_path = Path(self.directory.name) / "model.gguf"
+        self.model_path.write_bytes(b"model")
+        self.store = TuningStore(
+                str(Path(self.directory.name) / "tuning"), host_id="host"
+        )
+        self.store.save(
+                str(self.model_path), {"n_threads": 6, "n_batch": 1024}
+        )
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        self.directory.cleanup()
+
+    def load(self, store, **parameters):
+        """
+        Load a model with the store and return the parameters it got.
+        """
+
+        backend = FakeBackend()
+        model_handler = ModelHandler()
+        model_handler.backend = backend
+        model_handler.model_parameters = LlamaCPPModelParameters()
+        model_handler.tuning_store = store
+        parameters["model_path"] = str(self.model_path)
+        for key, value in parameters.items():
+            model_handler.model_parameters.update_parameter(key, value)
+        model_handler.load_model()
+        return backend.loads[0]
+
+    def test_tuned_parameters_applied(self):
+        loaded = self.load(self.store, n_batch=128)
+
+        self.assertEqual(loaded["n_threads"], 6)
+        self.assertEqual(loaded["n_batch"], 128)
+
+    def test_other_host_or_model(self):
+        other_host = TuningStore(self.store.directory, host_id="other")
+        self.assertEqual(self.load(other_host)["n_threads"], 0)
+
+        self.model_path.write_bytes(b"replaced model")
+        self.assertEqual(self.load(self.store)["n_threads"], 0)
+
+
+class EmbeddingBackend(FakeBackend):
+    """
+    A backend whose embeddings wait until they are released.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def embed(self, texts):
+        self.started.set()
+        self.release.wait(5)
+        return [[0.0] for _ in texts]
+
+
+class SlowEjectBackend(EmbeddingBackend):
+    """
+    A backend whose model is released only once the test allows it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.releasing = threading.Event()
+        self.released = threading.Event()
+
+    def __setattr__(self, name, value):
+        if name == "model" and value is None and hasattr(self, "released"):
+            self.releasing.set()
+            self.released.wait(5)
+        super().__setattr__(name, value)
+
+
+class TestModelInUse(unittest.TestCase):
+    """
+    Test that a model is not ejected while a request uses it.
+
+    Tests:
+        ejecting during a request
+        a request started during an ejection
+        backends without embeddings
+        embedding during a warm-up
+
+    Attributes:
+        backend (EmbeddingBackend): Backend of the handler.
+        model_handler (ModelHandler): Model handler with a model not loaded.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.backend = EmbeddingBackend()
+        self.model_handler = ModelHandler()
+        self.model_handler.backend = self.backend
+        self.model_handler.model_parameters = LlamaCPPModelParameters()
+
+    def test_eject_during_request(self):
+        request = threading.Thread(
+                target=self.model_handler.embed, args=(["text"],)
+        )
+        request.start()
+        self.assertTrue(self.backend.started.wait(5))
+
+        self.assertFalse(self.model_handler.eject_model())
+        self.backend.release.set()
+        request.join(5)
+
+        self.assertEqual(self.model_handler.active_requests, 0)
+        self.assertTrue(self.model_handler.eject_model())
+
+    def test_backend_without_embeddings(self):
+        self.model_handler.backend = FakeBackend()
+
+        with self.assertRaisesRegex(ValueError, "does not support"):
+            self.model_handler.embed(["text"])
+        self.assertEqual(self.model_handler.active_requests, 0)
+
+    def test_embed_waits_for_warmup(self):
+        model_handler = self.model_handler
+        self.backend.release.set()
+        waited = []
+
+        class Warmup:
+            @staticmethod
+            def is_running():
+                return not waited
+
+            @staticmethod
+            def wait():
+                # The warm-up finishes loading the model
+                model_handler.load_model()
+                waited.append(True)
+
+        model_handler.warmup = Warmup()
+
+        self.assertEqual(model_handler.embed(["text"]), [[0.0]])
+        self.assertEqual(waited, [True])
+        self.assertEqual(len(self.backend.loads), 1)
+
+    def test_request_during_eject(self):
+        backend = SlowEjectBackend()
+        backend.release.set()
+        self.model_handler.backend = backend
+        self.model_handler.load_model()
+        results = []
+
+        eject = threading.Thread(target=self.model_handler.eject_model)
+        eject.start()
+        self.assertTrue(backend.releasing.wait(5))
+
+        request = threading.Thread(
+                target=lambda: results.append(
+                        self.model_handler.embed(["text"])
+                )
+        )
+        request.start()
+        request.join(0.2)
+        backend.released.set()
+        eject.join(5)
+        request.join(5)
+
+        self.assertEqual(results, [[[0.0]]])
+        # The request loaded the model again instead of using the ejected one
+        self.assertEqual(len(backend.loads), 2)
+
+
+class TemplateBackend(FakeBackend):
+    """
+    A backend whose model has a chat template.
+    """
+
+    @staticmethod
+    def chat_template():
+        return "{{ messages }}", "<s>", "</s>"
+
+
+class TestChatTemplate(unittest.TestCase):
+    """
+    Test reading the chat template of the model on load.
+
+    Tests:
+        template read on load and kept after an ejection
+        backends without templates
+    """
+
+    @staticmethod
+    def handler(backend):
+        """
+        Return a model handler with a model not loaded.
+        """
+
+        model_handler = ModelHandler()
+        model_handler.backend = backend
+        model_handler.model_parameters = LlamaCPPModelParameters()
+        return model_handler
+
+    def test_template_read_on_load(self):
+        model_handler = self.handler(TemplateBackend())
+        self.assertIsNone(model_handler.chat_template)
+
+        model_handler.load_model()
+        model_handler.eject_model()
+
+        self.assertEqual(
+                model_handler.chat_template,
+                ChatTemplate("{{ messages }}", "<s>", "</s>")
+        )
+
+    def test_backend_without_template(self):
+        model_handler = self.handler(FakeBackend())
+        model_handler.load_model()
+
+        self.assertIsNone(model_handler.chat_template)
+
+
+class PinnedBackend(FakeBackend):
+    """
+    A backend whose threads inherit the CPU affinity of the caller, and
+    which records the CPUs its loads and generations ran on.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.cpus = []
+
+    @staticmethod
+    def threads_inherit_affinity():
+        return True
+
+    def load_model(self, model_parameters):
+        super().load_model(model_parameters)
+        self.cpus.append(os.sched_getaffinity(0))
+
+    def generate(self, prompt):
+        self.cpus.append(os.sched_getaffinity(0))
+        return prompt
+
+    def apply_runtime_parameters(self, model_parameters):
+        self.applied.append(dict(model_parameters))
+        self.cpus.append(os.sched_getaffinity(0))
+
+
+class TestNumaPlacement(unittest.TestCase):
+    """
+    Test placing models on NUMA nodes.
+
+    Tests:
+        models running on different nodes
+        explicit NUMA modes
+        backends sharing their threads across models
+        runtime thread counts limited to the node
+        releasing the node on eject
+
+    Attributes:
+        placer (NumaPlacer): Placer of a host with two nodes of two
+            hyper-threaded cores.
+        affinity (threading.local): CPU affinity of each thread, set by the
+            patched os.sched_setaffinity.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.placer = NumaPlacer(HostTopology(
+                hostname="host",
+                cores=((0, 4), (1, 5), (2, 6), (3, 7)),
+                nodes=((0, 1, 4, 5), (2, 3, 6, 7))
+        ))
+
+        self.affinity = threading.local()
+        all_cpus = set(range(8))
+
+        def sched_setaffinity(pid, cpus):
+            self.affinity.cpus = set(cpus)
+
+        def sched_getaffinity(pid):
+            return getattr(self.affinity, "cpus", all_cpus)
+
+        for name, function in (("sched_setaffinity", sched_setaffinity),
+                               ("sched_getaffinity", sched_getaffinity)):
+            patcher = mock.patch(f"os.{name}", function, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def handler(self, backend=None, **parameters):
+        """
+        Return a model handler using the placer, with a model not loaded.
+        """
+
+        model_handler = ModelHandler()
+        model_handler.backend = backend or PinnedBackend()
+        model_handler.model_parameters = LlamaCPPModelParameters()
+        model_handler.numa_placer = self.placer
+        for key, value in parameters.items():
+            model_handler.model_parameters.update_parameter(key, value)
+        return model_handler
+
+    def test_models_run_on_different_nodes(self):
+        first, second = self.handler(), self.handler(n_threads=8)
+        for model_handler in (first, second):
+            model_handler.load_model()
+            model_handler._call_locked(model_handler.backend.generate, "hi")
+
+        self.assertEqual(first.backend.cpus, [{0, 1, 4, 5}] * 2)
+        self.assertEqual(second.backend.cpus, [{2, 3, 6, 7}] * 2)
+        # The affinity of the calling thread is restored
+        self.assertEqual(os.sched_getaffinity(0), set(range(8)))
+
+        for model_handler in (first, second):
+            loaded = model_handler.backend.loads[0]
+            # ggml NUMA would move the threads to the first model's node
+            self.assertEqual(loaded["numa"], "disabled")
+            self.assertEqual(loaded["n_threads"], 2)
+            self.assertEqual(loaded["n_threads_batch"], 4)
+
+    def test_explicit_mode(self):
+        model_handler = self.handler(numa="distribute")
+        model_handler.load_model()
+
+        self.assertIsNone(model_handler.placement)
+        loaded = model_handler.backend.loads[0]
+        self.assertEqual(loaded["numa"], "distribute")
+        self.assertEqual(loaded["n_threads"], 0)
+
+    def test_shared_threads_not_placed(self):
+        model_handler = self.handler(FakeBackend())
+        model_handler.load_model()
+
+        self.assertIsNone(model_handler.placement)
+        self.assertEqual(model_handler.backend.loads[0]["numa"], "auto")
+
+    def test_runtime_thread_counts(self):
+        model_handler = self.handler()
+        model_handler.load_model()
+        model_handler.model_parameters.update_parameter("n_threads", 8)
+        model_handler.model_parameters.update_parameter(
+                "n_threads_batch", 1
+        )
+
+        self.assertEqual(
+                model_handler.apply_model_parameters(),
+                (PARAMETERS_APPLIED, ["n_threads", "n_threads_batch"])
+        )
+        self.assertEqual(
+                model_handler.backend.applied,
+                [{"n_threads": 2, "n_threads_batch": 1}]
+        )
+        self.assertEqual(model_handler.backend.cpus[-1], {0, 1, 4, 5})
+        self.assertEqual(model_handler.placement.node, 0)
+
+    def test_eject_releases_node(self):
+        first, second = self.handler(), self.handler()
+        first.load_model()
+        first.eject_model()
+        second.load_model()
+
+        self.assertIsNone(first.placement)
+        self.assertEqual(second.placement.node, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
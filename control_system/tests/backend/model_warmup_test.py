@@ -0,0 +1,152 @@
+import threading
+import unittest
+
+from src.backend.model_handler import ModelHandler
+from src.backend.model_warmup import ModelWarmup
+from src.backend.transformers.mamba_parameters import (
+    MambaGenerationParameters,
+    MambaModelParameters
+)
+
+
+class WarmupBackend:
+    """
+    A backend that waits to load until the test allows it, and records its
+    generations.
+    """
+
+    def __init__(self, error=None):
+        self.model = None
+        self.error = error
+        self.loading = threading.Event()
+        self.load = threading.Event()
+        self.generations = []
+
+    def load_model(self, model_parameters):
+        self.loading.set()
+        self.load.wait(5)
+        if self.error is not None:
+            raise self.error
+        self.model = object()
+
+    def generate(self, messages, generation_parameters):
+        self.generations.append((messages, dict(generation_parameters)))
+        return "Hi"
+
+
+class TestModelWarmup(unittest.TestCase):
+    """
+    Test loading and warming up a model in the background.
+
+    Tests:
+        state transitions
+        warm-up generation parameters
+        failed loads
+        waiting with a timeout
+        preloading once per handler
+
+    Attributes:
+        backend (WarmupBackend): Backend of the handler.
+        model_handler (ModelHandler): Model handler with a model not loaded.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.backend = WarmupBackend()
+        self.model_handler = self.handler(self.backend)
+
+    @staticmethod
+    def handler(backend):
+        """
+        Return a model handler of the backend, with a model not loaded.
+        """
+
+        model_handler = ModelHandler()
+        model_handler.backend = backend
+        model_handler.model_parameters = MambaModelParameters()
+        model_handler.generation_parameters = MambaGenerationParameters()
+        model_handler.generation_method = "generate"
+        return model_handler
+
+    def test_state_transitions(self):
+        warmup = ModelWarmup(self.model_handler, "Hello")
+        self.assertEqual(warmup.state, ModelWarmup.IDLE)
+        self.assertFalse(warmup.is_running())
+
+        warmup.start()
+        self.assertTrue(self.backend.loading.wait(5))
+        self.assertEqual(warmup.state, ModelWarmup.LOADING)
+        self.assertTrue(warmup.is_running())
+        self.assertFalse(warmup.status()["ready"])
+
+        self.backend.load.set()
+        self.assertTrue(warmup.wait(5))
+
+        status = warmup.status()
+        self.assertEqual(status["state"], ModelWarmup.READY)
+        self.assertTrue(status["ready"])
+        self.assertIsNotNone(status["load_seconds"])
+        self.assertIsNotNone(status["warmup_seconds"])
+        self.assertFalse(warmup.is_running())
+        self.assertIsNotNone(self.model_handler.model)
+
+    def test_warmup_generation(self):
+        self.backend.load.set()
+        warmup = ModelWarmup(self.model_handler, "Hello")
+        warmup.start()
+        warmup.wait(5)
+
+        (messages, parameters), = self.backend.generations
+        # The generate method takes chat messages
+        self.assertEqual(messages, [{"role": "user", "content": "Hello"}])
+        self.assertEqual(
+                parameters["max_length"],
+                ModelWarmup.WARMUP_LIMITS["max_length"]
+        )
+        # The generation parameters of the handler are left unchanged
+        self.assertNotEqual(
+                self.model_handler.generation_parameters.get_parameters()[
+                    "max_length"],
+                ModelWarmup.WARMUP_LIMITS["max_length"]
+        )
+
+    def test_failed_load(self):
+        backend = WarmupBackend(OSError("no model file"))
+        backend.load.set()
+        warmup = ModelWarmup(self.handler(backend))
+        warmup.start()
+
+        self.assertTrue(warmup.wait(5))
+        self.assertEqual(warmup.state, ModelWarmup.FAILED)
+        self.assertEqual(warmup.error, "no model file")
+        self.assertEqual(backend.generations, [])
+        self.assertFalse(warmup.is_running())
+
+    def test_wait_timeout(self):
+        warmup = ModelWarmup(self.model_handler)
+        warmup.start()
+
+        self.assertFalse(warmup.wait(0.01))
+        self.assertTrue(warmup.is_running())
+
+        self.backend.load.set()
+        self.assertTrue(warmup.wait(5))
+
+    def test_preload_once(self):
+        self.backend.load.set()
+        warmup = self.model_handler.preload()
+        warmup.wait(5)
+
+        self.assertIs(self.model_handler.preload(), warmup)
+        self.assertEqual(len(self.backend.generations), 1)
+        self.assertEqual(
+                self.model_handler.warmup_status(),
+                {"state": ModelWarmup.READY, "ready": True}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
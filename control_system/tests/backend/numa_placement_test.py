@@ -0,0 +1,56 @@
+import os
+import unittest
+
+from src.backend.numa_placement import NumaPlacement, NumaPlacer
+from src.utils.host_topology import HostTopology
+
+
+TWO_NODES = HostTopology(
+        hostname="host",
+        cores=((0, 4), (1, 5), (2, 6), (3, 7)),
+        nodes=((0, 1, 4, 5), (2, 3, 6, 7))
+)
+
+
+class TestNumaPlacer(unittest.TestCase):
+    """
+    Test NumaPlacer class.
+
+    Tests:
+        spreading models over nodes
+        releasing nodes
+        single node hosts
+        pinning threads
+    """
+
+    def test_assign(self):
+        placer = NumaPlacer(TWO_NODES)
+        first, second, third = object(), object(), object()
+
+        self.assertEqual(
+                placer.assign(first), NumaPlacement(0, (0, 1, 4, 5), 2)
+        )
+        self.assertEqual(placer.assign(second).node, 1)
+        self.assertEqual(placer.assign(first).node, 0)
+        self.assertEqual(placer.assign(third).node, 0)
+
+        placer.release(second)
+        self.assertIsNone(placer.placement(second))
+        self.assertEqual(placer.assign(second).node, 1)
+
+    def test_single_node(self):
+        placer = NumaPlacer(HostTopology("host", ((0,), (1,)), ((0, 1),)))
+        self.assertIsNone(placer.assign(object()))
+
+    @unittest.skipUnless(hasattr(os, "sched_setaffinity"), "Linux only")
+    def test_pinned(self):
+        affinity = os.sched_getaffinity(0)
+        cpu = min(affinity)
+
+        with NumaPlacement(0, (cpu,), 1).pinned():
+            self.assertEqual(os.sched_getaffinity(0), {cpu})
+        self.assertEqual(os.sched_getaffinity(0), affinity)
+
+
+if __name__ == "__main__":
+    unittest.main()
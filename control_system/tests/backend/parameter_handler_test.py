@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from src.backend.llamacpp.llamacpp_parameters import (
+    LlamaCPPCompletionParameters
+)
+from src.backend.parameter_handler import ParameterHandler
+
+
+class TestParameterHandler(unittest.TestCase):
+    """
+    Test ParameterHandler class.
+
+    Tests:
+        overrides only
+        coalesced saves
+        pending saves are loaded
+        unknown parameters
+        async save
+
+    Attributes:
+        directory (TemporaryDirectory): Save directory.
+        handler (ParameterHandler): Parameter handler.
+        group (LlamaCPPCompletionParameters): Parameter group.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.handler = ParameterHandler(self.directory.name, save_delay=60)
+        self.group = LlamaCPPCompletionParameters()
+        self.handler.load_parameter_group(self.group)
+        self.path = os.path.join(
+                self.directory.name, self.handler.format_filename(self.group)
+        )
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        ParameterHandler.flush()
+        self.directory.cleanup()
+
+    def test_saves_overrides_only(self):
+        """
+        Test only values that differ from the defaults are saved.
+        """
+
+        self.handler.update_parameter(self.group, "temperature", 0.5)
+        ParameterHandler.flush()
+
+        with open(self.path) as f:
+            state = json.load(f)
+
+        self.assertEqual(state["schema_version"], ParameterHandler.SCHEMA_VERSION)
+        self.assertEqual(state["values"], {"temperature": 0.5})
+
+    def test_updates_are_coalesced(self):
+        """
+        Test a burst of updates is not written until the delay passes.
+        """
+
+        for temperature in (0.1, 0.2, 0.3):
+            self.handler.update_parameter(self.group, "temperature", temperature)
+
+        self.assertFalse(os.path.exists(self.path))
+        ParameterHandler.flush()
+
+        group = LlamaCPPCompletionParameters()
+        ParameterHandler(self.directory.name).load_parameter_group(group)
+        self.assertEqual(group.temperature.value, 0.3)
+
+    def test_pending_save_is_loaded(self):
+        """
+        Test a new handler loads a save that has not been written yet.
+        """
+
+        self.handler.update_parameter(self.group, "temperature", 0.7)
+
+        group = LlamaCPPCompletionParameters()
+        ParameterHandler(self.directory.name).load_parameter_group(group)
+        self.assertEqual(group.temperature.value, 0.7)
+
+    def test_unknown_parameters_are_skipped(self):
+        """
+        Test saved values of removed parameters are ignored.
+        """
+
+        with open(self.path, "w") as f:
+            json.dump({
+                    "schema_version": ParameterHandler.SCHEMA_VERSION,
+                    "values"        : {"removed": 1, "top_k": 20},
+            }, f)
+
+        group = LlamaCPPCompletionParameters()
+        self.handler.load_parameter_group(group)
+        self.assertEqual(group.top_k.value, 20)
+
+    def test_async_save_replaces_pending_save(self):
+        """
+        Test asave_parameter_group writes the group and drops its pending
+        debounced save.
+        """
+
+        self.group.temperature.update_value(0.4)
+        self.handler.save_parameter_group(self.group)
+        asyncio.run(self.handler.asave_parameter_group(self.group))
+
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)["values"], {"temperature": 0.4})
+        self.assertNotIn(self.path, ParameterHandler._pending)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from src.backend.model_handler import ModelHandler
+from src.backend.transformers.mamba_parameters import (
+    MambaGenerationParameters,
+    MambaModelParameters
+)
+from src.batch_runner import BatchRunner
+
+
+class UpperBackend:
+    """
+    Backend that upper-cases the last message, in batches.
+    """
+
+    def __init__(self):
+        self.model = None
+        self.batches = []
+
+    def load_model(self, model_parameters):
+        self.model = object()
+
+    def generate(self, messages, generation_parameters):
+        if messages[-1]["content"] == "fail":
+            raise ValueError("failed")
+        return messages[-1]["content"].upper()
+
+    def generate_batch(self, conversations, generation_parameters):
+        self.batches.append(len(conversations))
+        return [
+                self.generate(messages, generation_parameters)
+                for messages in conversations
+        ]
+
+
+class TestBatchRunner(unittest.TestCase):
+    """
+    Test BatchRunner class.
+
+    Tests:
+        ordered output
+        failed lines
+        invalid messages
+        history of prompt strings
+        resume
+        existing output without a checkpoint
+
+    Attributes:
+        directory (TemporaryDirectory): Input and output directory.
+        backend (UpperBackend): Backend of the model.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.directory.name, "input.jsonl")
+        self.output_path = os.path.join(self.directory.name, "output.jsonl")
+
+        self.backend = UpperBackend()
+        self.model_handler = ModelHandler()
+        self.model_handler.backend = self.backend
+        self.model_handler.model_parameters = MambaModelParameters()
+        self.model_handler.generation_parameters = MambaGenerationParameters()
+        self.model_handler.generation_method = "generate"
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        self.directory.cleanup()
+
+    def write_input(self, prompts):
+        """
+        Write prompts to the input file.
+        """
+
+        with open(self.input_path, "w") as f:
+            for i, prompt in enumerate(prompts):
+                f.write(json.dumps({"id": i, "prompt": prompt}) + "\n")
+
+    def read_output(self):
+        """
+        Read the records of the output file.
+        """
+
+        with open(self.output_path) as f:
+            return [json.loads(line) for line in f]
+
+    def run_batch(self, overwrite=False, **kwargs):
+        """
+        Run the batch runner.
+        """
+
+        runner = BatchRunner(
+                self.model_handler, self.input_path, self.output_path,
+                concurrency=2, batch_size=3, overwrite=overwrite
+        )
+        return asyncio.run(runner.run(**kwargs))
+
+    def test_output_is_ordered(self):
+        """
+        Test responses are written in input order, in batches.
+        """
+
+        prompts = [f"prompt {i}" for i in range(10)]
+        self.write_input(prompts)
+        summary = self.run_batch()
+
+        records = self.read_output()
+        self.assertEqual(
+                [record["response"] for record in records],
+                [prompt.upper() for prompt in prompts]
+        )
+        self.assertEqual(summary.completed, 10)
+        self.assertEqual(max(self.backend.batches), 3)
+        self.assertFalse(os.path.exists(f"{self.output_path}.checkpoint"))
+
+    def test_failed_lines_are_recorded(self):
+        """
+        Test a failed prompt does not fail the other prompts of its batch.
+        """
+
+        self.write_input(["a", "fail", "b"])
+        with open(self.input_path, "a") as f:
+            f.write("not json\n")
+        summary = self.run_batch()
+
+        records = self.read_output()
+        self.assertEqual(records[0]["response"], "A")
+        self.assertIn("error", records[1])
+        self.assertEqual(records[2]["response"], "B")
+        self.assertIn("error", records[3])
+        self.assertEqual(summary.failed, 2)
+
+    def test_invalid_messages(self):
+        """
+        Test lines with empty or malformed messages are recorded as invalid.
+        """
+
+        with open(self.input_path, "w") as f:
+            for messages in ([], [{"role": "user"}], ["hello"]):
+                f.write(json.dumps({"messages": messages}) + "\n")
+            f.write(json.dumps({
+                    "messages": [{"role": "user", "content": "a"}]
+            }) + "\n")
+        summary = self.run_batch()
+
+        records = self.read_output()
+        for record in records[:3]:
+            self.assertTrue(record["error"].startswith("Invalid input line"))
+        self.assertEqual(records[3]["response"], "A")
+        self.assertEqual(summary.failed, 3)
+
+    def test_prompt_string_history(self):
+        """
+        Test the whole history that fits the model context is kept for
+        generation methods that take a prompt string.
+        """
+
+        self.model_handler.generation_method = "generate_completion"
+        runner = BatchRunner(
+                self.model_handler, self.input_path, self.output_path
+        )
+        messages = [
+                {"role": "user", "content": f"message {i}"} for i in range(8)
+        ]
+
+        prompt = runner._prepare_prompt({"messages": messages})
+
+        self.assertIn("message 0", prompt)
+        self.assertTrue(prompt.endswith("user: message 7\nassistant: "))
+
+    def test_resume_from_checkpoint(self):
+        """
+        Test a run resumes after the checkpointed line and drops output
+        written after the checkpoint.
+        """
+
+        self.write_input([f"prompt {i}" for i in range(8)])
+        first = json.dumps({"id": 0, "line": 0, "response": "PROMPT 0"})
+        with open(self.output_path, "w") as f:
+            f.write(first + "\n" + "partial")
+        with open(f"{self.output_path}.checkpoint", "w") as f:
+            json.dump({
+                    "input_path"  : os.path.abspath(self.input_path),
+                    "next_line"   : 1,
+                    "output_bytes": len(first) + 1,
+            }, f)
+
+        summary = self.run_batch()
+
+        records = self.read_output()
+        self.assertEqual([record["line"] for record in records], list(range(8)))
+        self.assertEqual(summary.resumed_from, 1)
+        self.assertEqual(summary.completed, 7)
+
+    def test_existing_output_is_kept(self):
+        """
+        Test an output without a checkpoint, such as the output of a
+        finished run, is only started over when asked to.
+        """
+
+        self.write_input(["a", "b"])
+        self.run_batch()
+
+        self.write_input(["c"])
+        with self.assertRaises(FileExistsError):
+            self.run_batch()
+        self.assertEqual(
+                [record["response"] for record in self.read_output()],
+                ["A", "B"]
+        )
+
+        self.run_batch(overwrite=True)
+        self.assertEqual(
+                [record["response"] for record in self.read_output()], ["C"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import time
+import unittest
+
+from src.chat_handler import ChatHandler
+
+
+class TestChatArchive(unittest.TestCase):
+    """
+    Test ChatArchive through ChatHandler.
+
+    Tests:
+        archiving old chats
+        loading archived chats
+        touched chats
+        deleted chats
+
+    Attributes:
+        directory (TemporaryDirectory): Chat directory.
+        chat_handler (ChatHandler): Chat handler.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.chat_handler = ChatHandler(self.directory.name)
+
+        self.old_messages = [
+                {"role": "user", "content": f"old message {i}"}
+                for i in range(50)
+        ]
+        for chat_id in ("old", "older"):
+            self.chat_handler.save_chat(chat_id, self.old_messages)
+            path = os.path.join(self.directory.name, f"{chat_id}.json")
+            month_ago = time.time() - 31 * 24 * 60 * 60
+            os.utime(path, (month_ago, month_ago))
+        self.chat_handler.save_chat("new", [
+                {"role": "user", "content": "new message"}
+        ])
+
+        self.archived = self.chat_handler.archive_chats(30)
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        self.chat_handler.search_index.close()
+        self.chat_handler.archive.close()
+        self.directory.cleanup()
+
+    def test_old_chats_are_archived(self):
+        """
+        Test only old chats leave the directory and all chats are listed.
+        """
+
+        self.assertEqual(self.archived, 2)
+        self.assertFalse(
+                os.path.exists(os.path.join(self.directory.name, "old.json"))
+        )
+        self.assertEqual(
+                sorted(self.chat_handler.list_chats()), ["new", "old", "older"]
+        )
+
+    def test_archived_chat_loads(self):
+        """
+        Test an archived chat loads from its segment.
+        """
+
+        self.assertEqual(self.chat_handler.load_chat("older"), self.old_messages)
+        self.assertEqual(self.chat_handler.load_chat("missing"), [])
+
+    def test_appended_chat_leaves_archive(self):
+        """
+        Test appending to an archived chat restores it as a file.
+        """
+
+        message = {"role": "assistant", "content": "reply"}
+        self.chat_handler.append_and_save_message("old", message)
+
+        self.assertEqual(
+                self.chat_handler.load_chat("old"),
+                self.old_messages + [message]
+        )
+        self.assertTrue(
+                os.path.exists(os.path.join(self.directory.name, "old.json"))
+        )
+        self.assertNotIn("old", self.chat_handler.archive.chat_ids())
+
+    def test_deleted_chat_leaves_archive(self):
+        """
+        Test deleting an archived chat removes it.
+        """
+
+        self.chat_handler.delete_chat("old")
+
+        self.assertEqual(self.chat_handler.load_chat("old"), [])
+        self.assertNotIn("old", self.chat_handler.list_chats())
+
+
+if __name__ == "__main__":
+    unittest.main()
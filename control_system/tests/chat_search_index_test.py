@@ -0,0 +1,123 @@
+import tempfile
+import unittest
+
+from src.chat_handler import ChatHandler
+
+
+class TestChatSearchIndex(unittest.TestCase):
+    """
+    Test ChatSearchIndex through ChatHandler.
+
+    Tests:
+        ranked search
+        appended messages
+        deleted chats
+        rebuild
+        query syntax
+        retrieval
+
+    Attributes:
+        directory (TemporaryDirectory): Chat directory.
+        chat_handler (ChatHandler): Chat handler.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.chat_handler = ChatHandler(self.directory.name)
+
+        self.chat_handler.save_chat("pasta", [
+                {"role": "user", "content": "How do I cook pasta?"},
+                {"role": "assistant", "content": "Boil pasta in salted water."},
+        ])
+        self.chat_handler.save_chat("rust", [
+                {"role": "user", "content": "Explain rust lifetimes"},
+                {"role": "assistant", "content": "Lifetimes bound references."},
+        ])
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        self.chat_handler.search_index.close()
+        self.directory.cleanup()
+
+    def test_search_ranks_matching_chats(self):
+        """
+        Test only matching chats are returned, with a snippet.
+        """
+
+        results = self.chat_handler.search("pasta")
+
+        self.assertEqual([result.chat_id for result in results], ["pasta"])
+        self.assertIn("**pasta**", results[0].snippet.lower())
+
+    def test_appended_message_is_indexed(self):
+        """
+        Test append_and_save_message indexes the new message.
+        """
+
+        self.chat_handler.append_and_save_message(
+                "rust", {"role": "user", "content": "and the borrow checker?"}
+        )
+
+        results = self.chat_handler.search("borrow")
+        self.assertEqual([result.chat_id for result in results], ["rust"])
+
+    def test_deleted_chat_is_removed(self):
+        """
+        Test delete_chat removes the chat from the index.
+        """
+
+        self.chat_handler.delete_chat("pasta")
+
+        self.assertEqual(self.chat_handler.search("pasta"), [])
+
+    def test_existing_chats_are_indexed(self):
+        """
+        Test a new index is built from the saved chats.
+        """
+
+        chat_handler = ChatHandler(
+                self.directory.name,
+                index_path=f"{self.directory.name}/other.sqlite3"
+        )
+
+        results = chat_handler.search("lifetimes")
+        self.assertEqual([result.chat_id for result in results], ["rust"])
+        chat_handler.search_index.close()
+
+    def test_prefix_and_syntax(self):
+        """
+        Test the last term matches as a prefix and FTS syntax is literal.
+        """
+
+        self.assertEqual(len(self.chat_handler.search("lifeti")), 1)
+        self.assertEqual(self.chat_handler.search('rust" OR "pasta'), [])
+
+    def test_retrieve_matches_any_term(self):
+        """
+        Test retrieve returns messages matching any term, outside the
+        excluded chat.
+        """
+
+        retrieved = self.chat_handler.retrieve("pasta lifetimes", k=4)
+        self.assertEqual(len(retrieved), 4)
+        self.assertIn("user: Explain rust lifetimes", retrieved)
+
+        retrieved = self.chat_handler.retrieve(
+                "pasta lifetimes", k=4, exclude_chat="pasta"
+        )
+        self.assertEqual(
+                retrieved,
+                ["user: Explain rust lifetimes",
+                 "assistant: Lifetimes bound references."]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import tempfile
+import unittest
+
+from src.chat_handler import ChatHandler
+from src.chat_vector_index import ChatVectorIndex
+
+
+VOCABULARY = ["pasta", "sauce", "boil", "rust", "borrow", "compiler"]
+
+
+def embed(texts):
+    """
+    Embed texts as counts of the vocabulary words.
+    """
+
+    return [
+            [text.lower().count(word) for word in VOCABULARY]
+            for text in texts
+    ]
+
+
+class TestChatVectorIndex(unittest.TestCase):
+    """
+    Test ChatVectorIndex and its use by ChatHandler.
+
+    Tests:
+        semantic search
+        related chats
+        deleted chats
+        persistence
+
+    Attributes:
+        directory (TemporaryDirectory): Chat directory.
+        chat_handler (ChatHandler): Chat handler with an embedder.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.chat_handler = ChatHandler(self.directory.name, embedder=embed)
+
+        self.chat_handler.save_chat("pasta", [
+                {"role": "user", "content": "Boil the pasta"},
+                {"role": "assistant", "content": "Then add the sauce"},
+        ])
+        self.chat_handler.save_chat("more pasta", [
+                {"role": "user", "content": "Pasta sauce recipes"},
+        ])
+        self.chat_handler.save_chat("rust", [
+                {"role": "user", "content": "The borrow compiler in rust"},
+        ])
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        self.chat_handler.search_index.close()
+        self.chat_handler.vector_index.close()
+        self.directory.cleanup()
+
+    def test_semantic_search(self):
+        """
+        Test the most similar message is found first.
+        """
+
+        matches = self.chat_handler.semantic_search("rust compiler", k=2)
+
+        self.assertEqual(matches[0].chat_id, "rust")
+        self.assertEqual(matches[0].position, 0)
+        self.assertGreater(matches[0].score, matches[1].score)
+
+    def test_related_chats(self):
+        """
+        Test related chats exclude the chat itself and are ranked.
+        """
+
+        related = self.chat_handler.find_related_chats("pasta", k=2)
+
+        self.assertEqual(
+                [match.chat_id for match in related], ["more pasta", "rust"]
+        )
+
+    def test_deleted_chat_is_not_found(self):
+        """
+        Test deleted and re-saved chats are not returned twice.
+        """
+
+        self.chat_handler.delete_chat("rust")
+        self.chat_handler.save_chat("pasta", [
+                {"role": "user", "content": "Boil the pasta"},
+        ])
+
+        matches = self.chat_handler.semantic_search("pasta", k=10)
+        self.assertNotIn("rust", [match.chat_id for match in matches])
+        self.assertEqual(
+                sorted(match.chat_id for match in matches),
+                ["more pasta", "pasta"]
+        )
+
+    def test_index_is_persisted(self):
+        """
+        Test a reopened index returns the same matches.
+        """
+
+        self.chat_handler.append_and_save_message(
+                "rust", {"role": "assistant", "content": "borrow borrow"}
+        )
+        self.chat_handler.vector_index.close()
+        self.chat_handler.vector_index = ChatVectorIndex(
+                f"{self.directory.name}/vectors"
+        )
+
+        matches = self.chat_handler.semantic_search("borrow", k=1)
+        self.assertEqual((matches[0].chat_id, matches[0].position), ("rust", 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
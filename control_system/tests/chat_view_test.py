@@ -0,0 +1,123 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.chat_handler import ChatHandler
+
+
+class TestLazyChatView(unittest.TestCase):
+    """
+    Test LazyChatView through ChatHandler.
+
+    Tests:
+        windows
+        appended messages
+        chats without an index
+        stale indexes
+        archived chats
+
+    Attributes:
+        directory (TemporaryDirectory): Chat directory.
+        chat_handler (ChatHandler): Chat handler.
+        messages (list): Messages of the long chat.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.chat_handler = ChatHandler(self.directory.name)
+        self.messages = [
+                {"role": "user", "content": f'message {i}, with "[{i}]"'}
+                for i in range(1000)
+        ]
+        self.chat_handler.save_chat("long", self.messages)
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        self.chat_handler.search_index.close()
+        self.chat_handler.archive.close()
+        self.directory.cleanup()
+
+    def test_windows(self):
+        """
+        Test the view returns the requested messages.
+        """
+
+        with self.chat_handler.chat_view("long") as view:
+            self.assertEqual(len(view), 1000)
+            self.assertEqual(view.tail(3), self.messages[-3:])
+            self.assertEqual(view.window(10, 12), self.messages[10:12])
+            self.assertEqual(view[-1], self.messages[-1])
+
+    def test_appended_message_is_seen(self):
+        """
+        Test a view opened after an append includes the new message.
+        """
+
+        message = {"role": "assistant", "content": "reply"}
+        self.chat_handler.append_and_save_message("long", message)
+
+        with self.chat_handler.chat_view("long") as view:
+            self.assertEqual(len(view), 1001)
+            self.assertEqual(view[-1], message)
+
+    def test_chat_without_index(self):
+        """
+        Test a chat file written without an index is scanned and indexed.
+        """
+
+        path = os.path.join(self.directory.name, "plain.json")
+        with open(path, "w") as f:
+            json.dump(self.messages[:5], f, indent=2)
+
+        with self.chat_handler.chat_view("plain") as view:
+            self.assertEqual(view.window(0), self.messages[:5])
+        self.assertTrue(
+                os.path.exists(os.path.join(self.directory.name, ".plain.idx"))
+        )
+
+    def test_stale_index_of_same_size(self):
+        """
+        Test an index is rebuilt when its chat is rewritten outside the
+        chat handler with different messages of the same size.
+        """
+
+        with self.chat_handler.chat_view("long") as view:
+            self.assertEqual(view[0], self.messages[0])
+
+        path = os.path.join(self.directory.name, "long.json")
+        size = os.path.getsize(path)
+        messages = [{"role": "user", "content": ""}]
+        empty = json.dumps(messages, separators=(",", ":"))
+        messages[0]["content"] = "x" * (size - len(empty))
+        with open(path, "w") as f:
+            json.dump(messages, f, separators=(",", ":"))
+        self.assertEqual(os.path.getsize(path), size)
+
+        with self.chat_handler.chat_view("long") as view:
+            self.assertEqual(len(view), 1)
+            self.assertEqual(view[0], messages[0])
+
+    def test_archived_chat(self):
+        """
+        Test an archived chat can be viewed.
+        """
+
+        os.utime(os.path.join(self.directory.name, "long.json"), (0, 0))
+        self.chat_handler.archive_chats(30)
+
+        with self.chat_handler.chat_view("long") as view:
+            self.assertEqual(view.tail(2), self.messages[-2:])
+        with self.chat_handler.chat_view("missing") as view:
+            self.assertEqual(len(view), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
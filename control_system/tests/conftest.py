@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+
+# The app runs from src and imports its packages (utils, backend) absolutely
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import tempfile
+import unittest
+
+from src.backend.adapter_cache import AdapterCache
+from src.backend.llamacpp.llamacpp_parameters import (
+    LlamaCPPCompletionParameters,
+    LlamaCPPModelParameters
+)
+from src.backend.model_handler import ModelHandler
+from src.chat_handler import ChatHandler
+from src.inference_server import InferenceServer
+
+
+class EchoBackend:
+    """
+    Backend that echoes the last message back, one word per chunk.
+    """
+
+    def __init__(self):
+        self.model = None
+        self.parameters = []
+
+    def load_model(self, model_parameters):
+        self.model = object()
+
+    def generate_chat_completion(self, messages, generation_parameters):
+        self.parameters.append(dict(generation_parameters))
+        return messages[-1]["content"].upper()
+
+    def stream_chat_completion(self, messages, generation_parameters):
+        for word in messages[-1]["content"].upper().split():
+            yield word + " "
+
+
+class TestInferenceServer(unittest.IsolatedAsyncioTestCase):
+    """
+    Test InferenceServer class.
+
+    Tests:
+        chat completion
+        streaming
+        saved chats
+        errors
+
+    Attributes:
+        backend (EchoBackend): Backend of the served model.
+        server (InferenceServer): Server on a free port.
+    """
+
+    async def asyncSetUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.backend = EchoBackend()
+
+        model_handler = ModelHandler()
+        model_handler.backend = self.backend
+        model_handler.model_parameters = LlamaCPPModelParameters()
+        model_handler.generation_parameters = LlamaCPPCompletionParameters()
+        model_handler.generation_method = "generate_chat_completion"
+
+        self.chat_handler = ChatHandler(self.directory.name)
+        self.server = InferenceServer(
+                model_handler, chat_handler=self.chat_handler, port=0
+        )
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        await self.server.shutdown(timeout=1)
+        self.directory.cleanup()
+
+    async def request(self, method, path, body=None):
+        """
+        Send a request and return the status and the response body.
+        """
+
+        reader, writer = await asyncio.open_connection(
+                "127.0.0.1", self.server.port
+        )
+        data = json.dumps(body).encode() if body is not None else b""
+        writer.write(
+                f"{method} {path} HTTP/1.1\r\nConnection: close\r\n"
+                f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), body.decode()
+
+    async def test_chat_completion(self):
+        """
+        Test a chat completion returns the generated message.
+        """
+
+        status, body = await self.request("POST", "/v1/chat/completions", {
+                "messages"   : [{"role": "user", "content": "hello there"}],
+                "temperature": 0.2,
+        })
+        response = json.loads(body)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(response["object"], "chat.completion")
+        self.assertEqual(
+                response["choices"][0]["message"]["content"], "HELLO THERE"
+        )
+        self.assertEqual(self.backend.parameters[-1]["temperature"], 0.2)
+
+    async def test_streaming(self):
+        """
+        Test a streamed chat completion is sent as server-sent events.
+        """
+
+        status, body = await self.request("POST", "/v1/chat/completions", {
+                "messages": [{"role": "user", "content": "hello there"}],
+                "stream"  : True,
+        })
+        events = [line[len("data: "):] for line in body.split("\n\n") if line]
+
+        self.assertEqual(status, 200)
+        self.assertEqual(events[-1], "[DONE]")
+        content = "".join(
+                json.loads(event)["choices"][0]["delta"]["content"]
+                for event in events[:-1]
+        )
+        self.assertEqual(content, "HELLO THERE ")
+
+    async def test_chat_is_saved(self):
+        """
+        Test a request with a chat_id is appended to the saved chat.
+        """
+
+        chat_id = ChatHandler.create_chat_id()
+        await self.request("POST", "/v1/chat/completions", {
+                "messages": [{"role": "user", "content": "hi"}],
+                "chat_id" : chat_id,
+        })
+
+        self.assertEqual(self.chat_handler.load_chat(chat_id), [
+                {"role": "user", "content": "hi"},
+                {"role": "assistant", "content": "HI"},
+        ])
+
+    async def test_errors(self):
+        """
+        Test invalid requests are rejected with OpenAI style errors.
+        """
+
+        status, body = await self.request(
+                "POST", "/v1/chat/completions", {"messages": []}
+        )
+        self.assertEqual(status, 400)
+        self.assertIn("error", json.loads(body))
+
+        status, _ = await self.request("GET", "/v1/unknown")
+        self.assertEqual(status, 404)
+
+    async def test_invalid_chat_id(self):
+        """
+        Test chat IDs that are not UUIDs are rejected before any file is
+        read or written.
+        """
+
+        for chat_id in ("../../outside", "chat", 1):
+            status, _ = await self.request("POST", "/v1/chat/completions", {
+                    "messages": [{"role": "user", "content": "hi"}],
+                    "chat_id" : chat_id,
+            })
+            self.assertEqual(status, 400)
+
+        for chat_id in ("../outside", "a/b", "a\\b", ""):
+            with self.assertRaises(ValueError):
+                self.chat_handler.load_chat(chat_id)
+
+    async def test_adapters(self):
+        """
+        Test only registered adapters are served, so clients cannot load
+        adapter files by path.
+        """
+
+        self.backend.adapters = AdapterCache(lambda path, scale: path)
+        self.backend.adapters.register("tuned", "/adapters/tuned.gguf")
+        messages = [{"role": "user", "content": "hi"}]
+
+        status, _ = await self.request("POST", "/v1/chat/completions", {
+                "messages": messages, "model": "tuned"
+        })
+        self.assertEqual(status, 200)
+        self.assertEqual(self.backend.parameters[-1]["adapter"], "tuned")
+
+        for adapter in ("/adapters/other.gguf", "org/adapter"):
+            status, _ = await self.request("POST", "/v1/chat/completions", {
+                    "messages": messages, "adapter": adapter
+            })
+            self.assertEqual(status, 400)
+        self.assertEqual(len(self.backend.parameters), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
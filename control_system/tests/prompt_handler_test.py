@@ -0,0 +1,273 @@
+import unittest
+
+from src.prompt_handler import PromptHandler
+
+
+class TestPromptHandler(unittest.TestCase):
+    """
+    Test PromptHandler class.
+
+    Tests:
+        token budget
+        token count cache
+        message cache size
+        overflow summary
+        unset sections
+        stable prefix
+        retrieved context
+        retrieval cache
+        retrieval budget
+        chat messages
+        chat template
+
+    Attributes:
+        history (list): Conversation history.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.history = [
+                {"role": "user", "content": f"message {i} " + "x" * 40}
+                for i in range(10)
+        ]
+        self.calls = 0
+
+    def word_counter(self, text):
+        """
+        Count one token per whitespace separated word.
+        """
+
+        self.calls += 1
+        return len(text.split())
+
+    def test_budget_keeps_newest_messages(self):
+        """
+        Test the history is filled newest first within the budget.
+        """
+
+        handler = PromptHandler(
+                system_prompt="system",
+                conversation_history=self.history,
+                token_counter=self.word_counter,
+                n_ctx=20,
+                max_tokens=4
+        )
+        prompt = handler._format_prompt("question")
+
+        self.assertIn("message 9", prompt)
+        self.assertNotIn("message 0", prompt)
+        self.assertIn("system", prompt)
+
+    def test_token_counts_are_cached(self):
+        """
+        Test messages are counted once.
+        """
+
+        handler = PromptHandler(
+                conversation_history=self.history,
+                token_counter=self.word_counter,
+                n_ctx=1000,
+                max_tokens=10
+        )
+        handler._format_prompt("first")
+        calls = self.calls
+        handler._format_prompt("second")
+
+        # Only the prompt, tool prompt and system prompt are counted again
+        self.assertEqual(self.calls - calls, 2)
+
+    def test_message_cache_is_bounded(self):
+        """
+        Test only the most recently used messages stay cached.
+        """
+
+        handler = PromptHandler(
+                conversation_history=self.history,
+                token_counter=self.word_counter,
+                n_ctx=1000,
+                max_tokens=10,
+                message_cache_size=4
+        )
+        handler._format_prompt("first")
+
+        self.assertEqual(len(handler._message_cache), 4)
+        self.assertEqual(len(handler._token_cache), 4)
+        # The history is counted newest first, so the newest were used least
+        # recently
+        self.assertIn(
+                ("user", self.history[0]["content"]), handler._token_cache
+        )
+        self.assertNotIn(
+                ("user", self.history[9]["content"]), handler._token_cache
+        )
+
+    def test_overflow_is_summarized(self):
+        """
+        Test dropped messages are replaced by a summary.
+        """
+
+        handler = PromptHandler(
+                conversation_history=self.history,
+                token_counter=self.word_counter,
+                n_ctx=30,
+                max_tokens=4,
+                overflow_summarizer=lambda messages: f"{len(messages)} earlier"
+        )
+        prompt = handler._format_prompt("question")
+
+        self.assertIn("earlier", prompt)
+        self.assertIn("message 9", prompt)
+
+    def test_unset_sections_are_left_out(self):
+        """
+        Test unset prompts are not rendered as None.
+        """
+
+        handler = PromptHandler(system_prompt="system")
+        prompt = handler.format_prompt("question")
+
+        self.assertNotIn("None", prompt)
+        self.assertEqual(prompt, "system\n\nuser: question\nassistant: ")
+
+    def test_prompts_share_prefix(self):
+        """
+        Test the prompt of a turn is a prefix of the next turn's prompt.
+        """
+
+        history = []
+        handler = PromptHandler(
+                system_prompt="system",
+                tool_prompt="tools",
+                conversation_history=history
+        )
+        first = handler.format_prompt("first")
+        history.extend([
+                {"role": "user", "content": "first"},
+                {"role": "assistant", "content": "answer"}
+        ])
+        second = handler.format_prompt("second")
+
+        self.assertTrue(second.startswith(first))
+        self.assertTrue(second.endswith("user: second\nassistant: "))
+
+    def test_retrieved_context_is_injected(self):
+        """
+        Test retrieved texts come before the new turn, in prompts and chat
+        messages, and texts already in the history are left out.
+        """
+
+        def retriever(query, k):
+            return ["user: old fact", self.history[-1]["content"]][:k]
+
+        handler = PromptHandler(
+                conversation_history=self.history[-1:],
+                retriever=retriever
+        )
+        prompt = handler._format_prompt("question")
+        messages = handler.format_messages("question")
+
+        self.assertTrue(prompt.endswith(
+                "Relevant context:\n- user: old fact\n\n"
+                "user: question\nassistant: "
+        ))
+        self.assertEqual(prompt.count("message 9"), 1)
+        self.assertEqual(
+                messages[-1]["content"],
+                "Relevant context:\n- user: old fact\n\nquestion"
+        )
+
+    def test_retrieval_is_cached(self):
+        """
+        Test the retriever is called once per query.
+        """
+
+        queries = []
+
+        def retriever(query, k):
+            queries.append(query)
+            return [f"user: about {query}"]
+
+        handler = PromptHandler(retriever=retriever)
+        handler._format_prompt("first")
+        handler.format_messages("first")
+        handler._format_prompt("second")
+
+        self.assertEqual(queries, ["first", "second"])
+
+    def test_retrieval_fits_budget(self):
+        """
+        Test retrieved texts are limited to the retrieval budget and reduce
+        the history budget.
+        """
+
+        def retriever(query, k):
+            return [f"fact {i} " + "y" * 10 for i in range(k)]
+
+        handler = PromptHandler(
+                conversation_history=self.history,
+                token_counter=self.word_counter,
+                n_ctx=40,
+                max_tokens=4,
+                retriever=retriever,
+                retrieval_budget=10
+        )
+        prompt = handler._format_prompt("question")
+
+        self.assertIn("fact 1", prompt)
+        self.assertNotIn("fact 2", prompt)
+        self.assertLessEqual(self.word_counter(prompt), 36)
+
+    def test_format_messages(self):
+        """
+        Test the preamble becomes the system message, followed by the
+        budgeted history and the new user turn.
+        """
+
+        handler = PromptHandler(
+                system_prompt="system",
+                conversation_history=self.history,
+                token_counter=self.word_counter,
+                n_ctx=20,
+                max_tokens=4
+        )
+        messages = handler.format_messages("question")
+
+        self.assertEqual(messages[0], {"role": "system", "content": "system"})
+        self.assertEqual(messages[-2], self.history[-1])
+        self.assertEqual(messages[-1], {"role": "user", "content": "question"})
+        self.assertLess(len(messages), len(self.history) + 2)
+
+        self.assertEqual(
+                PromptHandler().format_messages("question"),
+                [{"role": "user", "content": "question"}]
+        )
+
+    def test_chat_template(self):
+        """
+        Test prompts are rendered with the chat template once it is set.
+        """
+
+        rendered = []
+
+        class ChatTemplate:
+            def render(self, messages, add_generation_prompt=True):
+                rendered.append(messages)
+                return "rendered"
+
+        handler = PromptHandler(
+                system_prompt="system", conversation_history=self.history[:1]
+        )
+        self.assertIn("user: question", handler.format_prompt("question"))
+
+        handler.set_chat_template(ChatTemplate())
+        self.assertEqual(handler.format_prompt("question"), "rendered")
+        self.assertEqual(
+                rendered, [handler.format_messages("question")]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from src.chat_handler import ChatHandler
+from src.utils.file_manager import FileManager
+
+
+class TestFileManager(unittest.TestCase):
+    """
+    Test FileManager class.
+
+    Tests:
+        atomic save
+        failed save
+        locked appends
+        lock held across a delete
+
+    Attributes:
+        directory (TemporaryDirectory): Directory of the saved files.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        self.directory.cleanup()
+
+    def test_save_leaves_no_temporary_files(self):
+        """
+        Test a saved file loads back and its temporary file is renamed.
+        """
+
+        data = [{"role": "user", "content": "héllo"}]
+        FileManager.save_json(
+                self.directory.name, "chat.json", data, sync_directory=True
+        )
+
+        self.assertEqual(
+                FileManager.load_json(self.directory.name, "chat.json"), data
+        )
+        self.assertEqual(os.listdir(self.directory.name), ["chat.json"])
+
+    def test_failed_save_keeps_file(self):
+        """
+        Test a save that fails to serialize leaves the old file intact.
+        """
+
+        FileManager.save_json(self.directory.name, "chat.json", [1])
+        with self.assertRaises(TypeError):
+            FileManager.save_json(self.directory.name, "chat.json", [object()])
+
+        self.assertEqual(
+                FileManager.load_json(self.directory.name, "chat.json"), [1]
+        )
+        self.assertEqual(os.listdir(self.directory.name), ["chat.json"])
+
+    def test_concurrent_appends_are_kept(self):
+        """
+        Test appends to a chat from several threads are all saved.
+        """
+
+        chat_handler = ChatHandler(self.directory.name)
+
+        def append(writer):
+            for i in range(10):
+                chat_handler.append_and_save_message(
+                        "chat", {"role": "user", "content": f"{writer} {i}"}
+                )
+
+        threads = [
+                threading.Thread(target=append, args=(writer,))
+                for writer in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(chat_handler.load_chat("chat")), 40)
+        chat_handler.search_index.close()
+
+    def test_lock_survives_delete(self):
+        """
+        Test a file deleted under the lock stays locked for new callers.
+        """
+
+        FileManager.save_json(self.directory.name, "chat.json", [1])
+        events = []
+
+        def wait_for_lock():
+            with FileManager.lock(self.directory.name, "chat.json"):
+                events.append("waiter")
+
+        with FileManager.lock(self.directory.name, "chat.json"):
+            FileManager.delete_file(self.directory.name, "chat.json")
+            waiter = threading.Thread(target=wait_for_lock)
+            waiter.start()
+            waiter.join(0.2)
+            events.append("holder")
+        waiter.join()
+
+        self.assertEqual(events, ["holder", "waiter"])
+        self.assertFalse(
+                FileManager.file_exists(self.directory.name, "chat.json")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.utils.host_topology import parse_cpu_list, read_host_topology
+
+
+class TestHostTopology(unittest.TestCase):
+    """
+    Test reading the host topology from sysfs.
+
+    Tests:
+        CPU lists
+        physical cores and NUMA nodes
+        CPU affinity
+        missing sysfs
+
+    Attributes:
+        sysfs (Path): A sysfs tree of two nodes of two cores with two
+            hyper-threads each.
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.sysfs = Path(self.directory.name)
+
+        siblings = {0: "0,4", 1: "1,5", 2: "2,6", 3: "3,7"}
+        for cpu in range(8):
+            topology = self.sysfs / "cpu" / f"cpu{cpu}" / "topology"
+            topology.mkdir(parents=True)
+            (topology / "thread_siblings_list").write_text(
+                    siblings[cpu % 4] + "\n"
+            )
+        for node, cpus in enumerate(("0-1,4-5", "2-3,6-7")):
+            node_directory = self.sysfs / "node" / f"node{node}"
+            node_directory.mkdir(parents=True)
+            (node_directory / "cpulist").write_text(cpus + "\n")
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        self.directory.cleanup()
+
+    def test_parse_cpu_list(self):
+        self.assertEqual(
+                parse_cpu_list("0-3,8,10-11\n"), [0, 1, 2, 3, 8, 10, 11]
+        )
+        self.assertEqual(parse_cpu_list(""), [])
+
+    def test_cores_and_nodes(self):
+        topology = read_host_topology(str(self.sysfs), allowed=list(range(8)))
+
+        self.assertEqual(topology.physical_cores(), [0, 1, 2, 3])
+        self.assertEqual(topology.physical_cores(1), [2, 3])
+        self.assertEqual(topology.logical_cpus(), list(range(8)))
+        self.assertEqual(topology.logical_cpus(0), [0, 1, 4, 5])
+        self.assertTrue(topology.host_id().endswith("-2n4c8t"))
+
+    def test_affinity(self):
+        topology = read_host_topology(str(self.sysfs), allowed=[0, 1, 4])
+
+        self.assertEqual(topology.cores, ((0, 4), (1,)))
+        self.assertEqual(topology.nodes, ((0, 1, 4),))
+
+    def test_without_sysfs(self):
+        topology = read_host_topology(
+                str(self.sysfs / "missing"), allowed=[0, 1]
+        )
+
+        self.assertEqual(topology.cores, ((0,), (1,)))
+        self.assertEqual(topology.nodes, ((0, 1),))
+
+
+if __name__ == "__main__":
+    unittest.main()
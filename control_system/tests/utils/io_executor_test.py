@@ -0,0 +1,99 @@
+import asyncio
+import tempfile
+import threading
+import unittest
+
+from src.chat_handler import ChatHandler
+from src.utils.io_executor import IOExecutor
+
+
+class TestIOExecutor(unittest.TestCase):
+    """
+    Test IOExecutor and the background chat writes built on it.
+
+    Tests:
+        ordering per key
+        failed jobs
+        write-behind appends
+    """
+
+    def setUp(self):
+        """
+        Set up test environment.
+        """
+
+        self.executor = IOExecutor()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """
+        Clean up test environment.
+        """
+
+        self.executor.shutdown()
+        self.directory.cleanup()
+
+    def test_jobs_of_a_key_run_in_order(self):
+        """
+        Test jobs with the same key run in order and wait() covers them.
+        """
+
+        started = threading.Event()
+        release = threading.Event()
+        order = []
+
+        def blocked():
+            started.set()
+            release.wait()
+            order.append("first")
+
+        self.executor.submit("a", blocked)
+        started.wait()
+        self.executor.submit("a", order.append, "second")
+        self.executor.submit("b", order.append, "other")
+        self.executor.wait("b")
+        self.assertEqual(order, ["other"])
+
+        release.set()
+        self.executor.wait("a")
+        self.assertEqual(order, ["other", "first", "second"])
+
+    def test_failed_job_sets_exception(self):
+        """
+        Test a failed job fails its future without stopping its key.
+        """
+
+        failed = self.executor.submit("a", int, "x")
+        after = self.executor.submit("a", int, "1")
+        self.executor.flush()
+
+        self.assertIsInstance(failed.exception(), ValueError)
+        self.assertEqual(after.result(), 1)
+
+    def test_queued_messages_are_loaded(self):
+        """
+        Test messages appended in the background are seen by later loads
+        and saved together.
+        """
+
+        chat_handler = ChatHandler(self.directory.name)
+
+        async def append_and_load():
+            for i in range(5):
+                await chat_handler.aappend_message(
+                        "chat", {"role": "user", "content": str(i)}
+                )
+            return await chat_handler.aload_chat("chat")
+
+        messages = asyncio.run(append_and_load())
+
+        self.assertEqual(
+                [message["content"] for message in messages],
+                ["0", "1", "2", "3", "4"]
+        )
+        self.assertEqual(len(chat_handler.search("3")), 1)
+        chat_handler.search_index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
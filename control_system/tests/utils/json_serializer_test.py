@@ -0,0 +1,65 @@
+import unittest
+
+from src.utils.json_serializer import SERIALIZERS, get_serializer
+
+
+class TestJSONSerializer(unittest.TestCase):
+    """
+    Test the JSON serializers.
+
+    Tests:
+        round trip
+        fallback
+        selection
+    """
+
+    data = [{"role": "user", "content": "héllo \"world\"\n", "tokens": 3}]
+
+    def test_round_trip(self):
+        """
+        Test every installed serializer reads what any other writes.
+        """
+
+        for writer in SERIALIZERS.values():
+            for reader in SERIALIZERS.values():
+                with self.subTest(writer=writer.name, reader=reader.name):
+                    self.assertEqual(
+                            reader.loads(writer.dumps(self.data)), self.data
+                    )
+
+    def test_fallback_for_rejected_values(self):
+        """
+        Test values a library rejects are serialized by the stdlib.
+        """
+
+        for serializer in SERIALIZERS.values():
+            with self.subTest(serializer=serializer.name):
+                self.assertEqual(
+                        serializer.loads(serializer.dumps([2 ** 70])),
+                        [2 ** 70]
+                )
+
+    def test_invalid_json_raises_value_error(self):
+        """
+        Test every serializer raises ValueError for invalid JSON.
+        """
+
+        for serializer in SERIALIZERS.values():
+            with self.subTest(serializer=serializer.name):
+                with self.assertRaises(ValueError):
+                    serializer.loads(b"[1,")
+
+    def test_selection(self):
+        """
+        Test the default is the fastest installed serializer and unknown
+        names are rejected.
+        """
+
+        self.assertIs(get_serializer(), next(iter(SERIALIZERS.values())))
+        self.assertEqual(get_serializer("json").name, "json")
+        with self.assertRaises(ValueError):
+            get_serializer("pickle")
+
+
+if __name__ == "__main__":
+    unittest.main()